@@ -0,0 +1,70 @@
+import time
+import threading
+
+# 访问热度半衰期 (秒): 半小时前的一次访问只算半次
+ACCESS_HALF_LIFE = 1800
+# 最多跟踪多少首歌 (超出时丢掉最冷的)
+ACCESS_MAX_TRACKED = 2000
+
+class AccessHeat:
+    """按 mid 统计访问热度 (指数衰减的访问次数) 和最近访问时间，线程安全
+
+    另外记下每首歌最近一次被要求刷新的时间，避免同一首歌反复下发
+    """
+
+    def __init__(self, half_life=ACCESS_HALF_LIFE, max_tracked=ACCESS_MAX_TRACKED):
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._heat = {}        # mid -> (热度, 上次更新时间)
+        self._requested = {}   # mid -> 最近一次下发刷新的时间
+        self._lock = threading.Lock()
+        self.accesses = 0
+
+    def _decayed(self, heat, updated, now):
+        return heat * 0.5 ** (max(0.0, now - updated) / self.half_life)
+
+    def record(self, mids, now=None):
+        """记一次访问 (可以一次传多首)"""
+        now = time.time() if now is None else now
+        if isinstance(mids, str):
+            mids = [mids]
+        with self._lock:
+            for mid in mids:
+                heat, updated = self._heat.get(mid, (0.0, now))
+                self._heat[mid] = (self._decayed(heat, updated, now) + 1, now)
+                self.accesses += 1
+            if len(self._heat) > self.max_tracked:
+                coldest = sorted(self._heat, key=lambda m: self._decayed(*self._heat[m], now))
+                for mid in coldest[:len(self._heat) - self.max_tracked]:
+                    del self._heat[mid]
+                    self._requested.pop(mid, None)
+
+    def hot(self, min_heat, now=None):
+        """当前热度不低于 min_heat 的歌: [(mid, 热度, 最近访问时间)]，最热的在前"""
+        now = time.time() if now is None else now
+        with self._lock:
+            items = [(mid, self._decayed(heat, updated, now), updated) for mid, (heat, updated) in self._heat.items()]
+        return sorted((item for item in items if item[1] >= min_heat), key=lambda item: item[1], reverse=True)
+
+    def requested_since(self, mid, since):
+        with self._lock:
+            return self._requested.get(mid, 0) >= since
+
+    def mark_requested(self, mids, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            for mid in mids:
+                self._requested[mid] = now
+
+    def stats(self, top=10, now=None):
+        now = time.time() if now is None else now
+        hottest = self.hot(0, now)[:top]
+        with self._lock:
+            return {
+                "tracked": len(self._heat),
+                "accesses": self.accesses,
+                "hottest": [
+                    {"mid": mid, "heat": round(heat, 3), "last_access": int(updated), "last_requested": int(self._requested[mid]) if mid in self._requested else None}
+                    for mid, heat, updated in hottest
+                ],
+            }
@@ -2,14 +2,35 @@ import os
 import sqlite3
 import datetime
 from pathlib import Path
-from flask import Flask, send_from_directory, jsonify, request
+from flask import Flask, Response, stream_with_context, send_from_directory, send_file, jsonify, request, g
 import urllib.request
 import urllib.parse
 import json
+import hashlib
+import queue
+import zlib
+from contextlib import contextmanager
 
 import re
+import time
 import logging
+import threading
 from scrape_selenium import scrape_music_index
+from chart_store import ChartStore, CHART_HASH_RE
+from cache_utils import TTLCache, BackgroundRefresher
+from access_heat import AccessHeat
+from song_events import SongEventBroker
+from command_queue import CommandQueue, migrate_command_times
+from pi_client import PiClient
+from response_cache import ResponseCache
+from sqlite_pool import SQLitePool, ensure_columns
+from data_versions import init_versions_table, bump_version, read_version, VersionMap
+from http_compression import accepts_gzip, gzip_bytes, GZIP_MIN_SIZE
+from song_delta import content_hash, apply_delta, volatile_part, merge_volatile, PUSH_FULL, PUSH_DELTA, PUSH_HEARTBEAT
+from svg_chart import render_trend_svg
+import telemetry
+from telemetry import Counter, Gauge, Histogram
+from song_metrics import init_history_table, append_history, parse_metrics, query_history, parse_time_arg, local_ts, BUCKETS, HISTORY_DEFAULT_DAYS, HISTORY_MAX_POINTS
 
 # 复用或重新配置日志 (为了确保 app.py 也能打日志)
 logging.basicConfig(
@@ -26,24 +47,195 @@ BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "db" / "room64.db"
 SCHEMA_PATH = BASE_DIR / "db" / "schema.sql"
 TOURS_JSON_PATH = BASE_DIR / "db" / "tours.json"
+CHART_STORE_DIR = BASE_DIR / "db" / "charts"
+HTTP_CACHE_PATH = BASE_DIR / "db" / "http_cache.db"
+
+# 树莓派 (Tailscale IP)
+PI_BASE_URL = "http://100.93.253.71:5000"
+# 所有转发到树莓派的请求共用一个连接池客户端 (keep-alive + 相同请求合并)
+pi_client = PiClient(PI_BASE_URL)
+# Worker 推送数据时携带的口令
+WORKER_AUTH_HEADER = "Bearer rainie-forever-2026" # 您可以随便改这个密码
+
+# 走势图按内容哈希存成文件，JSON 里只保留 /charts/<hash>.png
+chart_store = ChartStore(CHART_STORE_DIR)
+
+# 上游响应缓存 (专辑/搜索/歌词)，有效期见 response_cache.DEFAULT_TTLS
+# 上游不可用时继续返回过期缓存；第一次用到时按 HTTP_CACHE_PATH 创建，见 get_response_cache
+_response_cache = None
+_response_cache_lock = threading.Lock()
+# 直连 QQ 音乐接口的超时 (秒)
+QQ_MUSIC_TIMEOUT = 8
+# QQ 音乐接口地址 (压测时指向本地替身服务，见 benchmarks/fake_qqmusic.py)
+QQ_MUSIC_API_BASE = "https://c.y.qq.com"
+
+# 歌曲指数缓存策略
+# 超过 SONG_STALE_AFTER 秒的数据仍然立即返回 (标记 stale)，同时在后台从树莓派拉取
+SONG_STALE_AFTER = 14400
+# 进程内缓存：热门歌曲不用每次轮询都查 SQLite、反序列化 JSON
+song_cache = TTLCache(maxsize=512, ttl=300)
+# 后台拉取：同一首歌同时只有一个拉取，失败后 60 秒内不重试
+pi_refresher = BackgroundRefresher(max_workers=2, cooldown=60, name="pi-pull")
+
+# 走势图 (SVG，由指标历史现画)：range -> (时间跨度秒, 降采样粒度)
+TREND_RANGES = {"24h": (86400, "raw"), "7d": (7 * 86400, "hour"), "30d": (30 * 86400, "day"), "90d": (90 * 86400, "day")}
+TREND_DEFAULT_RANGE = "30d"
+# 按 (mid, range) 缓存画好的 SVG；新数据入库时失效
+trend_svg_cache = TTLCache(maxsize=1024, ttl=3600)
+
+# JSON 响应的 gzip 压缩 (按 Accept-Encoding 协商)：处理函数可以在 g.compress_key 里给出数据版本，
+# 同一版本压缩一次后缓存，数据变了 key 跟着变，旧的自然淘汰
+compressed_cache = TTLCache(maxsize=256, ttl=3600)
+
+# 条件请求 (ETag / If-None-Match)：数据版本记在内存里，浏览器手上的已经是最新时直接 304，不查 SQLite
+# 歌曲: mid -> (content_hash, updated_at, verified_at)，写入/确认时更新
+song_versions = VersionMap()
+# 整表数据 (tours) 的版本号，见 data_versions.py
+data_versions = VersionMap()
+# tours 只会被 update_db.py (另一个进程) 修改，内存里的版本号最多用这么久 (秒) 就重新查一次库
+TOURS_VERSION_CHECK = 60
+# 按版本缓存整理好的巡演列表
+tours_cache = TTLCache(maxsize=4, ttl=3600)
+# 歌曲数据随时可能被推送更新：可以存，但每次用之前要带 ETag 回源确认
+SONG_CACHE_CONTROL = "public, no-cache"
+# 巡演很少变，浏览器和反向代理可以直接用 5 分钟
+TOURS_CACHE_CONTROL = "public, max-age=300"
+
+# SSE 推送：新数据入库后直接推给订阅了该歌曲的浏览器
+song_events = SongEventBroker(max_subscribers=200)
+# 没有消息时每隔多少秒发一次心跳 (也用于及时发现已断开的连接)
+SSE_HEARTBEAT = 15
 
 app = Flask(__name__, static_folder="static", static_url_path="/static")
 
+# --- 指标 (/metrics, Prometheus 文本格式) ---
+HTTP_REQUEST_SECONDS = Histogram("rainie_http_request_duration_seconds", "请求处理耗时", ["method", "route"])
+HTTP_REQUESTS = Counter("rainie_http_requests_total", "请求数", ["method", "route", "status"])
+HTTP_IN_FLIGHT = Gauge("rainie_http_requests_in_flight", "正在处理的请求数 (看 Flask 线程是否被占满)")
+SONG_CACHE_LOOKUPS = Counter(
+    "rainie_song_cache_lookups_total",
+    "song_stats_cache 查询结果 (fresh 命中 / stale 过期 / missing 没有数据 / not_modified 按内存版本直接 304)", ["result"]
+)
+QQ_MUSIC_SECONDS = Histogram("rainie_server_qqmusic_request_duration_seconds", "主服务器直接请求 QQ 音乐的耗时", ["endpoint"])
+DB_CONNECTION_HOLD_SECONDS = Histogram(
+    "rainie_sqlite_connection_hold_seconds", "从连接池借出到归还的时长 (含等待写锁)",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+# SSE 长连接的耗时没有意义，只看连接数
+UNTIMED_ROUTES = {"/api/song_stream"}
+GZIP_RESPONSES = Counter(
+    "rainie_http_gzip_responses_total", "gzip 压缩的 JSON 响应数 (hit 复用缓存 / miss 压缩后缓存 / uncached 不可缓存)", ["cache"]
+)
+GZIP_SAVED_BYTES = Counter("rainie_http_gzip_saved_bytes_total", "gzip 压缩省下的响应字节数")
+# Worker 最近一次长轮询的时间 (time.time())，None 表示启动后还没来过
+LAST_WORKER_POLL = None
+
+# 连接池 (WAL + busy_timeout)，读请求和 Worker 推送的写入互不阻塞
+db_pool = SQLitePool(DB_PATH)
+
+@contextmanager
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """从连接池借一个连接，配合 with 使用：正常结束自动提交，出错回滚，然后归还"""
+    started = time.perf_counter()
+    try:
+        with db_pool.connection() as con:
+            yield con
+    finally:
+        DB_CONNECTION_HOLD_SECONDS.observe(time.perf_counter() - started)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.after_request
+def compress_json_response(response):
+    """客户端接受 gzip 时压缩 JSON 响应 (太小的不压)"""
+    key = g.pop("compress_key", None)
+    if (response.mimetype != "application/json" or response.direct_passthrough
+            or not 200 <= response.status_code < 300 or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    if not accepts_gzip(request.headers.get("Accept-Encoding")):
+        return response
+    body = response.get_data()
+    if len(body) < GZIP_MIN_SIZE:
+        return response
+    if key is None:
+        compressed = gzip_bytes(body)
+        GZIP_RESPONSES.inc(cache="uncached")
+    else:
+        # 同一个 key 的响应体不一定逐字节相同 (jsonify 每次重新序列化)，但内容相同，直接复用
+        compressed = compressed_cache.get(key)
+        GZIP_RESPONSES.inc(cache="miss" if compressed is None else "hit")
+        if compressed is None:
+            compressed = gzip_bytes(body)
+            compressed_cache.set(key, compressed)
+    GZIP_SAVED_BYTES.inc(len(body) - len(compressed))
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = "gzip"
+    # 强 ETag 要区分编码，压缩版加后缀 (not_modified 两种都认)
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-gzip", weak)
+    return response
+
+@app.after_request
+def apply_cache_headers(response):
+    """处理函数在 g.etag / g.cache_control 里给出的缓存头
+
+    注册在 compress_json_response 之后：Flask 倒序执行 after_request，所以先于压缩
+    """
+    etag = g.pop("etag", None)
+    cache_control = g.pop("cache_control", None)
+    if response.status_code == 200:
+        if etag:
+            response.set_etag(etag)
+        if cache_control:
+            response.headers["Cache-Control"] = cache_control
+    return response
+
+def not_modified(etag, cache_control):
+    """If-None-Match 里有当前 ETag (或它的 gzip 版本) 时返回 304 响应，否则返回 None"""
+    for tag in (etag, f"{etag}-gzip"):
+        if request.if_none_match.contains_weak(tag):
+            response = Response(status=304)
+            response.set_etag(tag)
+            response.headers["Cache-Control"] = cache_control
+            response.vary.add("Accept-Encoding")
+            return response
+    return None
+
+@app.teardown_request
+def record_request_metrics(exc):
+    started = g.pop("request_started", None)
+    if started is None:
+        return
+    HTTP_IN_FLIGHT.dec()
+    # 按路由模板统计 (/charts/<digest>.png)，避免每个 mid 一个时间序列
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    status = 500 if exc is not None else g.pop("response_status", 500)
+    HTTP_REQUESTS.inc(method=request.method, route=route, status=status)
+    if route not in UNTIMED_ROUTES:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route)
 
 def seed_tours_from_json(con):
+    """把 tours.json 里库中还没有的场次补进去，返回新增了几条"""
     if not TOURS_JSON_PATH.exists():
-        return
+        return 0
     try:
         with open(TOURS_JSON_PATH, "r", encoding="utf-8") as f:
             data = json.load(f) or []
     except Exception as e:
         logger.warning(f"Failed to load tours.json: {e}")
-        return
+        return 0
 
+    inserted = 0
     for item in data:
         tour_name = item.get("tour_name") or "Unknown Tour"
         city = item.get("city")
@@ -53,7 +245,7 @@ def seed_tours_from_json(con):
         if not city or not tour_date:
             continue
 
-        con.execute(
+        inserted += con.execute(
             """
             INSERT INTO tours (tour_name, city, tour_date, venue, status)
             SELECT ?, ?, ?, ?, ?
@@ -62,29 +254,69 @@ def seed_tours_from_json(con):
             )
             """,
             (tour_name, city, tour_date, venue, status, tour_name, city, tour_date),
-        )
+        ).rowcount
+    return inserted
 
 def init_db():
     if not DB_PATH.parent.exists():
         DB_PATH.parent.mkdir(parents=True)
     
-    con = get_db_connection()
-    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
-        con.executescript(f.read())
-        
-    # Create cache table if not exists
-    con.execute("""
-        CREATE TABLE IF NOT EXISTS song_stats_cache (
-            mid TEXT PRIMARY KEY,
-            data TEXT,
-            updated_at TIMESTAMP
-        )
-    """)
-    seed_tours_from_json(con)
-    con.commit()
-    con.close()
+    with get_db_connection() as con:
+        with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+            con.executescript(f.read())
+        migrate_command_times(con)
+            
+        # Create cache table if not exists
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS song_stats_cache (
+                mid TEXT PRIMARY KEY,
+                data TEXT,
+                updated_at TIMESTAMP
+            )
+        """)
+        # updated_at: 内容最后一次变化的时间；verified_at: Worker 最后一次确认内容 (含心跳) 的时间，判断是否过期用它
+        ensure_columns(con, "song_stats_cache", {"content_hash": "TEXT", "verified_at": "TIMESTAMP"})
+        init_history_table(con)
+        init_versions_table(con)
+        if seed_tours_from_json(con):
+            bump_version(con, "tours")
+        migrate_inline_charts(con)
+    get_response_cache()
     print(f"Database schema initialized at {DB_PATH}")
 
+def get_response_cache():
+    """上游响应缓存，第一次调用时创建 (不依赖 init_db，WSGI 服务器或测试直接 import 也能用)"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(HTTP_CACHE_PATH)
+    return _response_cache
+
+def migrate_inline_charts(con):
+    """把旧缓存里内嵌的 base64 走势图移到图片仓库"""
+    rows = con.execute(
+        "SELECT mid, data FROM song_stats_cache WHERE data LIKE '%data:image/png;base64,%'"
+    ).fetchall()
+    for row in rows:
+        data, _ = chart_store.externalize(json.loads(row["data"]))
+        con.execute(
+            "UPDATE song_stats_cache SET data = ?, content_hash = NULL WHERE mid = ?", (json.dumps(data), row["mid"])
+        )
+    if rows:
+        logger.info(f"Migrated {len(rows)} inline chart images to {CHART_STORE_DIR}")
+
+def ensure_chart_from_pi(digest):
+    """主动从树莓派拉数据时，服务器上可能还没有对应的走势图，顺便补上"""
+    if not digest or chart_store.exists(digest):
+        return
+    try:
+        _, body = pi_client.get("charts", f"/charts/{digest}.png")
+        if hashlib.sha256(body).hexdigest() == digest:
+            chart_store.put_bytes(body)
+    except Exception as e:
+        logger.warning(f"Failed to fetch chart {digest[:12]} from Pi: {e}")
+
 # 辅助函数：计算 g_tk
 def get_g_tk(cookie_str):
     # 尝试提取 qm_keyst (首选) 或 p_skey 或 skey
@@ -113,10 +345,9 @@ def index():
     return send_from_directory(app.static_folder, "index.html")
 
 # 音乐统计页
+# 刷新由页面随后请求的 /api/song_index 按歌曲热度触发 (见 plan_demand_refresh)
 @app.get("/music")
 def music_stats():
-    # 当用户访问此页面时，尝试触发刷新
-    try_trigger_auto_refresh()
     return send_from_directory(app.static_folder, "stats.html")
 
 # 巡演成就页 (Desktop only)
@@ -133,33 +364,92 @@ def tour_archive():
         return "Tour Archive Page (Under Construction)"
 
 # === Worker 指令控制系统 ===
-# 使用简单的内存队列存储指令 (重启后丢失，但在此时够用了)
-# 生产环境建议用 Redis 或 数据库
-COMMAND_QUEUE = []
-LAST_AUTO_REFRESH_TIME = None # 记录上一次自动触发刷新的时间
-AUTO_REFRESH_COOLDOWN = 1800  # 冷却时间：30分钟 (1800秒)
-
-def try_trigger_auto_refresh():
-    """尝试触发自动刷新 (带冷却检查)"""
-    global LAST_AUTO_REFRESH_TIME
-    now = datetime.datetime.now()
-    
-    # 检查冷却时间
-    if LAST_AUTO_REFRESH_TIME:
-        elapsed = (now - LAST_AUTO_REFRESH_TIME).total_seconds()
-        if elapsed < AUTO_REFRESH_COOLDOWN:
-            logger.info(f"自动刷新处于冷却中 (剩余 {int(AUTO_REFRESH_COOLDOWN - elapsed)} 秒)")
-            return False
-            
-    # 触发刷新
-    LAST_AUTO_REFRESH_TIME = now
-    COMMAND_QUEUE.append({
-        "command": "refresh_all",
-        "timestamp": now.isoformat(),
-        "params": {"source": "auto_visit_trigger"}
-    })
-    logger.info("界面访问触发自动刷新指令 (refresh_all)")
-    return True
+# 指令持久化在 SQLite (worker_commands 表)，重启不丢；Worker 长轮询取指令并确认
+command_queue = CommandQueue(get_db_connection)
+# Worker 长轮询最长挂起时间 (秒)
+WORKER_POLL_MAX_WAIT = 30
+
+Gauge(
+    "rainie_worker_command_queue_depth", "Worker 指令队列中待处理 / 已投递未确认的指令数", ["status"],
+    fn=lambda: {(status,): count for status, count in command_queue.depth().items()}
+)
+Gauge(
+    "rainie_worker_last_poll_age_seconds", "距 Worker 最近一次长轮询的秒数 (长轮询挂起期间也算在轮询)",
+    fn=lambda: None if LAST_WORKER_POLL is None else time.time() - LAST_WORKER_POLL
+)
+
+def command_dedup_key(cmd, params):
+    """同类指令去重：全量刷新同时只排一条，单曲刷新按 mid 去重
+
+    refresh_songs 不去重：每次下发的都是当时最热最旧的一批，已下发过的歌在冷却期内不会重复出现
+    """
+    if cmd == "refresh_one":
+        return f"refresh_one:{params.get('mid')}"
+    if cmd == "refresh_songs":
+        return None
+    return cmd
+
+# === 按访问热度刷新 ===
+# /api/song_index 的访问按 mid 记热度；定期挑出"又热又旧"的歌，按优先级下发 refresh_songs 给 Worker
+# (取代原来任何人打开 /music 就全量刷新 30 首的做法)
+song_heat = AccessHeat()
+# 两次规划之间的最小间隔 (秒)
+DEMAND_REFRESH_INTERVAL = 60
+# 热度低于这个值的歌不主动刷新 (半小时前被看过一次约为 0.5)
+DEMAND_MIN_HEAT = 0.5
+# 数据超过多久算旧 (秒)；热度越高优先级越高，但不会早于这个时间刷新
+DEMAND_STALE_AFTER = 1800
+# 陈旧程度封顶 (倍数)，防止一首很冷但很旧的歌压过正被热看的歌
+DEMAND_MAX_STALENESS = 8
+# 每次最多下发多少首
+DEMAND_BATCH_LIMIT = 10
+# 下发过的歌多久内不再重复下发 (秒)
+DEMAND_RESEND_AFTER = 1800
+refresh_planner = BackgroundRefresher(max_workers=1, cooldown=DEMAND_REFRESH_INTERVAL, name="refresh-plan")
+
+def plan_demand_refresh():
+    """挑出又热又旧的歌，按 热度 × 陈旧程度 排序下发 refresh_songs，返回下发的 [(mid, 优先级)]"""
+    now = time.time()
+    hot = [item for item in song_heat.hot(DEMAND_MIN_HEAT, now) if not song_heat.requested_since(item[0], now - DEMAND_RESEND_AFTER)]
+    if not hot:
+        return []
+    mids = [mid for mid, _, _ in hot]
+    updated = {}
+    with get_db_connection() as con:
+        # 分批 IN 查询，避免超出 SQLite 参数上限
+        for i in range(0, len(mids), 500):
+            chunk = mids[i:i + 500]
+            rows = con.execute(
+                f"SELECT mid, COALESCE(verified_at, updated_at) AS verified_at FROM song_stats_cache "
+                f"WHERE mid IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            updated.update({row["mid"]: local_ts(row["verified_at"]) for row in rows})
+
+    candidates = []
+    for mid, heat, _ in hot:
+        age = now - updated[mid] if mid in updated else None
+        if age is not None and age < DEMAND_STALE_AFTER:
+            continue
+        # 没有数据的歌按最旧处理
+        staleness = DEMAND_MAX_STALENESS if age is None else min(age / DEMAND_STALE_AFTER, DEMAND_MAX_STALENESS)
+        candidates.append((mid, round(heat * staleness, 3)))
+    candidates.sort(key=lambda item: item[1], reverse=True)
+    chosen = candidates[:DEMAND_BATCH_LIMIT]
+    if not chosen:
+        return []
+
+    command_queue.enqueue(
+        "refresh_songs",
+        {"songs": [{"mid": mid, "priority": priority} for mid, priority in chosen], "source": "access_heat"},
+    )
+    song_heat.mark_requested([mid for mid, _ in chosen], now)
+    logger.info(f"按访问热度下发刷新 {len(chosen)} 首: {', '.join(mid for mid, _ in chosen)}")
+    return chosen
+
+def note_song_access(mids):
+    """记录歌曲访问，并 (限频地) 在后台规划一次按需刷新"""
+    song_heat.record(mids)
+    refresh_planner.submit("plan", plan_demand_refresh)
 
 @app.route('/api/worker/command', methods=['POST'])
 def send_worker_command():
@@ -169,29 +459,50 @@ def send_worker_command():
         cmd = data.get('command')
         if not cmd:
             return jsonify({"error": "Missing command"}), 400
-            
+        
+        params = data.get('params', {})
         # 将指令加入队列
-        COMMAND_QUEUE.append({
-            "command": cmd,
-            "timestamp": datetime.datetime.now().isoformat(),
-            "params": data.get('params', {})
+        command_id, created = command_queue.enqueue(cmd, params, dedup_key=command_dedup_key(cmd, params))
+        logger.info(f"指令已入列: {cmd}" if created else f"指令已存在，合并: {cmd}")
+        depth = command_queue.depth()
+        return jsonify({
+            "status": "queued" if created else "merged",
+            "id": command_id,
+            "queue_length": depth["pending"] + depth["leased"]
         })
-        logger.info(f"指令已入列: {cmd}")
-        return jsonify({"status": "queued", "queue_length": len(COMMAND_QUEUE)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/worker/poll', methods=['GET'])
 def worker_poll():
-    """树莓派 Worker 每分钟调用一次此接口，获取最新指令"""
-    if COMMAND_QUEUE:
-        # 取出最早的一条指令 (FIFO)
-        cmd = COMMAND_QUEUE.pop(0)
-        logger.info(f"指令已下发给 Worker: {cmd['command']}")
+    """树莓派 Worker 长轮询此接口获取指令
+
+    wait: 队列为空时最多挂起多少秒 (有新指令入队会立即返回)，默认 0 不等待
+    取到的指令处理完后需调用 /api/worker/ack 确认，否则租约到期后会重新投递
+    """
+    try:
+        wait = min(float(request.args.get("wait", 0)), WORKER_POLL_MAX_WAIT)
+    except ValueError:
+        wait = 0
+    
+    global LAST_WORKER_POLL
+    LAST_WORKER_POLL = time.time()
+    cmd = command_queue.lease(wait=max(wait, 0))
+    if cmd:
+        logger.info(f"指令已下发给 Worker: {cmd['command']} (id={cmd['id']}, 第 {cmd['attempt']} 次投递)")
         return jsonify({"has_command": True, "data": cmd})
     else:
         return jsonify({"has_command": False})
 
+@app.route('/api/worker/ack', methods=['POST'])
+def worker_ack():
+    """Worker 确认指令已处理"""
+    data = request.get_json(silent=True) or {}
+    command_id = data.get("id")
+    if command_id is None:
+        return jsonify({"error": "Missing id"}), 400
+    return jsonify({"code": 0, "acked": command_queue.ack(command_id)})
+
 # API: 搜索歌手并获取热门歌曲
 @app.get("/api/search_singer")
 def search_singer():
@@ -200,13 +511,11 @@ def search_singer():
     # 由于服务器端网络限制，无法直接访问 QQ 音乐
     # 我们改为将搜索请求转发给树莓派 (Tailscale IP: 100.93.253.71)
     
-    pi_url = f"http://100.93.253.71:5000/api/search_singer?name={urllib.parse.quote(name)}"
-    
     try:
-        # 设置超时时间，避免前端等太久
-        req = urllib.request.Request(pi_url)
-        with urllib.request.urlopen(req, timeout=8) as response:
-            content = response.read().decode('utf-8')
+        def fetch():
+            # 超时时间见 pi_client.PI_TIMEOUTS，避免前端等太久
+            # 同一时刻大量浏览器搜索同一个歌手时，只会向树莓派发一次请求
+            content = pi_client.get_text("search_singer", "/api/search_singer", {"name": name})
             # 增加对 QQ 音乐不规范 JSON 的容错处理
             # 有时候 QQ 音乐会返回 callback(...) 格式
             if content.strip().startswith("callback"):
@@ -217,8 +526,12 @@ def search_singer():
                      content = content[start:end]
             
             # 有时返回的内容前面有空字符
-            data = json.loads(content.strip())
-            return jsonify(data)
+            content = content.strip()
+            json.loads(content) # 校验，不合法的内容不进缓存
+            return content
+        
+        content, _ = get_response_cache().get_or_fetch("search", {"name": name}, fetch)
+        return jsonify(json.loads(content))
             
     except json.JSONDecodeError as e:
         logger.error(f"JSON Parse Error from Pi: {e}, Content preview: {content[:100] if 'content' in locals() else 'None'}")
@@ -243,14 +556,17 @@ def get_lyrics():
     if not songmid:
         return jsonify({"error": "Missing songmid"}), 400
         
-    # 转发给树莓派
-    pi_url = f"http://100.93.253.71:5000/api/get_lyrics?mid={songmid}"
-    
+    def fetch():
+        content = pi_client.get_text("get_lyrics", "/api/get_lyrics", {"mid": songmid})
+        # 不是歌词结果的响应 (出错信息等) 不进缓存
+        if "lyric" not in json.loads(content):
+            raise ValueError(f"Pi returned no lyric field: {content[:100]}")
+        return content
+
+    # 转发给树莓派 (歌词基本不变，缓存后几乎不再请求)
     try:
-        req = urllib.request.Request(pi_url)
-        with urllib.request.urlopen(req, timeout=5) as response:
-            data = json.loads(response.read().decode('utf-8'))
-            return jsonify(data)
+        content, _ = get_response_cache().get_or_fetch("lyrics", {"mid": songmid}, fetch)
+        return jsonify(json.loads(content))
     except Exception as e:
         logger.error(f"Forward lyrics to Pi failed: {e}")
         return jsonify({"error": f"Get lyrics failed (Proxy): {str(e)}"}), 500
@@ -262,7 +578,7 @@ def get_album_songs():
     if not albummid:
         return jsonify({"error": "Missing albummid"}), 400
         
-    url = "https://c.y.qq.com/v8/fcg-bin/fcg_v8_album_info_cp.fcg"
+    url = f"{QQ_MUSIC_API_BASE}/v8/fcg-bin/fcg_v8_album_info_cp.fcg"
     params = {
         "albummid": albummid,
         "format": "json",
@@ -277,14 +593,70 @@ def get_album_songs():
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
     
-    try:
+    def fetch():
         req = urllib.request.Request(full_url, headers=headers)
-        with urllib.request.urlopen(req) as response:
-            data = json.loads(response.read().decode('utf-8'))
-            return jsonify(data)
+        with QQ_MUSIC_SECONDS.time(endpoint="album"):
+            with urllib.request.urlopen(req, timeout=QQ_MUSIC_TIMEOUT) as response:
+                content = response.read().decode('utf-8')
+        # 出错的响应不进缓存
+        if json.loads(content).get("code", 0) != 0:
+            raise ValueError(f"QQ Music returned error: {content[:100]}")
+        return content
+    
+    try:
+        # 专辑曲目很少变化，缓存数天
+        content, _ = get_response_cache().get_or_fetch("album", {"albummid": albummid}, fetch)
+        return jsonify(json.loads(content))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def is_worker_request():
+    """只有带上正确 Token 的请求才是 Worker 发来的"""
+    return request.headers.get("Authorization") == WORKER_AUTH_HEADER
+
+# 走势图 (内容寻址，永不变化，可以让浏览器/代理长期缓存)
+@app.get("/charts/<digest>.png")
+def get_chart(digest):
+    if not chart_store.exists(digest):
+        return jsonify({"error": "Not found"}), 404
+    resp = send_file(chart_store.path_for(digest), mimetype="image/png", max_age=31536000)
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
+
+# 指数/排名走势图 (SVG)，参数 range: 24h / 7d / 30d / 90d
+@app.get("/api/charts/trend/<mid>.svg")
+def get_trend_chart(mid):
+    range_name = request.args.get("range", TREND_DEFAULT_RANGE)
+    if range_name not in TREND_RANGES:
+        return jsonify({"error": f"range must be one of {', '.join(TREND_RANGES)}"}), 400
+    key = (mid, range_name)
+    svg = trend_svg_cache.get(key)
+    if svg is None:
+        span, bucket = TREND_RANGES[range_name]
+        end = int(datetime.datetime.now().timestamp())
+        with get_db_connection() as con:
+            points = query_history(con, mid, end - span, end, bucket)
+        svg = render_trend_svg(points, title=f"{mid} {range_name}")
+        trend_svg_cache.set(key, svg)
+    resp = Response(svg, mimetype="image/svg+xml")
+    resp.headers["Cache-Control"] = "public, max-age=300"
+    return resp
+
+# API: Worker 上传走势图 (同一哈希只需上传一次)
+@app.put("/api/charts/<digest>")
+def upload_chart(digest):
+    if not is_worker_request():
+        logger.warning(f"Unauthorized access attempt from {request.remote_addr}")
+        return jsonify({"error": "Unauthorized"}), 401
+    if not CHART_HASH_RE.match(digest):
+        return jsonify({"error": "Invalid hash"}), 400
+    body = request.get_data()
+    if hashlib.sha256(body).hexdigest() != digest:
+        return jsonify({"error": "Hash mismatch"}), 400
+    chart_store.put_bytes(body)
+    logger.info(f"Stored chart {digest[:12]}")
+    return jsonify({"code": 0, "hash": digest})
+
 # API: 接收来自树莓派/本地爬虫的数据推送
 # 为了安全，您可以加一个简单的 token 验证
 @app.post("/api/update_song_stats")
@@ -292,28 +664,20 @@ def update_song_stats():
     try:
         # === 安全验证 ===
         # 只有带上正确 Token 的请求才会被处理
-        token = request.headers.get("Authorization")
-        if token != "Bearer rainie-forever-2026": # 您可以随便改这个密码
+        if not is_worker_request():
             logger.warning(f"Unauthorized access attempt from {request.remote_addr}")
             return jsonify({"error": "Unauthorized"}), 401
             
         data = request.json
-        mid = data.get("mid")
-        stats_data = data.get("data")
+        if not isinstance(data, dict) or not valid_push(PUSH_FULL, data) or not data["data"]:
+            return jsonify({"error": "Missing or invalid mid, data or scraped_at"}), 400
+        mid = data["mid"]
+        stats_data = data["data"]
         
-        if not mid or not stats_data:
-            return jsonify({"error": "Missing mid or data"}), 400
+        # 兼容旧版 Worker：仍内嵌 base64 图片的，在这里转存
+        stats_data, _ = chart_store.externalize(stats_data)
             
-        con = get_db_connection()
-        now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # 存入数据库
-        con.execute("""
-            INSERT OR REPLACE INTO song_stats_cache (mid, data, updated_at)
-            VALUES (?, ?, ?)
-        """, (mid, json.dumps(stats_data), now_str))
-        con.commit()
-        con.close()
+        store_song_stats(mid, stats_data, scraped_at=data.get("scraped_at"))
         
         logger.info(f"Received stats update for {mid} from worker")
         return jsonify({"code": 0, "message": "success"})
@@ -322,62 +686,289 @@ def update_song_stats():
         logger.error(f"Failed to update stats: {e}")
         return jsonify({"code": -1, "error": str(e)}), 500
 
-# API: 获取歌曲详细指数 (优先查库，查不到则尝试从树莓派拉取)
+# 批量推送接口: 单次最多条数，解压后的请求体上限 (字节)
+BULK_MAX_ITEMS = 500
+BULK_MAX_BYTES = 16 * 1024 * 1024
+
+@app.post("/api/update_song_stats/bulk")
+def update_song_stats_bulk():
+    """Worker 推送队列的批量写入 (可 gzip 压缩)：{"items": [消息, ...]}，消息格式见 song_delta
+
+    整批在一个事务里写入，提交后再更新缓存和推送 SSE；格式不对的条目跳过并在 rejected 里返回下标，
+    差异/心跳和服务器上的版本对不上的歌在 resync 里返回，Worker 会补发整份数据
+    """
+    if not is_worker_request():
+        logger.warning(f"Unauthorized access attempt from {request.remote_addr}")
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        raw = request.get_data()
+        if request.headers.get("Content-Encoding", "").lower() == "gzip":
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            raw = decompressor.decompress(raw, BULK_MAX_BYTES)
+            if decompressor.unconsumed_tail:
+                return jsonify({"error": "Payload too large"}), 413
+        items = json.loads(raw).get("items")
+    except (ValueError, zlib.error, AttributeError) as e:
+        return jsonify({"error": f"Invalid body: {e}"}), 400
+    if not isinstance(items, list) or len(items) > BULK_MAX_ITEMS:
+        return jsonify({"error": f"items must be a list of at most {BULK_MAX_ITEMS}"}), 400
+
+    rejected = []
+    accepted = []
+    for i, item in enumerate(items):
+        kind = item.get("type", PUSH_FULL) if isinstance(item, dict) else None
+        if not isinstance(item, dict) or not valid_push(kind, item):
+            rejected.append(i)
+            continue
+        if kind == PUSH_FULL:
+            item = dict(item, data=chart_store.externalize(item["data"])[0])
+        accepted.append((kind, item))
+
+    now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    changed = {}
+    verified = {}
+    resync = []
+    try:
+        with get_db_connection() as con:
+            con.execute("BEGIN IMMEDIATE")
+            for kind, item in accepted:
+                mid = item["mid"]
+                if kind == PUSH_HEARTBEAT:
+                    history_added = verify_song_stats(
+                        con, mid, item["hash"], item.get("volatile"), item.get("scraped_at"), now_str
+                    )
+                    ok = history_added is not None
+                    result = (False, history_added, None, item["hash"])
+                elif kind == PUSH_DELTA:
+                    result = apply_song_delta(con, mid, item, now_str)
+                    ok = result is not None
+                else:
+                    result = write_song_stats(con, mid, item["data"], item.get("scraped_at"), now_str)
+                    ok = True
+                if not ok:
+                    if mid not in resync:
+                        resync.append(mid)
+                elif result[0]:
+                    # 同一批里同一首歌变了多次，只保留最后一份；历史是否新增取"或"
+                    added = changed.get(mid, (None, None, False))[2] or result[1]
+                    changed[mid] = (result[2], result[3], added)
+                else:
+                    verified[mid] = (result[3], verified.get(mid, (None, False))[1] or result[1])
+    except Exception as e:
+        logger.error(f"Failed to bulk update stats: {e}")
+        return jsonify({"code": -1, "error": str(e)}), 500
+    for mid, (stats_data, data_hash, history_added) in changed.items():
+        after_song_stored(mid, stats_data, data_hash, now_str, history_added)
+    for mid in verified.keys() - changed.keys():
+        song_verified(mid, *verified[mid], now_str)
+    logger.info(
+        f"Received bulk stats update from worker: {len(changed)} changed, {len(verified.keys() - changed.keys())} verified, "
+        f"{len(resync)} resync, {len(rejected)} rejected"
+    )
+    return jsonify({"code": 0, "accepted": len(accepted), "rejected": rejected, "resync": resync})
+
+def valid_push(kind, item):
+    # mid / scraped_at 类型不对会在事务里绑定参数时报错，整批回滚；这里先按条拒收
+    mid = item.get("mid")
+    if not isinstance(mid, str) or not mid:
+        return False
+    scraped_at = item.get("scraped_at")
+    if scraped_at is not None and (not isinstance(scraped_at, int) or isinstance(scraped_at, bool)):
+        return False
+    if kind == PUSH_FULL:
+        return isinstance(item.get("data"), dict)
+    if kind == PUSH_HEARTBEAT:
+        return isinstance(item.get("hash"), str) and isinstance(item.get("volatile", {}), dict)
+    if kind == PUSH_DELTA:
+        return (isinstance(item.get("hash"), str) and isinstance(item.get("base_hash"), str)
+                and isinstance(item.get("set"), dict) and isinstance(item.get("unset", []), list))
+    return False
+
+def current_hash(con, mid):
+    """库里这首歌的 (data, content_hash)；没有返回 (None, None)；旧数据没存哈希的现算"""
+    row = con.execute("SELECT data, content_hash FROM song_stats_cache WHERE mid = ?", (mid,)).fetchone()
+    if not row:
+        return None, None
+    data = json.loads(row["data"])
+    return data, row["content_hash"] or content_hash(data)
+
+def write_song_stats(con, mid, stats_data, scraped_at, now_str, new_hash=None):
+    """在 con 的事务里写入一首歌的数据并追加历史，返回 (内容是否变化, 历史是否新增了一行, 数据, 内容哈希)
+
+    内容哈希和库里一样时不重写这一行，只更新 verified_at (和变了的易变字段)
+    """
+    new_hash = new_hash or content_hash(stats_data)
+    stored_data, stored_hash = current_hash(con, mid)
+    if stored_hash == new_hash:
+        history_added = mark_verified(con, mid, stored_data, new_hash, volatile_part(stats_data), scraped_at, now_str)
+        return False, history_added, stats_data, new_hash
+    con.execute("""
+        INSERT OR REPLACE INTO song_stats_cache (mid, data, updated_at, content_hash, verified_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (mid, json.dumps(stats_data), now_str, new_hash, now_str))
+    return True, append_history(con, mid, stats_data, scraped_at), stats_data, new_hash
+
+def apply_song_delta(con, mid, item, now_str):
+    """应用字段级差异；库里的版本不是 base_hash 或应用后哈希对不上时返回 None (需要重发整份)"""
+    data, stored_hash = current_hash(con, mid)
+    if data is None or stored_hash != item["base_hash"]:
+        return None
+    new_data = apply_delta(data, item["set"], item.get("unset", []))
+    new_hash = content_hash(new_data)
+    if new_hash != item["hash"]:
+        return None
+    return write_song_stats(con, mid, new_data, item.get("scraped_at"), now_str, new_hash)
+
+def verify_song_stats(con, mid, expected_hash, volatile, scraped_at, now_str):
+    """心跳：内容没变，只更新 verified_at 和易变字段；返回历史是否新增了一行，库里的版本对不上时返回 None"""
+    stored_data, stored_hash = current_hash(con, mid)
+    if stored_hash != expected_hash:
+        return None
+    return mark_verified(con, mid, stored_data, stored_hash, volatile, scraped_at, now_str)
+
+def mark_verified(con, mid, stored_data, data_hash, volatile, scraped_at, now_str):
+    """内容没变：更新 verified_at；收听人数等易变字段变了就顺带改 data，不动 updated_at
+
+    在听人数也记在指标历史里，它变了才追加一条历史，返回是否追加
+    """
+    merged = merge_volatile(stored_data, volatile)
+    if merged is None:
+        con.execute(
+            "UPDATE song_stats_cache SET verified_at = ?, content_hash = ? WHERE mid = ?", (now_str, data_hash, mid)
+        )
+        return False
+    con.execute(
+        "UPDATE song_stats_cache SET data = ?, verified_at = ?, content_hash = ? WHERE mid = ?",
+        (json.dumps(merged), now_str, data_hash, mid)
+    )
+    if parse_metrics(merged) == parse_metrics(stored_data):
+        return False
+    return append_history(con, mid, merged, scraped_at)
+
+def after_song_stored(mid, stats_data, data_hash, now_str, history_added):
+    """内容变化并提交后：更新进程内缓存和版本、让走势图失效、推送给订阅的浏览器"""
+    song_cache.set(mid, (stats_data, now_str, now_str, data_hash))
+    song_versions.set(mid, (data_hash, now_str, now_str))
+    if history_added:
+        for range_name in TREND_RANGES:
+            trend_svg_cache.invalidate((mid, range_name))
+    song_events.publish(mid, {"mid": mid, "data": stats_data, "updated_at": now_str, "verified_at": now_str, "stale": False})
+
+def store_song_stats(mid, stats_data, scraped_at=None):
+    """写入歌曲数据 (SQLite + 进程内缓存)，并追加一条指标历史；内容没变时只更新 verified_at
+
+    scraped_at: 抓取时间 (unix 秒)，由 Worker 带上；同一次抓取推送和拉取各来一次时历史只记一条
+    """
+    now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with get_db_connection() as con:
+        changed, history_added, _, data_hash = write_song_stats(con, mid, stats_data, scraped_at, now_str)
+    if changed:
+        after_song_stored(mid, stats_data, data_hash, now_str, history_added)
+    else:
+        song_verified(mid, data_hash, history_added, now_str)
+
+def song_verified(mid, data_hash, history_added, now_str):
+    """内容没变、只更新了 verified_at：缓存失效，内存版本里只改确认时间 (版本对不上就丢掉，下次从库里读)"""
+    song_cache.invalidate(mid)
+    if history_added:
+        for range_name in TREND_RANGES:
+            trend_svg_cache.invalidate((mid, range_name))
+    version = song_versions.get(mid)
+    if version is not None and version[0] == data_hash:
+        song_versions.set(mid, (data_hash, version[1], now_str))
+    else:
+        song_versions.discard(mid)
+
+def load_song_stats(mid):
+    """读取歌曲数据，返回 (data, updated_at, verified_at, content_hash) 或 None；优先走进程内缓存"""
+    entry = song_cache.get(mid)
+    if entry is not None:
+        return entry
+    with get_db_connection() as con:
+        row = con.execute(
+            "SELECT data, updated_at, COALESCE(verified_at, updated_at) AS verified_at, content_hash "
+            "FROM song_stats_cache WHERE mid = ?",
+            (mid,)
+        ).fetchone()
+    if not row:
+        return None
+    data = json.loads(row["data"])
+    entry = (data, row["updated_at"], row["verified_at"], row["content_hash"] or content_hash(data))
+    song_cache.set(mid, entry)
+    song_versions.set(mid, (entry[3], entry[1], entry[2]))
+    return entry
+
+def pull_song_from_pi(mid):
+    """从树莓派拉取单曲数据并写入缓存 (在后台线程执行)"""
+    try:
+        pi_data = json.loads(pi_client.get_text("get_data", f"/api/get_data/{urllib.parse.quote(mid)}"))
+    except Exception as e:
+        logger.warning(f"Failed to pull from Raspberry Pi: {e}")
+        return
+    if pi_data.get("code") == 0 and pi_data.get("data"):
+        new_data, chart_hash = chart_store.externalize(pi_data["data"])
+        ensure_chart_from_pi(chart_hash)
+        try:
+            scraped_at = local_ts(pi_data["updated_at"])
+        except (KeyError, TypeError, ValueError):
+            scraped_at = None
+        store_song_stats(mid, new_data, scraped_at=scraped_at)
+        logger.info(f"Pulled data for {mid} from Raspberry Pi")
+
+# API: 获取歌曲详细指数 (优先查缓存；数据过期或缺失时在后台从树莓派拉取，不阻塞请求)
+# 参数: mid，fields (可选，逗号分隔，只返回 data 里的这些字段)
 @app.get("/api/song_index")
 def get_song_index():
     mid = request.args.get("mid")
     if not mid:
         return jsonify({"error": "Missing mid"}), 400
+    fields = parse_fields(request.args.get("fields"))
+    note_song_access(mid)
+    
+    # 0. 条件请求：内存里的版本和浏览器手上的一致就直接 304 (不查库、不反序列化)
+    version = song_versions.get(mid)
+    if version is not None and song_age(version[2]) < SONG_STALE_AFTER:
+        response = not_modified(song_etag(mid, *version, fields, False), SONG_CACHE_CONTROL)
+        if response is not None:
+            # 最省的命中也要计数，否则命中率会偏低
+            SONG_CACHE_LOOKUPS.inc(result="not_modified")
+            return response
         
     try:
         # 1. 检查本地缓存
-        con = get_db_connection()
-        cached = con.execute("SELECT data, updated_at FROM song_stats_cache WHERE mid = ?", (mid,)).fetchone()
-        con.close()
+        # 正常情况下树莓派会主动推送最新数据过来，推送成功本地缓存就是最新的
+        entry = load_song_stats(mid)
         
-        # 缓存策略：如果有数据，直接返回 (因为现在树莓派会主动推送最新数据过来)
-        # 只要推送成功，本地缓存就是最新的
-        if cached:
-            # 检查是否过期太久 (比如超过24小时)，如果太久可能推送机制挂了
-            updated_at = datetime.datetime.strptime(cached["updated_at"], "%Y-%m-%d %H:%M:%S")
-            now = datetime.datetime.now()
+        if entry:
+            data, updated_at_str, verified_at_str, data_hash = entry
+            data = project_fields(data, fields)
+            # 是否过期看最后一次确认的时间 (内容没变时 Worker 只发心跳，updated_at 不动)
+            stale = song_age(verified_at_str) >= SONG_STALE_AFTER
+            # 响应只取决于 ETag 里的这几项，压缩结果也按它缓存
+            etag = song_etag(mid, data_hash, updated_at_str, verified_at_str, fields, stale)
+            g.etag, g.cache_control = etag, SONG_CACHE_CONTROL
+            g.compress_key = ("song_index", etag)
             
-            # 只有在数据非常老 (超过4小时) 的情况下，才尝试主动去拉
-            # 正常情况下，树莓派的推送会保证数据是新鲜的 (30分钟-1小时)
-            if (now - updated_at).total_seconds() < 14400: 
-                return jsonify({"code": 0, "data": json.loads(cached["data"])})
-            else:
-                logger.info(f"数据已过期 (>4h)，尝试主动从树莓派拉取: {mid}")
-        
-        # 2. 尝试从树莓派主动拉取 (Failover)
-        # 注意：这里会阻塞请求约 1-2 秒，取决于树莓派响应速度
-        try:
-            # 树莓派 Tailscale IP
-            pi_url = f"http://100.93.253.71:5000/api/get_data/{mid}"
-            resp = urllib.request.urlopen(pi_url, timeout=3)
-            if resp.status == 200:
-                pi_data = json.loads(resp.read().decode('utf-8'))
-                if pi_data.get("code") == 0 and pi_data.get("data"):
-                    # 拉取成功，更新本地数据库
-                    new_data = pi_data["data"]
-                    con = get_db_connection()
-                    now_str = now.strftime("%Y-%m-%d %H:%M:%S")
-                    con.execute("""
-                        INSERT OR REPLACE INTO song_stats_cache (mid, data, updated_at)
-                        VALUES (?, ?, ?)
-                    """, (mid, json.dumps(new_data), now_str))
-                    con.commit()
-                    con.close()
-                    logger.info(f"Pulled data for {mid} from Raspberry Pi")
-                    return jsonify({"code": 0, "data": new_data})
-        except Exception as e:
-            logger.warning(f"Failed to pull from Raspberry Pi: {e}")
-
-        # 3. 如果拉取失败，退回到旧缓存 (如果有)
-        if cached:
-            return jsonify({"code": 0, "data": json.loads(cached["data"]), "warning": "using_stale_cache"})
+            if not stale:
+                SONG_CACHE_LOOKUPS.inc(result="fresh")
+                return not_modified(etag, SONG_CACHE_CONTROL) or jsonify({"code": 0, "data": data, "updated_at": updated_at_str, "verified_at": verified_at_str, "stale": False})
             
-        # 4. 彻底没有数据
+            SONG_CACHE_LOOKUPS.inc(result="stale")
+            # 2. 数据非常老 (推送机制可能挂了)：先返回旧数据，后台再去树莓派拉
+            if pi_refresher.submit(mid, pull_song_from_pi, mid):
+                logger.info(f"数据已过期 (>4h)，后台从树莓派拉取: {mid}")
+            return not_modified(etag, SONG_CACHE_CONTROL) or jsonify({
+                "code": 0,
+                "data": data,
+                "updated_at": updated_at_str,
+                "verified_at": verified_at_str,
+                "stale": True,
+                "warning": "using_stale_cache"
+            })
+        
+        # 3. 彻底没有数据：后台拉取，前端轮询会在下一次拿到
+        SONG_CACHE_LOOKUPS.inc(result="missing")
+        pi_refresher.submit(mid, pull_song_from_pi, mid)
         return jsonify({
             "code": 1, 
             "message": "Data queuing...", 
@@ -388,7 +979,224 @@ def get_song_index():
         logger.error(f"Unhandled exception in get_song_index: {e}")
         return jsonify({"code": -1, "error": str(e)}), 500
 
+def song_age(verified_at_str):
+    """距最后一次确认过了多少秒"""
+    verified_at = datetime.datetime.strptime(verified_at_str, "%Y-%m-%d %H:%M:%S")
+    return (datetime.datetime.now() - verified_at).total_seconds()
+
+def song_etag(mid, data_hash, updated_at, verified_at, fields, stale):
+    """song_index 响应的 ETag：内容哈希、时间戳、所选字段、是否过期都一样时响应体就一样"""
+    key = "|".join([mid, data_hash, updated_at, verified_at, ",".join(fields or ()), "stale" if stale else "fresh"])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+def parse_fields(value):
+    """fields 参数 (逗号分隔或数组) -> 排好序的字段元组；没传返回 None，表示返回全部字段"""
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list):
+        return None
+    fields = tuple(sorted({f.strip() for f in value if isinstance(f, str) and f.strip()}))
+    return fields or None
+
+def project_fields(data, fields):
+    """只保留调用方要的字段 (例如列表页不需要走势图和成就)；不存在的字段直接忽略"""
+    if fields is None or not isinstance(data, dict):
+        return data
+    return {key: data[key] for key in fields if key in data}
+
+# 批量接口一次最多查询的歌曲数
+SONG_BATCH_LIMIT = 100
+
+# API: 批量获取歌曲指数 (前端首屏和每个轮询周期都只发一次请求)
+# 参数: mids (逗号分隔或 JSON 数组)，since (上次返回的 version，只返回此后有变化或被 Worker 重新确认过的歌曲)，
+#       fields (可选，逗号分隔或 JSON 数组，只返回 data 里的这些字段)
+# GET 请求带 ETag，浏览器用 If-None-Match 重新验证，内容没变时返回 304 (见 batch_etag)；POST 仅为兼容旧页面保留
+@app.route("/api/song_index/batch", methods=["GET", "POST"])
+def get_song_index_batch():
+    if request.method == "POST":
+        body = request.get_json(silent=True) or {}
+        mids = body.get("mids") or []
+        since = body.get("since")
+        fields = parse_fields(body.get("fields"))
+    else:
+        mids = request.args.get("mids", "").split(",")
+        since = request.args.get("since")
+        fields = parse_fields(request.args.get("fields"))
+    
+    mids = [m.strip() for m in mids if isinstance(m, str) and m.strip()]
+    mids = list(dict.fromkeys(mids))[:SONG_BATCH_LIMIT]
+    if not mids:
+        return jsonify({"error": "Missing mids"}), 400
+    # 带 since 的是轮询的增量请求，不算新的访问
+    if since is None:
+        note_song_access(mids)
+    conditional = request.method == "GET"
+    
+    # 0. 条件请求：每首歌在内存里都有版本且都没过期时，不查库直接比较 ETag
+    if conditional:
+        versions = [(mid, song_versions.get(mid)) for mid in mids]
+        if all(version is not None and song_age(version[2]) < SONG_STALE_AFTER for _, version in versions):
+            etag = batch_etag(since, fields, [
+                (mid, *version, False) for mid, version in versions if since is None or version[2] >= since
+            ], [])
+            response = not_modified(etag, SONG_CACHE_CONTROL)
+            if response is not None:
+                SONG_CACHE_LOOKUPS.inc(len(mids), result="not_modified")
+                return response
+    
+    try:
+        # 先记下查询时刻作为新的 version (同一秒内写入的行下次会再返回一次，不会漏)
+        now = datetime.datetime.now()
+        version = now.strftime("%Y-%m-%d %H:%M:%S")
+        
+        # 单次 IN 查询：since 之后没再确认过的行只取时间戳，不取 data
+        # 按 verified_at 比较而不是 updated_at：心跳只改 verified_at 和易变字段 (在听人数等)，轮询也要拿到
+        placeholders = ",".join("?" * len(mids))
+        with get_db_connection() as con:
+            rows = con.execute(f"""
+                SELECT mid, updated_at, COALESCE(verified_at, updated_at) AS verified_at, content_hash,
+                       CASE WHEN ? IS NULL OR COALESCE(verified_at, updated_at) >= ? THEN data END AS data
+                FROM song_stats_cache WHERE mid IN ({placeholders})
+            """, [since, since] + mids).fetchall()
+        
+        songs = {}
+        returned = []
+        present = set()
+        for row in rows:
+            present.add(row["mid"])
+            verified_at = datetime.datetime.strptime(row["verified_at"], "%Y-%m-%d %H:%M:%S")
+            stale = (now - verified_at).total_seconds() >= SONG_STALE_AFTER
+            SONG_CACHE_LOOKUPS.inc(result="stale" if stale else "fresh")
+            # 过期检查放在 since 过滤之前：轮询的增量请求里没变化的过期歌曲也要安排刷新
+            if stale:
+                pi_refresher.submit(row["mid"], pull_song_from_pi, row["mid"])
+            if row["data"] is None:
+                continue
+            data = json.loads(row["data"])
+            data_hash = row["content_hash"] or content_hash(data)
+            song_versions.set(row["mid"], (data_hash, row["updated_at"], row["verified_at"]))
+            returned.append((row["mid"], data_hash, row["updated_at"], row["verified_at"], stale))
+            songs[row["mid"]] = {
+                "data": project_fields(data, fields),
+                "updated_at": row["updated_at"],
+                "verified_at": row["verified_at"],
+                "stale": stale
+            }
+        
+        missing = [mid for mid in mids if mid not in present]
+        if missing:
+            SONG_CACHE_LOOKUPS.inc(len(missing), result="missing")
+        for mid in missing:
+            pi_refresher.submit(mid, pull_song_from_pi, mid)
+        
+        if conditional:
+            etag = batch_etag(since, fields, returned, missing)
+            g.etag, g.cache_control = etag, SONG_CACHE_CONTROL
+            g.compress_key = ("song_index_batch", etag)
+            response = not_modified(etag, SONG_CACHE_CONTROL)
+            if response is not None:
+                return response
+        return jsonify({"code": 0, "version": version, "data": songs, "missing": missing})
+    except Exception as e:
+        logger.error(f"Unhandled exception in get_song_index_batch: {e}")
+        return jsonify({"code": -1, "error": str(e)}), 500
+
+def batch_etag(since, fields, versions, missing):
+    """批量接口响应的 ETag：since、所选字段、返回的每首歌的版本 (mid, 内容哈希, 时间戳, 是否过期) 和缺失的歌都一样时，
+    除 version 外响应体就一样
+
+    version 不参与计算：304 时浏览器沿用缓存里较早的 version，下次轮询只会多返回几首，不会漏
+    """
+    key = json.dumps([since, list(fields or ()), sorted(versions), missing], ensure_ascii=False)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+# API: 歌曲指标历史 (走势)
+# 参数: mid, start/end (unix 秒或 ISO 本地时间，默认最近 7 天), bucket (raw / hour / day)
+@app.get("/api/song_history")
+def get_song_history():
+    mid = request.args.get("mid")
+    if not mid:
+        return jsonify({"error": "Missing mid"}), 400
+    bucket = request.args.get("bucket", "hour")
+    if bucket not in BUCKETS:
+        return jsonify({"error": f"bucket must be one of {', '.join(BUCKETS)}"}), 400
+    try:
+        now = int(datetime.datetime.now().timestamp())
+        end = parse_time_arg(request.args.get("end"), now)
+        start = parse_time_arg(request.args.get("start"), end - HISTORY_DEFAULT_DAYS * 86400)
+    except ValueError:
+        return jsonify({"error": "Invalid start/end"}), 400
+    try:
+        limit = min(int(request.args.get("limit", HISTORY_MAX_POINTS)), HISTORY_MAX_POINTS)
+    except ValueError:
+        limit = HISTORY_MAX_POINTS
+
+    with get_db_connection() as con:
+        points = query_history(con, mid, start, end, bucket, limit)
+    return jsonify({"code": 0, "mid": mid, "bucket": bucket, "start": start, "end": end, "points": points})
+
+# API: 歌曲数据实时推送 (Server-Sent Events)
+# 参数: mids (逗号分隔)。连接数满时返回 503，前端退回轮询
+@app.get("/api/song_stream")
+def song_stream():
+    mids = [m.strip() for m in request.args.get("mids", "").split(",") if m.strip()]
+    mids = list(dict.fromkeys(mids))[:SONG_BATCH_LIMIT]
+    if not mids:
+        return jsonify({"error": "Missing mids"}), 400
+    
+    sub = song_events.subscribe(mids)
+    if sub is None:
+        return jsonify({"error": "Too many subscribers"}), 503
+    
+    def generate():
+        try:
+            # 断线后浏览器 5 秒后自动重连
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = sub.queue.get(timeout=SSE_HEARTBEAT)
+                except queue.Empty:
+                    # 注释行作为心跳，浏览器会忽略
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: song\ndata: {message}\n\n"
+        finally:
+            song_events.unsubscribe(sub)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# API: 树莓派转发客户端的连接池与请求统计
+@app.get("/api/pi_client/stats")
+def get_pi_client_stats():
+    return jsonify({"code": 0, "data": pi_client.pool_stats()})
+
+Gauge("rainie_sse_subscribers", "当前 SSE 连接数", fn=lambda: song_events.stats()["subscribers"])
+
+# API: 歌曲访问热度 (按需刷新的依据)
+@app.get("/api/song_heat")
+def get_song_heat():
+    try:
+        top = min(int(request.args.get("top", 20)), 200)
+    except ValueError:
+        top = 20
+    return jsonify({"code": 0, "data": song_heat.stats(top=top)})
+
+# Prometheus 抓取接口
+@app.get("/metrics")
+def metrics():
+    return Response(telemetry.render(), content_type=telemetry.CONTENT_TYPE)
+
+# API: 上游响应缓存统计
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    return jsonify({"code": 0, "data": get_response_cache().stats()})
+
 # API: 获取未来所有巡演
+# 带版本号 ETag：数据没变时浏览器/反向代理拿 304，列表本身也按版本缓存，不用每次查库重建
 @app.get("/api/upcoming-tours")
 def get_upcoming_tours():
     # 检查数据库是否存在
@@ -396,28 +1204,47 @@ def get_upcoming_tours():
         return jsonify([])
 
     try:
-        con = get_db_connection()
-        print("DEBUG: Executing query SELECT * FROM tours ORDER BY tour_date ASC")
-        # 查找所有场次，按时间排序
-        tours = con.execute(
-            "SELECT * FROM tours ORDER BY tour_date ASC"
-        ).fetchall()
-        con.close()
-        print(f"DEBUG: Found {len(tours)} tours")
-        
-        return jsonify([
-            {
-                "tour_name": tour["tour_name"],
-                "city": tour["city"],
-                "date": tour["tour_date"],
-                "venue": tour["venue"],
-                "status": tour["status"]
-            } for tour in tours
-        ])
+        version = current_tours_version()
+        etag = f"tours-{version}"
+        response = not_modified(etag, TOURS_CACHE_CONTROL)
+        if response is not None:
+            return response
+
+        tours = tours_cache.get(version)
+        if tours is None:
+            with get_db_connection() as con:
+                # 查找所有场次，按时间排序
+                rows = con.execute(
+                    "SELECT * FROM tours ORDER BY tour_date ASC"
+                ).fetchall()
+            tours = [
+                {
+                    "tour_name": tour["tour_name"],
+                    "city": tour["city"],
+                    "date": tour["tour_date"],
+                    "venue": tour["venue"],
+                    "status": tour["status"]
+                } for tour in rows
+            ]
+            tours_cache.set(version, tours)
+            logger.info(f"Loaded {len(tours)} tours (version {version})")
+
+        g.etag, g.cache_control = etag, TOURS_CACHE_CONTROL
+        g.compress_key = ("tours", version)
+        return jsonify(tours)
     except sqlite3.OperationalError:
         # 如果表不存在等数据库错误，返回空列表
         return jsonify([])
 
+def current_tours_version():
+    """tours 的版本号：优先用内存里的，超过 TOURS_VERSION_CHECK 秒才重新查库 (只读一行)"""
+    version = data_versions.get("tours", max_age=TOURS_VERSION_CHECK)
+    if version is None:
+        with get_db_connection() as con:
+            version = read_version(con, "tours")
+        data_versions.set("tours", version)
+    return version
+
 if __name__ == "__main__":
     # 总是尝试初始化（为了应对schema变更或初次运行）
     init_db()
@@ -0,0 +1,286 @@
+"""主服务器 (app.py) 接口延迟基准：真实 Flask 应用 + 假树莓派，逐级增加并发
+
+场景:
+  song_index_fresh        /api/song_index，数据新鲜 (命中缓存/SQLite)
+  song_index_stale        /api/song_index，数据过期 (返回旧数据 + 后台向树莓派拉取，假树莓派返回 404)
+  song_index_missing      /api/song_index，没有数据 (每次随机 mid，后台拉取)
+  upcoming_tours          /api/upcoming-tours
+  search_singer           /api/search_singer，同一个歌手 (命中响应缓存)
+  search_singer_uncached  /api/search_singer，每次不同歌手 (转发到树莓派)
+  update_song_stats       POST /api/update_song_stats (Worker 推送)
+
+主服务器和假树莓派各跑在独立进程里 (不和压测客户端抢 GIL)，数据库在临时目录。
+输出每个 (场景, 并发) 的 p50/p95/p99 延迟和每秒请求数，可保存为 JSON 在不同提交之间对比。
+
+用法:
+    python benchmarks/bench_http.py --concurrency 1,4,16,64 --duration 5 --output before.json
+    python benchmarks/bench_http.py --pi-latency 200 --pi-error-rate 0.1 --output after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from pathlib import Path
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import requests
+
+AUTH = {"Authorization": "Bearer rainie-forever-2026"}
+SCENARIOS = (
+    "song_index_fresh", "song_index_stale", "song_index_missing", "upcoming_tours",
+    "search_singer", "search_singer_uncached", "update_song_stats",
+)
+# 预先写入的新鲜 / 过期歌曲数
+SEEDED_SONGS = 200
+
+def _quiet(log_path):
+    """子进程的 stdout/stderr 写到文件 (请求日志不刷屏，也不影响计时)"""
+    fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+
+def run_fake_pi(ready, latency_ms, error_rate, workdir):
+    """假树莓派：搜索 / 单曲数据 / 歌词，带延迟和随机失败"""
+    _quiet(os.path.join(workdir, "fake_pi.log"))
+    from flask import Flask, jsonify, request
+    from werkzeug.serving import make_server
+
+    pi = Flask("fake_pi")
+    rng = random.Random()
+
+    def delay_and_fail():
+        time.sleep(max(0.0, rng.gauss(latency_ms, latency_ms / 4)) / 1000)
+        return rng.random() < error_rate
+
+    @pi.get("/api/search_singer")
+    def search_singer():
+        if delay_and_fail():
+            return jsonify({"code": -1, "error": "fake failure"}), 500
+        name = request.args.get("name", "")
+        songs = [{"songmid": f"fresh-{i}", "songname": f"{name} 歌曲{i}", "albummid": f"ALB{i}"} for i in range(30)]
+        return jsonify({"code": 0, "data": {"song": {"curnum": 30, "list": songs}}})
+
+    @pi.get("/api/get_data/<mid>")
+    def get_data(mid):
+        if delay_and_fail() or mid.startswith("stale-"):
+            return jsonify({"code": 1, "message": "Not found"}), 404
+        return jsonify({
+            "code": 0, "mid": mid, "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "data": {"music_index": "123,456", "global_rank": "42", "achievements": []},
+        })
+
+    @pi.get("/api/get_lyrics")
+    def get_lyrics():
+        if delay_and_fail():
+            return jsonify({"error": "fake failure"}), 500
+        return jsonify({"lyric": "[00:00.00]la la la", "trans": "", "source": "qq_music"})
+
+    server = make_server("127.0.0.1", 0, pi, threaded=True)
+    ready.put(server.server_port)
+    server.serve_forever()
+
+def run_main_server(ready, pi_url, workdir):
+    """真实的 app.py，库和缓存放在临时目录，并预先写入新鲜 / 过期的歌曲数据"""
+    _quiet(os.path.join(workdir, "server_stdout.log"))
+    os.chdir(workdir)
+    import app as server_app
+    from sqlite_pool import SQLitePool
+    from command_queue import CommandQueue
+    from chart_store import ChartStore
+    from pi_client import PiClient
+    from werkzeug.serving import make_server
+
+    server_app.DB_PATH = Path(workdir) / "room64.db"
+    server_app.HTTP_CACHE_PATH = Path(workdir) / "http_cache.db"
+    server_app.db_pool = SQLitePool(server_app.DB_PATH)
+    server_app.command_queue = CommandQueue(server_app.get_db_connection)
+    server_app.chart_store = ChartStore(Path(workdir) / "charts")
+    server_app.pi_client = PiClient(pi_url)
+    server_app.init_db()
+
+    now = time.time()
+    fresh_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+    stale_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now - server_app.SONG_STALE_AFTER - 3600))
+    data = json.dumps({"music_index": "296,407", "global_rank": "12", "index_change": "上升1.13%", "achievements": ["2026/10/01 热歌榜 当前排名10"] * 5})
+    with server_app.get_db_connection() as con:
+        con.executemany(
+            "INSERT OR REPLACE INTO song_stats_cache (mid, data, updated_at) VALUES (?, ?, ?)",
+            [(f"fresh-{i}", data, fresh_at) for i in range(SEEDED_SONGS)]
+            + [(f"stale-{i}", data, stale_at) for i in range(SEEDED_SONGS)]
+        )
+
+    server = make_server("127.0.0.1", 0, server_app.app, threaded=True)
+    ready.put(server.server_port)
+    server.serve_forever()
+
+def start_process(target, *args):
+    ctx = multiprocessing.get_context("fork")
+    ready = ctx.Queue()
+    proc = ctx.Process(target=target, args=(ready,) + args, daemon=True)
+    proc.start()
+    port = ready.get(timeout=60)
+    return proc, f"http://127.0.0.1:{port}"
+
+def make_request(scenario, session, base, rng):
+    """发一个请求，返回 (状态码, 耗时秒)"""
+    if scenario == "song_index_fresh":
+        method, url, kwargs = "GET", f"{base}/api/song_index", {"params": {"mid": f"fresh-{rng.randrange(SEEDED_SONGS)}"}}
+    elif scenario == "song_index_stale":
+        method, url, kwargs = "GET", f"{base}/api/song_index", {"params": {"mid": f"stale-{rng.randrange(SEEDED_SONGS)}"}}
+    elif scenario == "song_index_missing":
+        method, url, kwargs = "GET", f"{base}/api/song_index", {"params": {"mid": f"missing-{rng.getrandbits(48):x}"}}
+    elif scenario == "upcoming_tours":
+        method, url, kwargs = "GET", f"{base}/api/upcoming-tours", {}
+    elif scenario == "search_singer":
+        method, url, kwargs = "GET", f"{base}/api/search_singer", {"params": {"name": "杨丞琳"}}
+    elif scenario == "search_singer_uncached":
+        method, url, kwargs = "GET", f"{base}/api/search_singer", {"params": {"name": f"歌手{rng.getrandbits(48):x}"}}
+    elif scenario == "update_song_stats":
+        mid = f"fresh-{rng.randrange(SEEDED_SONGS)}"
+        payload = {"mid": mid, "scraped_at": int(time.time()), "data": {"music_index": f"{rng.randint(1, 999999):,}", "global_rank": str(rng.randint(1, 500)), "achievements": []}}
+        method, url, kwargs = "POST", f"{base}/api/update_song_stats", {"json": payload, "headers": AUTH}
+    else:
+        raise ValueError(scenario)
+    start = time.perf_counter()
+    try:
+        status = session.request(method, url, timeout=30, **kwargs).status_code
+    except requests.RequestException:
+        status = 0
+    return status, time.perf_counter() - start
+
+def percentile(values, p):
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+def run_level(scenario, concurrency, duration, warmup, base):
+    """闭环压测：concurrency 个线程各自连续发请求，持续 duration 秒 (预热期间的请求不计入)"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def client(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        session = requests.Session()
+        local, local_errors = [], 0
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            status, elapsed = make_request(scenario, session, base, rng)
+            if now < start_at:
+                continue
+            local.append(elapsed)
+            if status != 200:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    ms = lambda v: None if v is None else round(v * 1000, 2)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_table(results, previous=None):
+    before = {(r["scenario"], r["concurrency"]): r for r in (previous or {}).get("results", [])}
+    print(f"{'scenario':<24} {'conc':>4} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'err':>5}" + ("  Δp95 / Δrps" if before else ""))
+    for r in results:
+        line = (f"{r['scenario']:<24} {r['concurrency']:>4} {r['rps']:>9} {r['p50_ms']!s:>9} "
+                f"{r['p95_ms']!s:>9} {r['p99_ms']!s:>9} {r['errors']:>5}")
+        old = before.get((r["scenario"], r["concurrency"]))
+        if old and old.get("p95_ms") and old.get("rps") and r["p95_ms"] is not None:
+            line += f"  {(r['p95_ms'] / old['p95_ms'] - 1):+.0%} / {(r['rps'] / old['rps'] - 1):+.0%}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="逗号分隔的并发级别")
+    parser.add_argument("--duration", type=float, default=5, help="每个级别的计时时长 (秒)")
+    parser.add_argument("--warmup", type=float, default=1, help="每个级别开始前的预热时长 (秒)")
+    parser.add_argument("--pi-latency", type=float, default=50, help="假树莓派平均延迟 (毫秒)")
+    parser.add_argument("--pi-error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="结果保存为 JSON")
+    parser.add_argument("--compare", help="和之前保存的 JSON 对比")
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"未知场景: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",") if c]
+
+    workdir = tempfile.mkdtemp(prefix="rainie-bench-http-")
+    pi_proc, pi_url = start_process(run_fake_pi, args.pi_latency, args.pi_error_rate, workdir)
+    server_proc, base = start_process(run_main_server, pi_url, workdir)
+    try:
+        results = []
+        for scenario in scenarios:
+            for concurrency in levels:
+                result = run_level(scenario, concurrency, args.duration, args.warmup, base)
+                results.append(result)
+                print(f"  {scenario} x{concurrency}: {result['rps']} rps, p95 {result['p95_ms']} ms", file=sys.stderr)
+    finally:
+        server_proc.terminate()
+        pi_proc.terminate()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "duration": args.duration,
+            "pi_latency_ms": args.pi_latency,
+            "pi_error_rate": args.pi_error_rate,
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+    print_table(results, previous)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output} (日志在 {workdir})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""音乐指数页面解析基准：对比各解析后端的正确性、每页耗时和内存峰值
+
+样本在 benchmarks/fixtures/music_index/：<name>.html 是渲染后的页面，<name>.json 是期望的解析结果。
+  real_<mid>.*     从线上抓下来的真实页面 (用 benchmarks/capture_fixtures.py 收集，.json 需人工核对)
+  synthetic_*.*    手写的页面，覆盖 HTML 实体、缺少历史模块、验证码页等边界情况，不代表线上的实际结构
+各后端的解析结果另有 tests/test_music_index_parser.py 逐个样本检查。
+
+用法:
+    python benchmarks/bench_parser.py                    # 打印对比表
+    python benchmarks/bench_parser.py --check            # 解析结果不对或比基线慢太多时退出码非 0
+    python benchmarks/bench_parser.py --write-baseline   # 在当前机器上重新生成基线
+
+耗时基线和机器有关，换机器后先 --write-baseline 再 --check。
+"""
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import statistics
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+from music_index_parser import parse_music_index_html, available_backends
+
+FIXTURE_DIR = os.path.join(BENCH_DIR, "fixtures", "music_index")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baselines", "parser.json")
+# 比基线慢多少 (比例) 算退化
+DEFAULT_TOLERANCE = 0.5
+
+def load_fixtures():
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.html"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        expected_path = os.path.join(FIXTURE_DIR, f"{name}.json")
+        expected = None
+        if os.path.exists(expected_path):
+            with open(expected_path, encoding="utf-8") as f:
+                expected = json.load(f)
+        fixtures.append((name, html, expected))
+    return fixtures
+
+def bench_backend(backend, fixtures, repeat):
+    mismatches = []
+    for name, html, expected in fixtures:
+        if expected is not None and parse_music_index_html(html, backend) != expected:
+            mismatches.append(name)
+
+    # 每轮把所有样本解析一遍，取各轮的中位数
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _, html, _ in fixtures:
+            parse_music_index_html(html, backend)
+        rounds.append(time.perf_counter() - start)
+    ms_per_page = statistics.median(rounds) / len(fixtures) * 1000
+
+    # 内存峰值：解析最大的那个样本
+    largest = max(fixtures, key=lambda item: len(item[1]))[1]
+    tracemalloc.start()
+    parse_music_index_html(largest, backend)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "backend": backend,
+        "ms_per_page": round(ms_per_page, 3),
+        "peak_kb": round(peak / 1024, 1),
+        "mismatches": mismatches,
+    }
+
+def check(results, baseline, tolerance):
+    """返回失败原因列表"""
+    failures = []
+    for r in results:
+        if r["mismatches"]:
+            failures.append(f"{r['backend']}: 解析结果与期望不符 ({', '.join(r['mismatches'])})")
+        base = baseline.get(r["backend"])
+        if base and r["ms_per_page"] > base["ms_per_page"] * (1 + tolerance):
+            failures.append(
+                f"{r['backend']}: {r['ms_per_page']}ms/页，基线 {base['ms_per_page']}ms/页 (允许 +{tolerance:.0%})"
+            )
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", help="逗号分隔，默认当前环境可用的全部后端")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--check", action="store_true", help="和基线比较，退化时退出码为 1")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--write-baseline", action="store_true")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    if not fixtures:
+        sys.exit(f"没有样本: {FIXTURE_DIR}")
+    backends = args.backends.split(",") if args.backends else available_backends()
+    results = [bench_backend(backend, fixtures, args.repeat) for backend in backends]
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(f"{len(fixtures)} 个样本，每个后端 {args.repeat} 轮")
+        print(f"{'backend':<12} {'ms/页':>8} {'峰值KB':>9}  结果")
+        for r in results:
+            status = "OK" if not r["mismatches"] else "不符: " + ", ".join(r["mismatches"])
+            print(f"{r['backend']:<12} {r['ms_per_page']:>8} {r['peak_kb']:>9}  {status}")
+
+    if args.write_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump({r["backend"]: {"ms_per_page": r["ms_per_page"], "peak_kb": r["peak_kb"]} for r in results}, f, indent=2)
+            f.write("\n")
+        print(f"基线已写入 {BASELINE_PATH}")
+
+    if args.check:
+        baseline = {}
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH, encoding="utf-8") as f:
+                baseline = json.load(f)
+        failures = check(results, baseline, args.tolerance)
+        for failure in failures:
+            print(f"FAIL {failure}", file=sys.stderr)
+        sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
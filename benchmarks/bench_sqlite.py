@@ -0,0 +1,151 @@
+"""song_stats_cache 读吞吐基准：在持续写入 (模拟 update_song_stats) 的同时测读
+
+对比两种连接方式:
+  legacy  每次操作新开 sqlite3.connect，默认 rollback journal (改造前的 get_db_connection)
+  pooled  SQLitePool：连接复用 + WAL + busy_timeout + synchronous=NORMAL
+
+用法:
+    python benchmarks/bench_sqlite.py --seconds 5 --readers 8 --writers 1
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlite_pool import SQLitePool, BUSY_TIMEOUT_MS
+
+SONG_COUNT = 200
+
+def sample_data(i):
+    return {
+        "music_index": str(random.randint(10000, 99999)),
+        "rank_info": f"第{i}名",
+        "chart_image": f"/charts/{i:064x}.png",
+        "achievements": ["巅峰指数 90000+"] * 5,
+    }
+
+def seed(path):
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE IF NOT EXISTS song_stats_cache (mid TEXT PRIMARY KEY, data TEXT, updated_at TIMESTAMP)")
+    con.executemany(
+        "INSERT OR REPLACE INTO song_stats_cache (mid, data, updated_at) VALUES (?, ?, datetime('now', 'localtime'))",
+        [(f"mid{i:04d}", json.dumps(sample_data(i))) for i in range(SONG_COUNT)]
+    )
+    con.commit()
+    con.close()
+
+class LegacyConnections:
+    """改造前：每次新建连接，用完关闭"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def connection(self):
+        return _Closing(sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000))
+
+class _Closing:
+    def __init__(self, con):
+        self.con = con
+
+    def __enter__(self):
+        return self.con
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.con.commit()
+        else:
+            self.con.rollback()
+        self.con.close()
+
+def run(mode, seconds, readers, writers):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        seed(path)
+        db = SQLitePool(path, size=readers + writers) if mode == "pooled" else LegacyConnections(path)
+        stop = threading.Event()
+        counts = {"reads": 0, "writes": 0, "errors": 0}
+        lock = threading.Lock()
+
+        def reader():
+            n = errors = 0
+            while not stop.is_set():
+                mid = f"mid{random.randrange(SONG_COUNT):04d}"
+                try:
+                    with db.connection() as con:
+                        row = con.execute("SELECT data, updated_at FROM song_stats_cache WHERE mid = ?", (mid,)).fetchone()
+                    json.loads(row[0])
+                    n += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+            with lock:
+                counts["reads"] += n
+                counts["errors"] += errors
+
+        def writer():
+            n = errors = 0
+            while not stop.is_set():
+                i = random.randrange(SONG_COUNT)
+                try:
+                    with db.connection() as con:
+                        con.execute(
+                            "INSERT OR REPLACE INTO song_stats_cache (mid, data, updated_at) VALUES (?, ?, datetime('now', 'localtime'))",
+                            (f"mid{i:04d}", json.dumps(sample_data(i)))
+                        )
+                    n += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+                # 真实场景里 Worker 的推送间隔远大于此，这里故意写得很密
+                time.sleep(0.002)
+            with lock:
+                counts["writes"] += n
+                counts["errors"] += errors
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads += [threading.Thread(target=writer) for _ in range(writers)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        if mode == "pooled":
+            db.close_all()
+        return {
+            "mode": mode,
+            "reads_per_sec": round(counts["reads"] / seconds, 1),
+            "writes_per_sec": round(counts["writes"] / seconds, 1),
+            "errors": counts["errors"],
+        }
+    finally:
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    results = [run(mode, args.seconds, args.readers, args.writers) for mode in ("legacy", "pooled")]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'mode':<8} {'reads/s':>10} {'writes/s':>10} {'errors':>7}")
+    for r in results:
+        print(f"{r['mode']:<8} {r['reads_per_sec']:>10} {r['writes_per_sec']:>10} {r['errors']:>7}")
+    legacy, pooled = results
+    if legacy["reads_per_sec"]:
+        print(f"读吞吐提升: {pooled['reads_per_sec'] / legacy['reads_per_sec']:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""抓取真实的音乐指数页面，整理成解析器样本 (需要 Chrome / chromedriver 和能访问 QQ 音乐的网络，一般在树莓派 Worker 上跑)
+
+每首歌用 scrape_selenium 的 dom 模式抓一次 (FIXTURE_DUMP_DIR 指向临时目录)，然后:
+  benchmarks/fixtures/music_index/real_<mid>.html   渲染后的页面
+  benchmarks/fixtures/music_index/real_<mid>.json   当前解析结果 (html.parser)，作为期望值
+
+.json 是解析器自己的输出，提交前必须对照 App / H5 页面上显示的数字人工核对，不对的地方手工改正。
+被验证码拦截的页面不会保存。
+
+用法:
+    python benchmarks/capture_fixtures.py 0039MnYb0qxYhV 002Zkt5S2z8JZx
+    python benchmarks/capture_fixtures.py --force <mid>    # 覆盖已有样本
+"""
+import os
+import sys
+import glob
+import json
+import shutil
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import scrape_selenium
+from music_index_parser import parse_music_index_html
+
+FIXTURE_DIR = os.path.join(BENCH_DIR, "fixtures", "music_index")
+
+def capture(mid, dump_dir, force=False):
+    html_path = os.path.join(FIXTURE_DIR, f"real_{mid}.html")
+    json_path = os.path.join(FIXTURE_DIR, f"real_{mid}.json")
+    if os.path.exists(html_path) and not force:
+        print(f"{mid}: 已有样本，跳过 (--force 覆盖)")
+        return False
+
+    result = scrape_selenium.scrape_music_index(mid)
+    if not result or "error" in result:
+        print(f"{mid}: 抓取失败 ({(result or {}).get('error')})，不保存")
+        return False
+    dumps = sorted(glob.glob(os.path.join(dump_dir, f"{mid}-*.html")))
+    if not dumps:
+        print(f"{mid}: 没有存下页面 (是否走了 api 模式?)")
+        return False
+
+    shutil.copyfile(dumps[-1], html_path)
+    with open(html_path, encoding="utf-8") as f:
+        expected = parse_music_index_html(f.read(), "html.parser")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(expected, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"{mid}: 已保存 {os.path.basename(html_path)}，请人工核对 {os.path.basename(json_path)}")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mids", nargs="+")
+    parser.add_argument("--force", action="store_true", help="覆盖已有的同名样本")
+    args = parser.parse_args()
+
+    dump_dir = tempfile.mkdtemp(prefix="music-index-dump-")
+    scrape_selenium.FIXTURE_DUMP_DIR = dump_dir
+    scrape_selenium.EXTRACT_MODE = "dom"
+    saved = 0
+    try:
+        for mid in args.mids:
+            saved += capture(mid, dump_dir, args.force)
+    finally:
+        scrape_selenium.BROWSER_POOL.shutdown()
+        shutil.rmtree(dump_dir, ignore_errors=True)
+    print(f"共保存 {saved} 个样本")
+
+if __name__ == "__main__":
+    main()
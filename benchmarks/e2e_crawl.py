@@ -0,0 +1,255 @@
+"""端到端抓取压测：本地 QQ 音乐替身 + 主服务器 + 树莓派 Worker 跑在同一台 Linux 机器上
+
+完整走一遍真实链路:
+  主服务器 /api/worker/command -> Worker 长轮询取指令 -> fetch_song_list -> 抓取每首歌
+  -> save_data (本地库 + 推送) -> 主服务器 /api/update_song_stats -> SSE 推送
+
+输出: 每分钟歌曲数、端到端新鲜度延迟 (替身出页 -> 主服务器推送给浏览器)、整个进程树的 RSS 峰值。
+所有数据库和日志写在临时目录，不影响仓库里的 db/。
+
+用法:
+    python benchmarks/e2e_crawl.py --songs 30 --rate 600 --scraper http
+    python benchmarks/e2e_crawl.py --scraper selenium --latency 300 --captcha-rate 0.05 --json > run.json
+
+--scraper http      直接请求页面并用 music_index_parser 解析 (不需要 Chrome，测链路本身)
+--scraper selenium  用真实的 scrape_music_index + 浏览器池 (需要 Chrome / chromedriver)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import tempfile
+import threading
+import statistics
+from pathlib import Path
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import requests
+from werkzeug.serving import make_server
+from fake_qqmusic import FakeQQMusic
+
+AUTH = {"Authorization": "Bearer rainie-forever-2026"}
+
+def serve(flask_app, name):
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name=name, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+class RssSampler:
+    """定期统计本进程及所有子进程 (chromedriver / Chrome) 的 RSS，记录峰值"""
+
+    def __init__(self, interval=0.25):
+        from scrape_selenium import process_tree_rss_mb
+        self.measure = process_tree_rss_mb
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = self.measure(os.getpid())
+            if rss is not None:
+                self.peak_mb = max(self.peak_mb, rss)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+def make_http_scraper(web_base, backend):
+    """不启动浏览器的抓取函数：请求替身页面并解析"""
+    from music_index_parser import parse_music_index_html
+    from scrape_selenium import CAPTCHA_MARKERS
+    session = requests.Session()
+
+    def scrape(mid, browser=None):
+        try:
+            resp = session.get(f"{web_base}/m/client/music_index/index.html", params={"mid": mid}, timeout=30)
+        except requests.RequestException as e:
+            return {"error": str(e)}
+        if resp.status_code != 200:
+            return {"error": f"HTTP {resp.status_code}"}
+        head = resp.text[:500]
+        if any(marker in head for marker in CAPTCHA_MARKERS):
+            return {"error": "captcha", "captcha": True}
+        return parse_music_index_html(resp.text, backend)
+
+    return scrape
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="rainie-e2e-")
+    # Worker 的数据库、图片仓库、日志都是相对路径，先切到临时目录再导入
+    os.chdir(workdir)
+
+    fake = FakeQQMusic(
+        songs=args.songs, latency_ms=args.latency, jitter_ms=args.jitter,
+        error_rate=args.error_rate, captcha_rate=args.captcha_rate, change_every=args.change_every
+    )
+    fake_url = fake.start()
+
+    import app as server_app
+    import scrape_selenium
+    import raspberry_pi_worker as worker
+    from sqlite_pool import SQLitePool
+    from command_queue import CommandQueue
+    from chart_store import ChartStore
+    from pi_client import PiClient
+    from crawl_executor import TokenBucket
+
+    # --- 主服务器：库和缓存放到临时目录，上游指向替身 ---
+    server_app.DB_PATH = Path(workdir) / "room64.db"
+    server_app.HTTP_CACHE_PATH = Path(workdir) / "server_http_cache.db"
+    server_app.db_pool = SQLitePool(server_app.DB_PATH)
+    server_app.command_queue = CommandQueue(server_app.get_db_connection)
+    server_app.chart_store = ChartStore(Path(workdir) / "server_charts")
+    server_app.QQ_MUSIC_API_BASE = fake_url
+    server_app.init_db()
+
+    # --- Worker ---
+    scrape_selenium.QQ_MUSIC_WEB_BASE = fake_url
+    scrape_selenium.COOKIE_STR = ""
+    worker.QQ_MUSIC_API_BASE = fake_url
+    worker.POLL_WAIT = 5
+    worker.init_db()
+    executor = worker.crawl_executor
+    executor.concurrency = args.concurrency
+    executor.bucket = TokenBucket(args.rate / 60.0, max(1, args.concurrency))
+    coordinator = worker.crawl_coordinator
+    coordinator.list_fn = lambda: worker.fetch_song_list(count=args.songs)
+    if args.scraper == "http":
+        executor.scrape_fn = make_http_scraper(fake_url, args.parser)
+        coordinator.checkout = None
+    else:
+        scrape_selenium.EXTRACT_MODE = args.extract_mode
+
+    main_server, main_url = serve(server_app.app, "main-server")
+    pi_server, pi_url = serve(worker.app, "pi-worker")
+    worker.MAIN_SERVER_URL = main_url
+    server_app.pi_client = PiClient(pi_url)
+
+    # 以浏览器的身份订阅 SSE 推送，记录每首歌数据到达的时间
+    mids = fake.mids[:args.songs]
+    arrivals = {}
+    subscription = server_app.song_events.subscribe(mids)
+
+    def listen():
+        while True:
+            message = subscription.queue.get()
+            if message is None:
+                return
+            payload = json.loads(message)
+            arrivals.setdefault(payload["mid"], time.time())
+
+    listener = threading.Thread(target=listen, name="sse-listener", daemon=True)
+    listener.start()
+
+    sampler = RssSampler()
+    sampler.start()
+    threading.Thread(target=worker.poll_commands, name="command-poll", daemon=True).start()
+
+    # 和管理员手动全量刷新走同一条路：主服务器入队指令，Worker 长轮询取走
+    started = time.time()
+    runs_before = coordinator.status()["runs"]
+    resp = requests.post(f"{main_url}/api/worker/command", json={"command": "refresh_all"}, headers=AUTH, timeout=10)
+    resp.raise_for_status()
+    deadline = started + args.timeout
+    while time.time() < deadline:
+        status = coordinator.status()
+        if status["runs"] > runs_before and status["state"] == "idle":
+            break
+        time.sleep(0.2)
+    else:
+        print("WARN: 超时，抓取未在限定时间内结束", file=sys.stderr)
+    # 最后一条推送可能还在路上
+    time.sleep(0.5)
+    finished = time.time()
+
+    sampler.stop()
+    subscription.queue.put(None)
+    server_app.song_events.unsubscribe(subscription)
+
+    served = fake.stats()["served"]
+    lags = [arrivals[mid] - served[mid]["served_at"] for mid in mids if mid in arrivals and mid in served]
+    crawl = executor.last_stats or {}
+    main_server.shutdown()
+    pi_server.shutdown()
+    fake.stop()
+    if args.scraper == "selenium":
+        scrape_selenium.BROWSER_POOL.shutdown()
+
+    fake_stats = fake.stats()
+    return {
+        "config": {
+            "scraper": args.scraper, "songs": args.songs, "rate_per_min": args.rate,
+            "concurrency": args.concurrency, "latency_ms": args.latency, "jitter_ms": args.jitter,
+            "error_rate": args.error_rate, "captcha_rate": args.captcha_rate,
+        },
+        "wall_seconds": round(finished - started, 2),
+        "crawl": {k: crawl.get(k) for k in ("total", "succeeded", "failed", "captcha", "retries", "elapsed", "songs_per_min")},
+        "delivered": len(arrivals),
+        "freshness_lag_s": {
+            "p50": _round(percentile(lags, 50)),
+            "p95": _round(percentile(lags, 95)),
+            "max": _round(max(lags) if lags else None),
+            "mean": _round(statistics.mean(lags) if lags else None),
+        },
+        "peak_rss_mb": round(sampler.peak_mb, 1),
+        "upstream": {"requests": fake_stats["requests"], "errors": fake_stats["errors"], "captchas": fake_stats["captchas"]},
+        "workdir": workdir,
+    }
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--songs", type=int, default=30)
+    parser.add_argument("--scraper", choices=("http", "selenium"), default="http")
+    parser.add_argument("--parser", default="html.parser", help="http 模式使用的解析后端")
+    parser.add_argument("--extract-mode", choices=("api", "dom"), default="dom", help="selenium 模式的数据提取方式")
+    parser.add_argument("--rate", type=float, default=600, help="每分钟最多抓取页面数")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=50, help="替身平均延迟 (毫秒)")
+    parser.add_argument("--jitter", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--captcha-rate", type=float, default=0.0)
+    parser.add_argument("--change-every", type=int, default=60)
+    parser.add_argument("--timeout", type=float, default=900, help="整轮抓取最长等待 (秒)")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    # init_db 等会往 stdout 打日志，放到 stderr 以免混进 JSON 输出
+    with contextlib.redirect_stdout(sys.stderr):
+        result = run(args)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    crawl = result["crawl"]
+    lag = result["freshness_lag_s"]
+    print(f"抓取: {crawl['succeeded']}/{crawl['total']} 成功, 失败 {crawl['failed']}, 验证码 {crawl['captcha']}, 重试 {crawl['retries']}")
+    print(f"吞吐: {crawl['songs_per_min']} 首/分钟 (抓取耗时 {crawl['elapsed']}s, 总耗时 {result['wall_seconds']}s)")
+    print(f"新鲜度延迟 (出页 -> 浏览器收到推送): p50 {lag['p50']}s  p95 {lag['p95']}s  max {lag['max']}s  ({result['delivered']} 首送达)")
+    print(f"进程树 RSS 峰值: {result['peak_rss_mb']} MB")
+    print(f"替身请求: {result['upstream']['requests']}  错误 {result['upstream']['errors']}  验证码 {result['upstream']['captchas']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""本地 QQ 音乐替身服务 (压测 / 端到端测试用，不访问真实 QQ 音乐)
+
+提供和真实站点相同路径的:
+  /soso/fcgi-bin/client_search_cp                 搜索 (热门歌曲列表)
+  /lyric/fcgi-bin/fcg_query_lyric_new.fcg         歌词 (base64)
+  /v8/fcg-bin/fcg_v8_album_info_cp.fcg            专辑曲目
+  /m/client/music_index/index.html?mid=...        音乐指数 H5 页面 (已渲染的 DOM + 页面自己请求的数据接口)
+  /cgi-bin/musicu.fcg?mid=...                     H5 页面的数据接口 (api 模式截获它)
+  /__stats                                        替身服务自身的统计 (每首歌最近一次出页时间等)
+
+可配置延迟、错误率和验证码比例。指数每隔 --change-every 秒变化一次，便于测量数据新鲜度。
+
+用法:
+    python benchmarks/fake_qqmusic.py --port 9100 --latency 200 --jitter 100 --error-rate 0.05 --captcha-rate 0.02
+然后把 raspberry_pi_worker.QQ_MUSIC_API_BASE / app.QQ_MUSIC_API_BASE / scrape_selenium.QQ_MUSIC_WEB_BASE
+指向 http://127.0.0.1:9100 (benchmarks/e2e_crawl.py 会自动完成这些设置)
+"""
+import time
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+SINGER = "杨丞琳"
+
+def song_mid(i):
+    return f"00{hashlib.md5(str(i).encode()).hexdigest()[:12].upper()}"
+
+def song_metrics(mid, version):
+    """某首歌在某个版本 (时间片) 下的指标，同一版本内保持不变"""
+    rng = random.Random(f"{mid}:{version}")
+    index = rng.randint(50000, 500000)
+    rank = rng.randint(1, 500)
+    return {
+        "musicIndex": index,
+        "globalRank": rank,
+        "yesterdayIndex": int(index * rng.uniform(0.9, 1.1)),
+        "yesterdayRank": max(1, rank + rng.randint(-20, 20)),
+        "indexChange": round(rng.uniform(-5, 5), 2),
+        "rankChange": rng.randint(-10, 10),
+        "listenNum": rng.randint(100, 50000),
+        "updateTime": time.strftime("%Y-%m-%d %H:%M", time.localtime(version)),
+        "historyList": [
+            {"date": f"2026/{m:02d}/01", "content": f"热歌榜 当前排名{rng.randint(1, 100)} 历史在榜{1000 + m}期"}
+            for m in range(1, 6)
+        ],
+    }
+
+def change_text(value, percent):
+    if value == 0:
+        return "持平"
+    return f"{'上升' if value > 0 else '下降'}{abs(value):g}{'%' if percent else ''}"
+
+def render_page(mid, m):
+    """渲染后的 H5 页面 (结构和 music_index_parser 解析的真实页面一致)"""
+    history = "".join(
+        f'<li class="history_item" role="text"><span class="history_item_time">{h["date"]}</span>'
+        f'<div class="history_item_cont">{h["content"]}</div></li>'
+        for h in m["historyList"]
+    )
+    return f"""<!DOCTYPE html>
+<html lang="zh-CN"><head><meta charset="utf-8"><title>音乐指数</title></head>
+<body><div id="app"><div class="page_music_index">
+<div class="base_data">
+<div class="base_data_item" role="text" aria-label="实时音乐指数为{m['musicIndex']:,}"><span>{m['musicIndex']:,}</span></div>
+<div class="base_data_item" role="text" aria-label="全站排名第{m['globalRank']}名"><span>{m['globalRank']}</span></div>
+</div>
+<p class="base_update">最近更新 {m['updateTime']}</p>
+<div class="base_mini_data">
+<div class="base_mini_data__item" aria-label="昨日指数{m['yesterdayIndex']:,}"></div>
+<div class="base_mini_data__item" aria-label="较前一天{change_text(m['indexChange'], True)}"></div>
+<div class="base_mini_data__item" aria-label="昨日排名{m['yesterdayRank']}"></div>
+<div class="base_mini_data__item" aria-label="较前一天{change_text(m['rankChange'], False)}"></div>
+</div>
+<div class="listening">{m['listenNum']:,}人正在听</div>
+<section class="mod_box"><div class="box_cont"><canvas width="690" height="360"></canvas></div></section>
+<section class="mod_box"><ul class="history_list">{history}</ul></section>
+</div></div>
+<script>fetch("/cgi-bin/musicu.fcg?mid={mid}").catch(function () {{}});</script>
+</body></html>"""
+
+CAPTCHA_PAGE = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>安全验证</title></head>
+<body><div class="tcaptcha-title">请完成下列验证后继续</div></body></html>"""
+
+class FakeQQMusic:
+    def __init__(self, songs=30, latency_ms=0, jitter_ms=0, error_rate=0.0, captcha_rate=0.0, change_every=60, seed=None):
+        self.songs = songs
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.captcha_rate = captcha_rate
+        self.change_every = change_every
+        self.rng = random.Random(seed)
+        self.mids = [song_mid(i) for i in range(songs)]
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.errors = 0
+        self.captchas = 0
+        # mid -> 最近一次出页 (含数据接口) 的时间和版本
+        self.served = {}
+        self.app = self._create_app()
+        self._server = None
+
+    def version(self):
+        now = int(time.time())
+        return now - now % self.change_every
+
+    def _delay_and_fail(self, name):
+        """模拟网络延迟和随机错误，返回错误响应或 None"""
+        with self.lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+            delay = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return Response("upstream error", status=502)
+        return None
+
+    def _record(self, mid, version):
+        with self.lock:
+            self.served[mid] = {"served_at": time.time(), "version": version}
+
+    def _create_app(self):
+        app = Flask("fake_qqmusic")
+
+        @app.get("/")
+        def home():
+            return "<html><head><title>QQ音乐</title></head><body></body></html>"
+
+        @app.get("/soso/fcgi-bin/client_search_cp")
+        def search():
+            error = self._delay_and_fail("search")
+            if error:
+                return error
+            n = min(int(request.args.get("n", 20)), self.songs)
+            songs = [
+                {
+                    "songmid": mid,
+                    "songname": f"歌曲{i}",
+                    "albummid": f"ALB{i // 10:04d}",
+                    "albumname": f"专辑{i // 10}",
+                    "singer": [{"name": request.args.get("w", SINGER)}],
+                    "interval": 240,
+                }
+                for i, mid in enumerate(self.mids[:n])
+            ]
+            return jsonify({"code": 0, "data": {"song": {"curnum": n, "totalnum": self.songs, "list": songs}}})
+
+        @app.get("/lyric/fcgi-bin/fcg_query_lyric_new.fcg")
+        def lyric():
+            error = self._delay_and_fail("lyric")
+            if error:
+                return error
+            mid = request.args.get("songmid", "")
+            text = "\n".join(f"[00:{i * 5:02d}.00]{mid} 第{i + 1}句" for i in range(10))
+            return jsonify({"retcode": 0, "code": 0, "lyric": base64.b64encode(text.encode()).decode()})
+
+        @app.get("/v8/fcg-bin/fcg_v8_album_info_cp.fcg")
+        def album():
+            error = self._delay_and_fail("album")
+            if error:
+                return error
+            albummid = request.args.get("albummid", "")
+            songs = [{"songmid": song_mid(1000 + i), "songname": f"{albummid} 曲目{i + 1}"} for i in range(10)]
+            return jsonify({"code": 0, "data": {"mid": albummid, "list": songs, "total": len(songs)}})
+
+        @app.get("/m/client/music_index/index.html")
+        def music_index_page():
+            error = self._delay_and_fail("music_index")
+            if error:
+                return error
+            with self.lock:
+                captcha = self.rng.random() < self.captcha_rate
+                if captcha:
+                    self.captchas += 1
+            if captcha:
+                return CAPTCHA_PAGE
+            mid = request.args.get("mid", "")
+            version = self.version()
+            self._record(mid, version)
+            return render_page(mid, song_metrics(mid, version))
+
+        @app.get("/cgi-bin/musicu.fcg")
+        def musicu():
+            mid = request.args.get("mid", "")
+            version = self.version()
+            self._record(mid, version)
+            data = song_metrics(mid, version)
+            # 排名涨跌在接口里是带文字的字符串 (数值会被当成百分比)
+            data["rankChange"] = change_text(data["rankChange"], False)
+            return jsonify({"code": 0, "req_0": {"code": 0, "data": data}})
+
+        @app.get("/__stats")
+        def stats():
+            return jsonify(self.stats())
+
+        return app
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "errors": self.errors,
+                "captchas": self.captchas,
+                "served": dict(self.served),
+            }
+
+    def start(self, host="127.0.0.1", port=0):
+        """在后台线程启动，返回 base url"""
+        self._server = make_server(host, port, self.app, threaded=True)
+        threading.Thread(target=self._server.serve_forever, name="fake-qqmusic", daemon=True).start()
+        return f"http://{host}:{self._server.server_port}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--songs", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0, help="平均延迟 (毫秒)")
+    parser.add_argument("--jitter", type=float, default=0, help="延迟抖动 (毫秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--captcha-rate", type=float, default=0.0)
+    parser.add_argument("--change-every", type=int, default=60, help="指数每隔多少秒变化一次")
+    args = parser.parse_args()
+
+    fake = FakeQQMusic(args.songs, args.latency, args.jitter, args.error_rate, args.captcha_rate, args.change_every)
+    fake.app.run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("cache")
+
+class TTLCache:
+    """线程安全的进程内缓存: 超过 ttl 秒过期，超过 maxsize 条按 LRU 淘汰"""
+
+    def __init__(self, maxsize=512, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+class BackgroundRefresher:
+    """后台刷新器: 同一个 key 同时只跑一个任务，重复提交直接合并
+
+    cooldown: 同一个 key 两次任务之间的最小间隔 (秒)，防止上游挂掉时反复重试
+    """
+
+    def __init__(self, max_workers=2, cooldown=60, name="refresher"):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._inflight = set()
+        self._last_started = {}
+        self._last_pruned = time.monotonic()
+        self._lock = threading.Lock()
+        self.cooldown = cooldown
+        self.submitted = 0
+        self.merged = 0
+
+    def submit(self, key, fn, *args, **kwargs):
+        """提交后台任务，返回 True 表示新启动，False 表示被合并/处于冷却"""
+        now = time.monotonic()
+        with self._lock:
+            if key in self._inflight or now - self._last_started.get(key, -self.cooldown) < self.cooldown:
+                self.merged += 1
+                return False
+            self._inflight.add(key)
+            self._last_started[key] = now
+            self.submitted += 1
+            self._prune(now)
+
+        def run():
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                logger.warning(f"Background refresh for {key} failed: {e}")
+            finally:
+                with self._lock:
+                    self._inflight.discard(key)
+
+        self._executor.submit(run)
+        return True
+
+    def _prune(self, now):
+        """清掉已经过了冷却期的 key (每个冷却期最多扫一次)，否则每个 mid 一条，长期运行会一直涨"""
+        if now - self._last_pruned < self.cooldown:
+            return
+        self._last_pruned = now
+        expired = [key for key, started in self._last_started.items() if now - started >= self.cooldown]
+        for key in expired:
+            del self._last_started[key]
+
+    def stats(self):
+        with self._lock:
+            return {"inflight": len(self._inflight), "submitted": self.submitted, "merged": self.merged}
+
+class SingleFlight:
+    """合并并发的相同请求: 同一个 key 同时只执行一次，其他调用方等待并共享结果 (或异常)"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """返回 (结果, 是否为共享结果)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = {"event": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+                leader = True
+                self.executed += 1
+            else:
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"], True
+
+        try:
+            call["result"] = fn(*args, **kwargs)
+            return call["result"], False
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["event"].set()
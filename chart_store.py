@@ -0,0 +1,68 @@
+import os
+import re
+import base64
+import hashlib
+import tempfile
+from pathlib import Path
+
+# 走势图截图的 data URI 前缀 (scrape_selenium 生成的格式)
+DATA_URI_PREFIX = "data:image/png;base64,"
+# 对外的访问路径: /charts/<sha256>.png
+CHART_URL_PREFIX = "/charts/"
+CHART_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+class ChartStore:
+    """按内容哈希存储走势图 PNG 的文件仓库
+
+    同一张图只存一份: 路径为 <root>/<hash 前两位>/<hash>.png，
+    JSON 里只保留 /charts/<hash>.png 这样的短链接。
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path_for(self, digest):
+        return self.root / digest[:2] / f"{digest}.png"
+
+    def exists(self, digest):
+        return bool(CHART_HASH_RE.match(digest or "")) and self.path_for(digest).exists()
+
+    def put_bytes(self, data):
+        """写入 PNG 字节，返回 sha256；已存在则直接返回"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+        if path.exists():
+            return digest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再原子替换，避免并发读到半张图
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+
+    def read_bytes(self, digest):
+        return self.path_for(digest).read_bytes()
+
+    def externalize(self, data):
+        """把结果字典里内嵌的 base64 图片移到仓库，返回 (新字典, 图片哈希)
+
+        chart_image 被替换为 /charts/<hash>.png，同时写入 chart_hash；
+        没有内嵌图片时原样返回 (已经是链接的保留原值)
+        """
+        image = data.get("chart_image") if isinstance(data, dict) else None
+        if not image or not image.startswith(DATA_URI_PREFIX):
+            return data, (data.get("chart_hash") if isinstance(data, dict) else None)
+        digest = self.put_bytes(base64.b64decode(image[len(DATA_URI_PREFIX):]))
+        data = dict(data)
+        data["chart_image"] = chart_url(digest)
+        data["chart_hash"] = digest
+        return data, digest
+
+def chart_url(digest):
+    return f"{CHART_URL_PREFIX}{digest}.png"
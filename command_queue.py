@@ -0,0 +1,119 @@
+import json
+import time
+import threading
+
+# 指令被取走后多少秒内没有确认 (ack)，就重新投递
+LEASE_SECONDS = 300
+# 同一条指令最多投递次数，超过则标记为 dead 不再投递
+MAX_ATTEMPTS = 5
+# 已完成的指令保留多久 (秒)，便于排查
+DONE_RETENTION = 86400
+
+def migrate_command_times(con):
+    """旧版本把 created_at 存成本地时间的 isoformat 字符串，统一成和 lease_until / acked_at 一样的 unix 秒"""
+    con.execute(
+        "UPDATE worker_commands SET created_at = CAST(strftime('%s', created_at, 'utc') AS REAL) "
+        "WHERE typeof(created_at) = 'text' AND strftime('%s', created_at, 'utc') IS NOT NULL"
+    )
+
+class CommandQueue:
+    """基于 SQLite 的 Worker 指令队列 (表结构见 db/schema.sql 的 worker_commands)
+
+    - enqueue: 持久化入队，相同 dedup_key 同时只保留一条待处理指令
+    - lease: 取出最早的待处理指令并加租约，支持长轮询 (有新指令立刻返回)
+    - ack: Worker 处理后确认；租约到期未确认的指令会重新投递
+    """
+
+    def __init__(self, connection, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        # 返回连接上下文管理器的函数 (如 SQLitePool.connection)
+        self.connection = connection
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._cond = threading.Condition()
+
+    def enqueue(self, command, params=None, dedup_key=None):
+        """入队，返回 (指令 id, 是否新建)；已有相同 dedup_key 的待处理指令时返回它的 id"""
+        now = time.time()
+        with self.connection() as con:
+            con.execute("BEGIN IMMEDIATE")
+            if dedup_key:
+                row = con.execute(
+                    "SELECT id FROM worker_commands WHERE dedup_key = ? AND status = 'pending'",
+                    (dedup_key,)
+                ).fetchone()
+                if row:
+                    con.rollback()
+                    return row[0], False
+            cur = con.execute(
+                "INSERT INTO worker_commands (command, params, dedup_key, status, created_at) VALUES (?, ?, ?, 'pending', ?)",
+                (command, json.dumps(params or {}), dedup_key, now)
+            )
+            command_id = cur.lastrowid
+            con.execute(
+                "DELETE FROM worker_commands WHERE status IN ('done', 'dead') AND acked_at < ?",
+                (time.time() - DONE_RETENTION,)
+            )
+        with self._cond:
+            self._cond.notify_all()
+        return command_id, True
+
+    def _lease_one(self):
+        now = time.time()
+        with self.connection() as con:
+            con.execute("BEGIN IMMEDIATE")
+            # 投递次数用完的过期租约不再投递
+            con.execute(
+                "UPDATE worker_commands SET status = 'dead', acked_at = ? WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            )
+            row = con.execute("""
+                SELECT id, command, params, created_at, attempts FROM worker_commands
+                WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?)
+                ORDER BY id LIMIT 1
+            """, (now,)).fetchone()
+            if not row:
+                return None
+            con.execute(
+                "UPDATE worker_commands SET status = 'leased', lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (now + self.lease_seconds, row[0])
+            )
+        return {
+            "id": row[0],
+            "command": row[1],
+            "params": json.loads(row[2] or "{}"),
+            "timestamp": row[3],
+            "attempt": row[4] + 1,
+        }
+
+    def lease(self, wait=0):
+        """取一条指令；队列为空时最多阻塞 wait 秒等待新指令"""
+        deadline = time.monotonic() + wait
+        while True:
+            # 先拿到条件锁再查库，避免错过查询和等待之间的 notify
+            with self._cond:
+                item = self._lease_one()
+                if item is not None:
+                    return item
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def ack(self, command_id):
+        """确认指令已处理，返回是否确认成功"""
+        with self.connection() as con:
+            cur = con.execute(
+                "UPDATE worker_commands SET status = 'done', acked_at = ? WHERE id = ? AND status = 'leased'",
+                (time.time(), command_id)
+            )
+            return cur.rowcount > 0
+
+    def depth(self):
+        """待处理 + 已投递未确认的指令数"""
+        with self.connection() as con:
+            rows = con.execute(
+                "SELECT status, COUNT(*) FROM worker_commands WHERE status IN ('pending', 'leased') GROUP BY status"
+            ).fetchall()
+        counts = {"pending": 0, "leased": 0}
+        counts.update({status: count for status, count in rows})
+        return counts
@@ -0,0 +1,398 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+from contextlib import nullcontext
+from telemetry import Counter, Gauge, Histogram
+
+logger = logging.getLogger("crawl")
+
+# === 默认配置 (树莓派) ===
+# 同时抓取的歌曲数 (每个并发占用一个浏览器，需 <= 浏览器池大小才能真正并行)
+CRAWL_CONCURRENCY = 1
+# 对 y.qq.com 的全局速率上限: 每分钟最多打开多少个页面
+CRAWL_RATE_PER_MIN = 20
+# 令牌桶容量 (允许的瞬时突发)
+CRAWL_BURST = 2
+# 失败歌曲最多重试次数 (重新排到队尾)
+CRAWL_MAX_RETRIES = 1
+# 出错后的退避: base * 2^(连续失败次数-1)，上限 max，验证码页面再乘 CAPTCHA_BACKOFF_FACTOR
+BACKOFF_BASE = 5
+BACKOFF_MAX = 300
+CAPTCHA_BACKOFF_FACTOR = 4
+
+# --- 指标 (Worker 的 /metrics) ---
+CRAWL_RUN_SECONDS = Histogram(
+    "rainie_crawl_run_duration_seconds", "一轮抓取的总耗时",
+    buckets=(10, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200)
+)
+CRAWL_RUNS = Counter("rainie_crawl_runs_total", "完成的抓取轮数")
+SCRAPE_SECONDS = Histogram(
+    "rainie_scrape_duration_seconds", "单首歌抓取耗时 (不含限速和退避等待)", ["result"],
+    buckets=(0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60)
+)
+SCRAPED_SONGS = Counter("rainie_scraped_songs_total", "抓取结果 (ok / error / captcha，重试的每次都算)", ["result"])
+LAST_RUN_SUCCESS_RATIO = Gauge("rainie_crawl_last_run_success_ratio", "上一轮抓取的成功率 (成功数 / 歌曲数)")
+LAST_RUN_SONGS_PER_MIN = Gauge("rainie_crawl_last_run_songs_per_minute", "上一轮抓取的吞吐")
+
+class TokenBucket:
+    """线程安全的令牌桶: 以 rate 个/秒 的速度补充，最多攒 capacity 个"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """取一个令牌，没有则阻塞等待；返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+class CrawlExecutor:
+    """有界并发的抓取执行器
+
+    - concurrency 个工作线程从共享队列取歌曲
+    - 每次打开页面前先从全局令牌桶取令牌，保证对 y.qq.com 的总速率不超限
+    - 遇到错误/验证码时全体暂停一段带抖动的指数退避时间
+    - 每轮结束返回吞吐统计
+    """
+
+    def __init__(self, scrape_fn, save_fn, concurrency=CRAWL_CONCURRENCY,
+                 rate_per_min=CRAWL_RATE_PER_MIN, burst=CRAWL_BURST,
+                 max_retries=CRAWL_MAX_RETRIES):
+        self.scrape_fn = scrape_fn
+        self.save_fn = save_fn
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(rate_per_min / 60.0, burst)
+        self.max_retries = max_retries
+        self.last_stats = None
+        self._lock = threading.Lock()
+        self._pause_until = 0.0
+        self._consecutive_failures = 0
+
+    def _backoff(self, captcha=False):
+        """记录一次失败，并让所有工作线程暂停一段时间"""
+        with self._lock:
+            self._consecutive_failures += 1
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self._consecutive_failures - 1))
+            if captcha:
+                delay = min(BACKOFF_MAX, delay * CAPTCHA_BACKOFF_FACTOR)
+            # 抖动: 取 [delay/2, delay]，避免多个线程同时恢复
+            delay = random.uniform(delay / 2, delay)
+            self._pause_until = max(self._pause_until, time.monotonic() + delay)
+        logger.warning(f"{'遇到验证码' if captcha else '抓取出错'}，退避 {delay:.1f} 秒")
+
+    def _wait_if_paused(self):
+        while True:
+            with self._lock:
+                remaining = self._pause_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def run(self, mids, checkout=None, next_priority=None, on_progress=None):
+        """抓取一批歌曲，阻塞直到完成，返回本轮统计
+
+        checkout: 可选，返回上下文管理器的函数 (如 BROWSER_POOL.checkout)，
+                  每个工作线程整轮占用一个浏览器
+        next_priority: 可选，无参函数，返回需要插队的 mid (没有则返回 None)
+        on_progress: 可选，每完成一首歌回调 on_progress(stats)
+        """
+        pending = deque((mid, 0) for mid in dict.fromkeys(mids))
+        stats = {
+            "total": len(pending),
+            "succeeded": 0,
+            "failed": 0,
+            "captcha": 0,
+            "retries": 0,
+            "priority": 0,
+            "failed_mids": [],
+            "started_at": time.time(),
+        }
+        started = time.monotonic()
+        with self._lock:
+            self._consecutive_failures = 0
+
+        def take():
+            if next_priority is not None:
+                mid = next_priority()
+                if mid:
+                    with self._lock:
+                        stats["total"] += 1
+                        stats["priority"] += 1
+                    return mid, self.max_retries  # 插队的歌不再重试
+            with self._lock:
+                return pending.popleft() if pending else (None, 0)
+
+        def handle(mid, attempt, browser):
+            self._wait_if_paused()
+            self.bucket.acquire()
+            logger.info(f"正在爬取: {mid}")
+            scrape_started = time.monotonic()
+            try:
+                data = self.scrape_fn(mid, browser=browser)
+            except Exception as e:
+                data = {"error": str(e)}
+            ok = bool(data) and "error" not in data
+            captcha = not ok and bool(data and data.get("captcha"))
+            result = "ok" if ok else "captcha" if captcha else "error"
+            SCRAPE_SECONDS.observe(time.monotonic() - scrape_started, result=result)
+            SCRAPED_SONGS.inc(result=result)
+
+            if ok:
+                self.save_fn(mid, data)
+                with self._lock:
+                    stats["succeeded"] += 1
+                    self._consecutive_failures = 0
+                return
+
+            logger.error(f"爬取失败: {mid} - {data.get('error') if data else 'empty result'}")
+            self._backoff(captcha=captcha)
+            with self._lock:
+                if captcha:
+                    stats["captcha"] += 1
+                if attempt < self.max_retries:
+                    stats["retries"] += 1
+                    pending.append((mid, attempt + 1))
+                else:
+                    stats["failed"] += 1
+                    stats["failed_mids"].append(mid)
+
+        def work():
+            with (checkout() if checkout else nullcontext()) as browser:
+                while True:
+                    mid, attempt = take()
+                    if mid is None:
+                        return
+                    try:
+                        handle(mid, attempt, browser)
+                    except Exception as e:
+                        logger.error(f"任务异常: {e}")
+                    if on_progress:
+                        on_progress(stats)
+
+        threads = [
+            threading.Thread(target=work, name=f"crawl-{i}", daemon=True)
+            for i in range(min(self.concurrency, max(1, len(pending))))
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        elapsed = time.monotonic() - started
+        stats["elapsed"] = round(elapsed, 2)
+        stats["songs_per_min"] = round(stats["succeeded"] * 60 / elapsed, 2) if elapsed > 0 else 0
+        self.last_stats = stats
+        CRAWL_RUN_SECONDS.observe(elapsed)
+        CRAWL_RUNS.inc()
+        if stats["total"]:
+            LAST_RUN_SUCCESS_RATIO.set(stats["succeeded"] / stats["total"])
+        LAST_RUN_SONGS_PER_MIN.set(stats["songs_per_min"])
+        logger.info(
+            f"本轮吞吐: 成功 {stats['succeeded']}/{stats['total']}，失败 {stats['failed']}，"
+            f"验证码 {stats['captcha']}，耗时 {stats['elapsed']} 秒，{stats['songs_per_min']} 首/分钟"
+        )
+        return stats
+
+# 全量刷新开始后多少秒内收到的新请求直接合并进当前这一轮 (歌单还没怎么跑，结果就是新的)
+# 超过这个时间则只排队一次后续全量刷新
+MERGE_WINDOW = 60
+
+class CrawlCoordinator:
+    """单飞 (single-flight) 抓取协调器
+
+    所有全量/单曲刷新请求都交给它，同一时间只有一轮抓取在跑:
+    - 空闲时收到全量刷新: 立即开始
+    - 运行中收到全量刷新: 刚开始不久则合并进当前轮，否则排队一次后续轮 (多次请求也只排一次)
+    - 单曲刷新: 放进高优先级队列，在当前轮的下一首之前插队执行
+    - 按需刷新 (服务器按访问热度下发的一批歌): 按优先级插队，排在单曲刷新之后、当前轮剩余歌曲之前
+    - 部分刷新 (自适应调度只抓到期的歌，传入自己的 list_fn): 排队中的部分刷新遇到全量请求会升级为全量，
+      正在跑的部分刷新不会吞掉全量请求
+    """
+
+    def __init__(self, list_fn, executor, checkout=None):
+        self.list_fn = list_fn
+        self.executor = executor
+        self.checkout = checkout
+        self._cond = threading.Condition()
+        self._thread = None
+        self._bulk_requested = False
+        self._priority = deque()
+        # 按需刷新: mid -> 优先级 (越大越先)
+        self._demand = {}
+        self._running = False
+        self._run_started = None
+        self._run_source = None
+        self._progress = None
+        self._pending_source = None
+        # 排队中的这一轮用哪个歌单函数 (None 表示全量 self.list_fn)；正在跑的这一轮是否全量
+        self._pending_list_fn = None
+        self._run_full = False
+        self.runs = 0
+        self.merged = 0
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="crawl-coordinator", daemon=True)
+            self._thread.start()
+
+    def request_refresh_all(self, source="manual", list_fn=None):
+        """请求一次全量刷新，返回 started / merged / queued
+
+        list_fn: 可选，只抓它返回的歌曲 (部分刷新)，默认用 self.list_fn 抓全量
+        """
+        with self._cond:
+            self._ensure_thread()
+            if self._bulk_requested:
+                # 已经有一轮在排队，合并进去 (全量请求把排队的部分刷新升级为全量)
+                if list_fn is None and self._pending_list_fn is not None:
+                    self._pending_list_fn = None
+                    self._pending_source = source
+                self.merged += 1
+                outcome = "merged"
+            elif not self._running:
+                self._bulk_requested = True
+                self._pending_source = source
+                self._pending_list_fn = list_fn
+                self._cond.notify_all()
+                outcome = "started"
+            elif time.time() - self._run_started < MERGE_WINDOW and (self._run_full or list_fn is not None):
+                self.merged += 1
+                outcome = "merged"
+            else:
+                self._bulk_requested = True
+                self._pending_source = source
+                self._pending_list_fn = list_fn
+                outcome = "queued"
+        logger.info(f"{'全量' if list_fn is None else '部分'}刷新请求 ({source}): {outcome}")
+        return outcome
+
+    def request_refresh_one(self, mid, source="manual"):
+        """请求刷新单首歌曲 (高优先级插队)，返回 queued / merged"""
+        with self._cond:
+            self._ensure_thread()
+            if mid in self._priority:
+                self.merged += 1
+                outcome = "merged"
+            else:
+                self._demand.pop(mid, None)
+                self._priority.append(mid)
+                self._cond.notify_all()
+                outcome = "queued"
+        logger.info(f"单曲刷新请求 ({source}): {mid} {outcome}")
+        return outcome
+
+    def request_refresh_songs(self, songs, source="manual"):
+        """请求按优先级刷新一批歌曲 songs=[(mid, 优先级)]，返回新加入的首数 (已在队列里的取较高优先级)"""
+        added = 0
+        with self._cond:
+            self._ensure_thread()
+            for mid, priority in songs:
+                if mid in self._priority:
+                    continue
+                if mid in self._demand:
+                    self._demand[mid] = max(self._demand[mid], priority)
+                    self.merged += 1
+                else:
+                    self._demand[mid] = priority
+                    added += 1
+            if added:
+                self._cond.notify_all()
+        logger.info(f"按需刷新请求 ({source}): {len(songs)} 首，新加入 {added} 首")
+        return added
+
+    def _pop_priority(self):
+        with self._cond:
+            if self._priority:
+                return self._priority.popleft()
+            if self._demand:
+                mid = max(self._demand, key=self._demand.get)
+                del self._demand[mid]
+                return mid
+            return None
+
+    def _on_progress(self, stats):
+        with self._cond:
+            self._progress = {
+                "total": stats["total"],
+                "done": stats["succeeded"] + stats["failed"],
+                "succeeded": stats["succeeded"],
+                "failed": stats["failed"],
+            }
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._bulk_requested and not self._priority and not self._demand:
+                    self._cond.wait()
+                bulk = self._bulk_requested
+                list_fn = self._pending_list_fn or self.list_fn
+                self._run_full = bulk and self._pending_list_fn is None
+                self._bulk_requested = False
+                self._pending_list_fn = None
+                self._running = True
+                self._run_started = time.time()
+                self._run_source = self._pending_source if bulk else "refresh_one"
+                self._progress = {"total": 0, "done": 0, "succeeded": 0, "failed": 0}
+                source = self._run_source
+
+            logger.info(f"协调器开始新一轮抓取 (来源: {source}, 全量: {bulk})")
+            try:
+                mids = list_fn() if bulk else []
+                if bulk and not mids:
+                    if self._run_full:
+                        logger.warning("未能获取到歌曲列表，跳过本次全量刷新")
+                    else:
+                        logger.info("没有需要抓取的歌曲，跳过本次部分刷新")
+                self.executor.run(
+                    mids,
+                    checkout=self.checkout,
+                    next_priority=self._pop_priority,
+                    on_progress=self._on_progress
+                )
+            except Exception as e:
+                logger.error(f"抓取轮次异常: {e}")
+            finally:
+                with self._cond:
+                    self._running = False
+                    self._run_full = False
+                    self.runs += 1
+            logger.info("本轮任务结束")
+
+    def status(self):
+        """当前状态 (idle / running / queued)、进度和上一轮统计"""
+        with self._cond:
+            if self._running:
+                state = "running"
+            else:
+                state = "queued" if (self._bulk_requested or self._priority or self._demand) else "idle"
+            return {
+                "state": state,
+                "follow_up_queued": self._bulk_requested and self._running,
+                "full_run": self._run_full if self._running else None,
+                "priority_queue": list(self._priority),
+                "demand_queue": sorted(self._demand.items(), key=lambda item: item[1], reverse=True),
+                "source": self._run_source if self._running else None,
+                "started_at": self._run_started if self._running else None,
+                "progress": self._progress if self._running else None,
+                "runs": self.runs,
+                "merged_requests": self.merged,
+                "last_run": self.executor.last_stats,
+            }
@@ -0,0 +1,165 @@
+import math
+import time
+from song_metrics import parse_metrics
+
+# 每首歌的下次抓取时间：指标变化越大、被查看越多，间隔越短；连续没变化则指数退避到上限
+SCHEDULE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawl_schedule (
+    mid TEXT PRIMARY KEY,
+    next_due INTEGER NOT NULL,            -- 下次应抓取的时间 (unix 秒)
+    interval INTEGER NOT NULL,            -- 当前抓取间隔 (秒)
+    unchanged_streak INTEGER NOT NULL DEFAULT 0,  -- 连续几次抓取指标没变
+    volatility REAL NOT NULL DEFAULT 0,   -- 指标变化幅度的指数滑动平均
+    view_heat REAL NOT NULL DEFAULT 0,    -- 查看热度 (按 VIEW_HALF_LIFE 衰减的查看次数)
+    last_viewed INTEGER,
+    last_scraped INTEGER,
+    last_changed INTEGER,
+    listed INTEGER NOT NULL DEFAULT 0     -- 是否在当前热门歌单里
+)
+"""
+
+# 抓取间隔: 有变化时回到 BASE，每连续一次没变化翻倍，上限 MAX (不低于原来一天两次的保底)
+SCHEDULE_MIN_INTERVAL = 1800
+SCHEDULE_BASE_INTERVAL = 2 * 3600
+SCHEDULE_MAX_INTERVAL = 12 * 3600
+# 指数或排名的相对变化超过多少算"变了"
+CHANGE_THRESHOLD = 0.001
+# 波动率滑动平均的权重 (越大越看重最近一次)
+VOLATILITY_ALPHA = 0.3
+# 波动率对间隔的缩短力度: 间隔 / (1 + VOLATILITY_WEIGHT * volatility)，2% 的波动大约减半
+VOLATILITY_WEIGHT = 50
+# 查看热度半衰期 (秒)
+VIEW_HALF_LIFE = 6 * 3600
+# 选中抓取后先把下次时间推后这么久，抓取失败的歌不会每轮都排在最前面
+LEASE_SECONDS = SCHEDULE_MIN_INTERVAL
+# 不在歌单里、也多久没人看的歌从调度表里移除 (秒)
+UNLISTED_TTL = 7 * 86400
+
+def decayed_heat(heat, last_viewed, now):
+    if not heat or not last_viewed:
+        return 0.0
+    return heat * 0.5 ** (max(0, now - last_viewed) / VIEW_HALF_LIFE)
+
+def change_score(prev, cur):
+    """两次抓取之间指数和排名的相对变化之和；任一次缺数据时返回 None"""
+    parts = []
+    for field in ("music_index", "global_rank"):
+        before, after = prev.get(field), cur.get(field)
+        if before is None or after is None:
+            continue
+        parts.append(abs(after - before) / max(abs(before), 1))
+    return sum(parts) if parts else None
+
+def next_interval(streak, volatility, heat):
+    interval = SCHEDULE_BASE_INTERVAL * 2 ** streak
+    interval /= 1 + VOLATILITY_WEIGHT * volatility
+    interval /= 1 + math.log1p(heat)
+    return int(min(SCHEDULE_MAX_INTERVAL, max(SCHEDULE_MIN_INTERVAL, interval)))
+
+def init_schedule_table(con):
+    con.execute(SCHEDULE_SCHEMA)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_crawl_schedule_due ON crawl_schedule (next_due)")
+
+def _ensure(con, mid, now):
+    """新歌立即到期"""
+    con.execute(
+        "INSERT OR IGNORE INTO crawl_schedule (mid, next_due, interval) VALUES (?, ?, ?)",
+        (mid, now, SCHEDULE_BASE_INTERVAL)
+    )
+
+def sync_listed(con, mids, now=None):
+    """用最新的热门歌单更新调度表: 新歌加入并立即到期，掉出歌单又长期没人看的歌移除"""
+    now = int(time.time()) if now is None else now
+    con.execute("UPDATE crawl_schedule SET listed = 0")
+    for mid in mids:
+        _ensure(con, mid, now)
+        con.execute("UPDATE crawl_schedule SET listed = 1 WHERE mid = ?", (mid,))
+    con.execute(
+        "DELETE FROM crawl_schedule WHERE listed = 0 AND COALESCE(last_viewed, last_scraped, 0) < ?",
+        (now - UNLISTED_TTL,)
+    )
+
+def record_view(con, mid, weight=1.0, now=None):
+    """记一次查看 (服务器来拉数据 / 单曲刷新)，并按新的热度把下次抓取时间提前"""
+    now = int(time.time()) if now is None else now
+    _ensure(con, mid, now)
+    row = con.execute(
+        "SELECT view_heat, last_viewed, unchanged_streak, volatility, last_scraped FROM crawl_schedule WHERE mid = ?",
+        (mid,)
+    ).fetchone()
+    heat, last_viewed, streak, volatility, last_scraped = row
+    heat = decayed_heat(heat, last_viewed, now) + weight
+    interval = next_interval(streak, volatility, heat)
+    # 只会提前，不会推后
+    next_due = (last_scraped or now) + interval
+    con.execute("""
+        UPDATE crawl_schedule SET view_heat = ?, last_viewed = ?, interval = ?, next_due = MIN(next_due, ?)
+        WHERE mid = ?
+    """, (heat, now, interval, next_due, mid))
+
+def record_scrape(con, mid, data, now=None):
+    """抓取成功后更新调度 (需在本次结果写入指标历史之前调用，要和上一次抓取比较)
+
+    返回本次的变化幅度 (没有上一次可比时为 None)
+    """
+    now = int(time.time()) if now is None else now
+    _ensure(con, mid, now)
+    prev = con.execute(
+        "SELECT music_index, global_rank FROM song_metrics_history WHERE mid = ? ORDER BY ts DESC LIMIT 1", (mid,)
+    ).fetchone()
+    score = None
+    if prev is not None:
+        score = change_score({"music_index": prev[0], "global_rank": prev[1]}, parse_metrics(data))
+    row = con.execute(
+        "SELECT unchanged_streak, volatility, view_heat, last_viewed, last_changed FROM crawl_schedule WHERE mid = ?",
+        (mid,)
+    ).fetchone()
+    streak, volatility, heat, last_viewed, last_changed = row
+    if score is not None:
+        volatility = VOLATILITY_ALPHA * score + (1 - VOLATILITY_ALPHA) * volatility
+        if score > CHANGE_THRESHOLD:
+            streak, last_changed = 0, now
+        else:
+            streak += 1
+    interval = next_interval(streak, volatility, decayed_heat(heat, last_viewed, now))
+    con.execute("""
+        UPDATE crawl_schedule
+        SET unchanged_streak = ?, volatility = ?, interval = ?, next_due = ?, last_scraped = ?, last_changed = ?
+        WHERE mid = ?
+    """, (streak, volatility, interval, now + interval, now, last_changed, mid))
+    return score
+
+def take_due(con, budget, now=None):
+    """取出最多 budget 首已到期的歌 (最可能有变化的在前)，并暂时把它们的下次时间推后 LEASE_SECONDS
+
+    优先级 = 逾期程度 (逾期时长 / 间隔) × (1 + 波动率权重) × (1 + 查看热度)
+    """
+    now = int(time.time()) if now is None else now
+    rows = con.execute(
+        "SELECT mid, next_due, interval, volatility, view_heat, last_viewed FROM crawl_schedule WHERE next_due <= ?",
+        (now,)
+    ).fetchall()
+
+    def priority(row):
+        mid, next_due, interval, volatility, heat, last_viewed = row
+        overdue = 1 + (now - next_due) / max(interval, 1)
+        return overdue * (1 + VOLATILITY_WEIGHT * volatility) * (1 + math.log1p(decayed_heat(heat, last_viewed, now)))
+
+    chosen = [row[0] for row in sorted(rows, key=priority, reverse=True)[:budget]]
+    con.executemany(
+        "UPDATE crawl_schedule SET next_due = ? WHERE mid = ?", [(now + LEASE_SECONDS, mid) for mid in chosen]
+    )
+    return chosen
+
+def schedule_snapshot(con, now=None):
+    """调度表当前状态 (按下次抓取时间排序)"""
+    now = int(time.time()) if now is None else now
+    rows = con.execute("SELECT * FROM crawl_schedule ORDER BY next_due").fetchall()
+    songs = []
+    for row in rows:
+        song = dict(row)
+        song["view_heat"] = round(decayed_heat(row["view_heat"], row["last_viewed"], now), 3)
+        song["volatility"] = round(row["volatility"], 5)
+        song["due_in"] = row["next_due"] - now
+        songs.append(song)
+    return songs
@@ -0,0 +1,58 @@
+import time
+import threading
+
+# 数据版本号：每次改动某类数据 (如 tours) 时在同一个事务里加一，
+# 服务器据此生成 ETag，不用比对数据本身。update_db.py 等独立脚本改数据时也要调用 bump_version
+VERSIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS data_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+)
+"""
+
+def init_versions_table(con):
+    con.execute(VERSIONS_SCHEMA)
+
+def bump_version(con, name):
+    """在调用方的事务里把 name 的版本号加一 (没有则从 1 开始)，返回新版本号"""
+    con.execute(VERSIONS_SCHEMA)
+    con.execute("""
+        INSERT INTO data_versions (name, version, updated_at) VALUES (?, 1, ?)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at
+    """, (name, time.time()))
+    return read_version(con, name)
+
+def read_version(con, name):
+    row = con.execute("SELECT version FROM data_versions WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+class VersionMap:
+    """进程内的版本表 (key -> 版本)，线程安全；条件请求 (If-None-Match) 靠它判断，不用查库
+
+    max_age: 读取时可以要求版本是多少秒内确认过的，过期返回 None，由调用方重新从库里读
+    (用于会被其他进程修改的数据)
+    """
+
+    def __init__(self):
+        self._versions = {}    # key -> (版本, 写入时间)
+        self._lock = threading.Lock()
+
+    def get(self, key, max_age=None):
+        with self._lock:
+            item = self._versions.get(key)
+        if item is None or (max_age is not None and time.monotonic() - item[1] > max_age):
+            return None
+        return item[0]
+
+    def set(self, key, version):
+        with self._lock:
+            self._versions[key] = (version, time.monotonic())
+
+    def discard(self, key):
+        with self._lock:
+            self._versions.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._versions)
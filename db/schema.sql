@@ -14,3 +14,18 @@ CREATE TABLE IF NOT EXISTS tours (
     venue TEXT,              -- 场馆
     status TEXT DEFAULT 'scheduled' -- scheduled, completed, cancelled
 );
+
+-- Worker 指令队列 (持久化，重启不丢)
+CREATE TABLE IF NOT EXISTS worker_commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    command TEXT NOT NULL,
+    params TEXT,                      -- JSON
+    dedup_key TEXT,                   -- 相同 key 同时只保留一条 pending 指令
+    status TEXT NOT NULL DEFAULT 'pending', -- pending, leased, done, dead
+    created_at REAL NOT NULL,         -- 入队时间 (unix 秒)
+    lease_until REAL,                 -- 租约到期时间 (unix 秒)，过期未确认则重新投递
+    attempts INTEGER NOT NULL DEFAULT 0,
+    acked_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_worker_commands_status ON worker_commands (status, id);
+CREATE INDEX IF NOT EXISTS idx_worker_commands_dedup ON worker_commands (dedup_key, status);
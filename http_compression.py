@@ -0,0 +1,27 @@
+import gzip
+
+# 小于这个大小的响应不压缩 (gzip 头尾本身就有 ~20 字节，小响应压缩不划算)
+GZIP_MIN_SIZE = 1024
+# 压缩级别: 6 是 gzip 默认值，再高体积几乎不变但更费 CPU
+GZIP_LEVEL = 6
+
+def accepts_gzip(accept_encoding):
+    """按 Accept-Encoding 判断客户端是否接受 gzip (q=0 表示明确拒绝，明确写了 gzip 的优先于 *)"""
+    qualities = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding.strip().lower()] = q
+    q = qualities.get("gzip", qualities.get("*", 0.0))
+    return q > 0
+
+def gzip_bytes(data, level=GZIP_LEVEL):
+    # mtime=0: 同样的内容压出同样的字节，方便缓存和对比
+    return gzip.compress(data, compresslevel=level, mtime=0)
@@ -0,0 +1,261 @@
+"""QQ 音乐指数 H5 页面 (渲染后的 HTML) 解析，不依赖浏览器
+
+parse_music_index_html(html, backend) 返回和 scrape_music_index 相同结构的结果字典。
+backend:
+  html.parser  BeautifulSoup + 标准库解析器 (原 DOM 解析方式)
+  lxml         BeautifulSoup + lxml (需要安装 lxml)
+  regex        不建树，按标签流式扫描，只跟踪需要的节点
+"""
+import re
+import html as html_lib
+import logging
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("html.parser", "lxml", "regex")
+DEFAULT_BACKEND = "html.parser"
+# 成就最多保留条数
+MAX_ACHIEVEMENTS = 10
+
+INDEX_LABEL = "实时音乐指数"
+RANK_LABEL = "全站排名"
+UPDATE_TIME_TEXT = "最近更新"
+LISTENING_TEXT = "人正在听"
+
+def available_backends():
+    """当前环境可用的解析后端"""
+    backends = ["html.parser"]
+    try:
+        import lxml  # noqa: F401
+        backends.append("lxml")
+    except ImportError:
+        pass
+    backends.append("regex")
+    return backends
+
+def parse_music_index_html(html, backend=DEFAULT_BACKEND):
+    """解析渲染后的页面 HTML，返回结果字典 (至少包含 achievements)"""
+    if backend == "regex":
+        return _parse_stream(html)
+    if backend not in ("html.parser", "lxml"):
+        raise ValueError(f"Unknown parser backend: {backend}")
+    return _parse_soup(BeautifulSoup(html, backend))
+
+def _mini_data_field(result, i, label):
+    """详细对比数据的一项: "昨日指数296,407" -> yesterday_index = "296,407"
+
+    "较前一天" 出现两次，按位置区分：紧跟指数的是指数涨跌，之后的是排名涨跌
+    """
+    if "昨日指数" in label:
+        result['yesterday_index'] = re.sub(r"昨日指数", "", label)
+    elif "昨日排名" in label:
+        result['yesterday_rank'] = re.sub(r"昨日排名", "", label)
+    elif "较前一天" in label:
+        change_val = re.sub(r"较前一天", "", label)
+        if i == 1:
+            result['index_change'] = change_val
+        elif i >= 3:
+            result['rank_change'] = change_val
+
+def _achievement(date_text, content_text):
+    """组合成前端需要的格式: "YYYY/MM/DD 内容"；没有内容返回 None"""
+    if not content_text:
+        return None
+    if date_text and not content_text.startswith(date_text):
+        return f"{date_text} {content_text}"
+    return content_text
+
+def _parse_soup(soup):
+    result = {}
+
+    # 1. 实时数据 (指数、排名)
+    # 结构: <div class="base_data_item" role="text" aria-label="实时音乐指数为303">...</div>
+    index_node = soup.find(attrs={"aria-label": re.compile(INDEX_LABEL)})
+    if index_node:
+        match = re.search(r"[\d,]+", index_node.get("aria-label"))
+        if match:
+            result['music_index'] = match.group(0)
+
+    rank_node = soup.find(attrs={"aria-label": re.compile(RANK_LABEL)})
+    if rank_node:
+        match = re.search(r"[\d]+", rank_node.get("aria-label"))
+        if match:
+            result['global_rank'] = match.group(0)
+
+    # 1.5 最近更新时间
+    update_time_node = soup.find(string=re.compile(UPDATE_TIME_TEXT))
+    if update_time_node:
+        result['update_time'] = update_time_node.strip()
+
+    # 2. 详细对比数据 (平铺的 4 个 item: 昨日指数、指数涨跌、昨日排名、排名涨跌)
+    try:
+        mini_data_container = soup.find(class_=re.compile("base_mini_data"))
+        if mini_data_container:
+            items = mini_data_container.find_all(class_=re.compile("base_mini_data__item"))
+            for i, item in enumerate(items):
+                _mini_data_field(result, i, item.get("aria-label", ""))
+    except Exception as e:
+        logger.warning(f"解析详细数据失败: {e}")
+
+    # 3. 正在听人数
+    listening_node = soup.find(string=re.compile(LISTENING_TEXT))
+    if listening_node:
+        match = re.search(r"[\d,]+", listening_node)
+        if match:
+            result['listening_count'] = match.group(0)
+
+    # 4. 歌曲成就 (history_item 列表)
+    achievements = []
+    try:
+        for item in soup.find_all(class_=re.compile("history_item")):
+            # 跳过没有内容的项
+            if not item.get_text(strip=True):
+                continue
+            date_node = item.find(class_=re.compile("history_item_time"))
+            content_node = item.find(class_=re.compile("history_item_cont")) or \
+                           item.find(class_=re.compile("history_item_colum"))
+            date_text = date_node.get_text(strip=True) if date_node else ""
+            content_text = content_node.get_text(strip=True) if content_node else ""
+            # 找不到具体节点时用 aria-label (例如 "热歌榜 当前排名10 历史在榜1048期 最高排名4")
+            if not content_text:
+                content_text = item.get("aria-label", "")
+            text = _achievement(date_text, content_text)
+            if text:
+                achievements.append(text)
+    except Exception as e:
+        logger.warning(f"解析成就失败: {e}")
+
+    result['achievements'] = achievements[:MAX_ACHIEVEMENTS]
+    return result
+
+# === regex 后端：一遍扫描标签和文本，不建 DOM 树 ===
+TOKEN_RE = re.compile(
+    r"<!--.*?-->"                                     # 注释
+    r"|<(script|style)\b[^>]*>.*?</\1\s*>"            # 脚本/样式整块跳过
+    r"|<!.*?>"                                        # doctype
+    r"|<(/?)([a-zA-Z][\w:-]*)((?:\"[^\"]*\"|'[^']*'|[^'\">])*)>"  # 标签
+    r"|([^<]+)",                                      # 文本
+    re.S | re.I
+)
+ATTR_RE = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""")
+VOID_TAGS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"))
+
+class _HistoryItem:
+    """一个 history_item 节点在扫描过程中的状态"""
+    __slots__ = ("depth", "aria", "has_text", "date", "cont", "colum", "capture")
+
+    def __init__(self, depth, aria):
+        self.depth = depth
+        self.aria = aria
+        self.has_text = False
+        # 各子节点的文本片段 (None 表示还没遇到该子节点)
+        self.date = None
+        self.cont = None
+        self.colum = None
+        # 正在收集文本的子节点: [(字段名, 子节点深度)]
+        self.capture = []
+
+def _attrs(raw):
+    attrs = {}
+    for name, v1, v2, v3 in ATTR_RE.findall(raw):
+        name = name.lower()
+        if name not in attrs:
+            attrs[name] = html_lib.unescape(v1 or v2 or v3)
+    return attrs
+
+def _parse_stream(html):
+    result = {}
+    mini_index = 0
+    # 当前打开的标签名栈 (只用来计算深度)
+    stack = []
+    open_items = []
+    items = []
+
+    for match in TOKEN_RE.finditer(html):
+        closing, tag, raw_attrs, text = match.group(2, 3, 4, 5)
+        if text is not None:
+            text = html_lib.unescape(text)
+            if 'update_time' not in result and UPDATE_TIME_TEXT in text:
+                result['update_time'] = text.strip()
+            if 'listening_count' not in result and LISTENING_TEXT in text:
+                number = re.search(r"[\d,]+", text)
+                if number:
+                    result['listening_count'] = number.group(0)
+            stripped = text.strip()
+            if stripped and open_items:
+                for item in open_items:
+                    item.has_text = True
+                    for field, _ in item.capture:
+                        getattr(item, field).append(stripped)
+            continue
+        if tag is None:
+            continue
+        tag = tag.lower()
+
+        if closing:
+            # 容错：弹到匹配的开标签为止 (和浏览器一样忽略多余的闭合标签)
+            if tag not in stack:
+                continue
+            while stack:
+                if stack.pop() == tag:
+                    break
+            depth = len(stack)
+            for item in open_items:
+                item.capture = [(f, d) for f, d in item.capture if d < depth]
+            open_items = [item for item in open_items if item.depth < depth]
+            continue
+
+        if raw_attrs and ("aria-label" in raw_attrs or "class" in raw_attrs):
+            attrs = _attrs(raw_attrs)
+        else:
+            attrs = {}
+        aria = attrs.get("aria-label")
+        cls = attrs.get("class", "")
+        depth = len(stack)
+
+        if aria:
+            if 'music_index' not in result and INDEX_LABEL in aria:
+                number = re.search(r"[\d,]+", aria)
+                if number:
+                    result['music_index'] = number.group(0)
+            if 'global_rank' not in result and RANK_LABEL in aria:
+                number = re.search(r"[\d]+", aria)
+                if number:
+                    result['global_rank'] = number.group(0)
+        if "base_mini_data__item" in cls:
+            _mini_data_field(result, mini_index, aria or "")
+            mini_index += 1
+        if "history_item" in cls:
+            # 子节点 (history_item_time 等) 也算作 history_item，和 BeautifulSoup 的匹配方式保持一致
+            for item in open_items:
+                for field, marker in (("date", "history_item_time"), ("cont", "history_item_cont"), ("colum", "history_item_colum")):
+                    if marker in cls and getattr(item, field) is None:
+                        setattr(item, field, [])
+                        item.capture.append((field, depth))
+            item = _HistoryItem(depth, aria or "")
+            items.append(item)
+            open_items.append(item)
+
+        if tag not in VOID_TAGS and not raw_attrs.rstrip().endswith("/"):
+            stack.append(tag)
+        elif open_items:
+            # 空元素没有子节点，对应的收集立即结束
+            for item in open_items:
+                item.capture = [(f, d) for f, d in item.capture if d < depth]
+            open_items = [item for item in open_items if item.depth < depth]
+
+    achievements = []
+    for item in items:
+        if not item.has_text:
+            continue
+        date_text = "".join(item.date or ())
+        # 和 find(cont) or find(colum) 一致：有 cont 节点就用它 (哪怕为空)
+        content_text = "".join(item.cont if item.cont is not None else item.colum or ())
+        if not content_text:
+            content_text = item.aria
+        text = _achievement(date_text, content_text)
+        if text:
+            achievements.append(text)
+    result['achievements'] = achievements[:MAX_ACHIEVEMENTS]
+    return result
@@ -0,0 +1,201 @@
+import json
+import time
+import random
+import logging
+import threading
+
+logger = logging.getLogger("outbox")
+
+# 待推送消息表：和本地数据在同一个事务里写入，推送成功后才删除，Worker 重启或服务器宕机都不会丢
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS push_outbox (
+    id INTEGER PRIMARY KEY,
+    mid TEXT NOT NULL,
+    payload TEXT NOT NULL,        -- 推送给服务器的 JSON
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+)
+"""
+
+# 死信表：服务器连续拒收 OUTBOX_MAX_ATTEMPTS 次的消息移到这里，不再挡住后面的推送 (留着排查，必要时手工放回)
+DEAD_LETTER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS push_outbox_dead (
+    id INTEGER PRIMARY KEY,
+    mid TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    dead_at REAL NOT NULL
+)
+"""
+
+# 每批最多推送多少条
+OUTBOX_BATCH_SIZE = 50
+# 有新消息后再等多久凑一批 (秒)
+OUTBOX_LINGER = 0.5
+# 推送失败后的退避: base * 2^(连续失败次数-1)，上限 max (秒)
+OUTBOX_BACKOFF_BASE = 2
+OUTBOX_BACKOFF_MAX = 300
+# 一条消息被服务器拒绝 (HTTP 错误、返回格式不对等) 多少次后移入死信表；
+# 网络不通/超时 (OSError，requests 的异常也是) 不算次数，服务器宕机再久也不会把消息丢进死信表
+OUTBOX_MAX_ATTEMPTS = 5
+
+def init_outbox_table(con):
+    con.execute(OUTBOX_SCHEMA)
+    con.execute(DEAD_LETTER_SCHEMA)
+
+def enqueue(con, mid, payload):
+    """在调用方的事务里写入一条待推送消息 (事务提交后再调用 Outbox.notify 唤醒推送线程)"""
+    con.execute(
+        "INSERT INTO push_outbox (mid, payload, created_at) VALUES (?, ?, ?)",
+        (mid, json.dumps(payload, ensure_ascii=False), time.time())
+    )
+
+class Outbox:
+    """后台推送线程：按 id 顺序成批取出消息交给 send_fn，成功后删除，失败则整体指数退避重试
+
+    send_fn(payloads) 成功返回即可，失败抛异常。被拒的那一批会改成逐条重推，
+    这样一条坏消息只会累计到它自己的 attempts 上，到上限后移入死信表，不会拖住同批的其他消息
+    """
+
+    def __init__(self, connection, send_fn, batch_size=OUTBOX_BATCH_SIZE, linger=OUTBOX_LINGER):
+        # 返回连接上下文管理器的函数 (如 SQLitePool.connection)
+        self.connection = connection
+        self.send_fn = send_fn
+        self.batch_size = batch_size
+        self.linger = linger
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._consecutive_failures = 0
+        self._retry_at = 0.0
+        # id 不超过它的消息逐条推送 (上一次被拒那一批里的最大 id)
+        self._single_until = 0
+        self.sent = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_sent_at = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="outbox-flush", daemon=True)
+                self._thread.start()
+
+    def notify(self):
+        """有新消息了 (推送线程没启动时顺便启动)"""
+        self.start()
+        self._wake.set()
+
+    def _loop(self):
+        # 启动时先把上次没推完的推掉
+        self._wake.set()
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while True:
+                delay = self._retry_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    time.sleep(self.linger)
+                try:
+                    more = self.flush_once()
+                except Exception as e:
+                    logger.error(f"推送队列异常: {e}")
+                    more = True
+                    self._backoff(str(e))
+                if not more:
+                    break
+
+    def _backoff(self, error):
+        with self._lock:
+            self._consecutive_failures += 1
+            self.failures += 1
+            self.last_error = error
+            delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (self._consecutive_failures - 1))
+            # 抖动: 取 [delay/2, delay]
+            delay = random.uniform(delay / 2, delay)
+            self._retry_at = time.monotonic() + delay
+        logger.warning(f"推送失败，{delay:.1f} 秒后重试: {error}")
+
+    def flush_once(self):
+        """推送一批，返回队列里是否还有消息"""
+        with self.connection() as con:
+            rows = con.execute(
+                "SELECT id, payload FROM push_outbox ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+        if not rows:
+            return False
+        more = len(rows) == self.batch_size
+        if rows[0][0] <= self._single_until:
+            more = more or len(rows) > 1
+            rows = rows[:1]
+        ids = [row[0] for row in rows]
+        placeholders = ','.join('?' * len(ids))
+        try:
+            self.send_fn([json.loads(row[1]) for row in rows])
+        except OSError as e:
+            # 网络问题，和消息本身无关，只退避不计次数
+            with self.connection() as con:
+                con.execute(f"UPDATE push_outbox SET last_error = ? WHERE id IN ({placeholders})", [str(e)[:500]] + ids)
+            self._backoff(str(e))
+            return True
+        except Exception as e:
+            with self.connection() as con:
+                con.execute(
+                    f"UPDATE push_outbox SET attempts = attempts + 1, last_error = ? WHERE id IN ({placeholders})",
+                    [str(e)[:500]] + ids
+                )
+                dead = self._move_to_dead_letter(con, ids)
+            self._single_until = max(self._single_until, ids[-1])
+            if dead:
+                logger.error(f"{dead} 条消息连续 {OUTBOX_MAX_ATTEMPTS} 次被拒，已移入死信表: {e}")
+            self._backoff(str(e))
+            return True
+        with self.connection() as con:
+            con.execute(f"DELETE FROM push_outbox WHERE id IN ({','.join('?' * len(ids))})", ids)
+        with self._lock:
+            self._consecutive_failures = 0
+            self._retry_at = 0.0
+            self.sent += len(ids)
+            self.batches += 1
+            self.last_sent_at = time.time()
+        logger.info(f"已推送 {len(ids)} 条数据到主服务器")
+        return more
+
+    def _move_to_dead_letter(self, con, ids):
+        """在 con 的事务里把 ids 中失败次数到上限的消息移到死信表，返回移动的条数"""
+        placeholders = ','.join('?' * len(ids))
+        con.execute(f"""
+            INSERT INTO push_outbox_dead (id, mid, payload, created_at, attempts, last_error, dead_at)
+            SELECT id, mid, payload, created_at, attempts, last_error, ? FROM push_outbox
+            WHERE id IN ({placeholders}) AND attempts >= ?
+        """, [time.time()] + ids + [OUTBOX_MAX_ATTEMPTS])
+        return con.execute(
+            f"DELETE FROM push_outbox WHERE id IN ({placeholders}) AND attempts >= ?", ids + [OUTBOX_MAX_ATTEMPTS]
+        ).rowcount
+
+    def depth(self):
+        """积压条数、最旧一条等了多久 (秒) 和死信条数"""
+        with self.connection() as con:
+            count, oldest = con.execute("SELECT COUNT(*), MIN(created_at) FROM push_outbox").fetchone()
+            dead = con.execute("SELECT COUNT(*) FROM push_outbox_dead").fetchone()[0]
+        return {"pending": count, "oldest_age": round(time.time() - oldest, 1) if oldest else 0, "dead": dead}
+
+    def stats(self):
+        depth = self.depth()
+        with self._lock:
+            return dict(
+                depth,
+                sent=self.sent,
+                batches=self.batches,
+                failures=self.failures,
+                consecutive_failures=self._consecutive_failures,
+                retry_in=round(max(0.0, self._retry_at - time.monotonic()), 1),
+                last_error=self.last_error,
+                last_sent_at=self.last_sent_at,
+            )
@@ -0,0 +1,106 @@
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from cache_utils import SingleFlight
+from telemetry import Counter, Histogram
+
+logger = logging.getLogger("pi_client")
+
+# 各转发接口的超时 (秒)：(连接超时, 读取超时)
+PI_TIMEOUTS = {
+    "search_singer": (3, 8),
+    "get_lyrics": (3, 5),
+    "get_data": (2, 3),
+    "charts": (2, 3),
+}
+DEFAULT_TIMEOUT = (3, 5)
+# 连接池大小 (同时与树莓派保持的 keep-alive 连接数上限)
+PI_POOL_SIZE = 10
+
+PI_FORWARD_SECONDS = Histogram(
+    "rainie_pi_forward_duration_seconds", "转发到树莓派的上游调用耗时 (合并的请求只算一次)", ["endpoint"]
+)
+PI_FORWARD_ERRORS = Counter("rainie_pi_forward_errors_total", "转发到树莓派失败的请求数", ["endpoint"])
+
+class PiClient:
+    """转发到树莓派的共享 HTTP 客户端
+
+    - 所有转发共用一个 requests.Session，复用 keep-alive 连接 (走 Tailscale 建连很贵)
+    - 同一时刻相同 URL 的请求合并成一次上游调用 (页面集中打开时的同名搜索)
+    - 按接口统计请求数、合并数、错误数和耗时
+    """
+
+    def __init__(self, base_url, pool_size=PI_POOL_SIZE, timeouts=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeouts = dict(PI_TIMEOUTS, **(timeouts or {}))
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0, pool_block=False)
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _record(self, endpoint, key, value=1):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {
+                "requests": 0, "upstream_calls": 0, "coalesced": 0, "errors": 0, "total_ms": 0.0
+            })
+            stats[key] += value
+
+    def _fetch(self, endpoint, url, params):
+        started = time.monotonic()
+        self._record(endpoint, "upstream_calls")
+        try:
+            resp = self.session.get(url, params=params, timeout=self.timeouts.get(endpoint, DEFAULT_TIMEOUT))
+            resp.raise_for_status()
+            return resp.status_code, resp.content
+        finally:
+            elapsed = time.monotonic() - started
+            self._record(endpoint, "total_ms", elapsed * 1000)
+            PI_FORWARD_SECONDS.observe(elapsed, endpoint=endpoint)
+
+    def get(self, endpoint, path, params=None):
+        """GET 树莓派接口，返回 (状态码, 响应体 bytes)；非 2xx 或网络错误抛异常"""
+        url = f"{self.base_url}{path}"
+        key = (url, tuple(sorted((params or {}).items())))
+        self._record(endpoint, "requests")
+        try:
+            result, shared = self._flight.do(key, self._fetch, endpoint, url, params)
+        except Exception:
+            self._record(endpoint, "errors")
+            PI_FORWARD_ERRORS.inc(endpoint=endpoint)
+            raise
+        if shared:
+            self._record(endpoint, "coalesced")
+        return result
+
+    def get_text(self, endpoint, path, params=None):
+        return self.get(endpoint, path, params)[1].decode("utf-8")
+
+    def pool_stats(self):
+        """连接池状态 + 各接口统计"""
+        pools = []
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": pool.pool.qsize() if pool.pool is not None else 0,
+                "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+            })
+        with self._lock:
+            endpoints = {
+                name: dict(
+                    stats,
+                    total_ms=round(stats["total_ms"], 1),
+                    avg_ms=round(stats["total_ms"] / stats["upstream_calls"], 1) if stats["upstream_calls"] else 0
+                )
+                for name, stats in self._stats.items()
+            }
+        return {"base_url": self.base_url, "pools": pools, "endpoints": endpoints}
@@ -4,20 +4,61 @@ import logging
 import schedule
 import json
 import threading
-import sqlite3
 import os
 import urllib.request
 import urllib.parse
-from flask import Flask, jsonify
-from scrape_selenium import scrape_music_index
+import base64
+import gzip
+import math
+from flask import Flask, Response, jsonify, send_file, request
+import scrape_selenium
+from scrape_selenium import scrape_music_index, BROWSER_POOL
+from crawl_executor import CrawlExecutor, CrawlCoordinator
+from chart_store import ChartStore
+from response_cache import ResponseCache
+from sqlite_pool import SQLitePool, ensure_columns
+from song_delta import content_hash, build_push, volatile_part, merge_volatile
+import telemetry
+from telemetry import Gauge, Histogram
+from song_metrics import init_history_table, append_history, parse_metrics, query_history, parse_time_arg, BUCKETS, HISTORY_DEFAULT_DAYS
+from crawl_schedule import init_schedule_table, sync_listed, record_view, record_scrape, take_due, schedule_snapshot
+from outbox import Outbox, init_outbox_table, enqueue as enqueue_push
+from scrape_runs import init_scrape_runs_table, record_scrape_run, summarize_scrape_runs, SUMMARY_DEFAULT_RUNS, SUMMARY_MAX_RUNS
 
 # === 配置 ===
 DB_PATH = "pi_data.db"
+# 走势图按内容哈希存成文件，不再以内嵌 base64 的形式塞进 JSON
+CHART_STORE_DIR = "chart_store"
+# QQ 音乐接口响应缓存 (搜索/歌词)
+HTTP_CACHE_PATH = "http_cache.db"
+# 直连 QQ 音乐接口的超时 (秒)
+QQ_MUSIC_TIMEOUT = 8
+# QQ 音乐接口地址 (压测时指向本地替身服务，见 benchmarks/fake_qqmusic.py)
+QQ_MUSIC_API_BASE = "https://c.y.qq.com"
+
+QQ_MUSIC_SECONDS = Histogram("rainie_worker_qqmusic_request_duration_seconds", "Worker 请求 QQ 音乐接口的耗时", ["endpoint"])
 PORT = 5000 # 树莓派服务端口
 # === 配置主服务器地址 ===
 # 如果主服务器在另一台机器，请改为实际 IP，例如 "http://192.168.1.100:5000"
 # 根据您的 Ping 测试，主服务器 (Windows) 的 IP 是 100.65.184.87，且运行在 8000 端口
 MAIN_SERVER_URL = "http://100.65.184.87:8000" 
+# 批量采集时整批复用同一个常驻浏览器 (False 则每首歌单独从浏览器池借用)
+CRAWL_SHARED_BROWSER = True
+# 指令长轮询：每次请求最多挂起多少秒；连接失败后等待多久重试
+POLL_WAIT = 25
+POLL_RETRY_DELAY = 5
+# 批量推送请求的超时 (秒)
+PUSH_TIMEOUT = 15
+# 并发抓取数 (树莓派默认 1，需要同时调大 scrape_selenium.BROWSER_POOL_SIZE)
+CRAWL_CONCURRENCY = 1
+# 对 y.qq.com 的全局速率上限 (每分钟页面数)
+CRAWL_RATE_PER_MIN = 20
+# 热门歌单大小，以及多久重新拉一次歌单 (秒)
+SONG_LIST_SIZE = 30
+SONG_LIST_SYNC_INTERVAL = 6 * 3600
+# 自适应调度: 每隔多少分钟跑一轮，每轮最多抓多少首到期的歌 (间隔和退避见 crawl_schedule)
+ADAPTIVE_CYCLE_MINUTES = 15
+ADAPTIVE_BUDGET = 10
 
 # 配置日志
 logging.basicConfig(
@@ -33,9 +74,27 @@ logger = logging.getLogger("worker")
 # 初始化 Flask
 app = Flask(__name__)
 
+db_pool = SQLitePool(DB_PATH, size=4)
+chart_store = ChartStore(CHART_STORE_DIR)
+# 已确认主服务器存在的图片哈希，避免重复上传
+uploaded_charts = set()
+# 第一次用到时按 HTTP_CACHE_PATH 创建，见 get_response_cache
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """QQ 音乐接口响应缓存，第一次调用时创建 (不依赖 init_db 先运行)"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(HTTP_CACHE_PATH)
+    return _response_cache
+
 def init_db():
     """初始化本地数据库"""
-    with sqlite3.connect(DB_PATH) as conn:
+    get_response_cache()
+    with db_pool.connection() as conn:
         conn.execute("""
             CREATE TABLE IF NOT EXISTS song_stats (
                 mid TEXT PRIMARY KEY,
@@ -43,95 +102,239 @@ def init_db():
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        # content_hash: 规范化 JSON 的哈希，内容没变时不重写这一行；verified_at: 最后一次抓取确认内容的时间
+        # (updated_at 只在内容变化时更新)
+        ensure_columns(conn, "song_stats", {"content_hash": "TEXT", "verified_at": "TIMESTAMP"})
+        init_history_table(conn)
+        init_scrape_runs_table(conn)
+        init_schedule_table(conn)
+        init_outbox_table(conn)
+        
+        # 迁移旧数据：把内嵌在 JSON 里的 base64 走势图移到图片仓库
+        rows = conn.execute(
+            "SELECT mid, data FROM song_stats WHERE data LIKE '%data:image/png;base64,%'"
+        ).fetchall()
+        for mid, raw in rows:
+            data, _ = chart_store.externalize(json.loads(raw))
+            conn.execute("UPDATE song_stats SET data = ? WHERE mid = ?", (json.dumps(data), mid))
+        if rows:
+            logger.info(f"已迁移 {len(rows)} 条内嵌走势图到 {CHART_STORE_DIR}")
+
+def save_scrape_run(run):
+    """记录一次抓取的分阶段耗时 (scrape_selenium 每抓完一首回调)"""
+    with db_pool.connection() as conn:
+        record_scrape_run(conn, run)
+
+scrape_selenium.ON_SCRAPE_RUN = save_scrape_run
+
+def upload_chart(digest):
+    """确保主服务器上有这张走势图 (按哈希去重，已存在则不上传)"""
+    if not digest or digest in uploaded_charts:
+        return
+    chart_url = f"{MAIN_SERVER_URL}/charts/{digest}.png"
+    headers = {"Authorization": "Bearer rainie-forever-2026"}
+    try:
+        resp = requests.head(chart_url, timeout=5)
+        if resp.status_code != 200:
+            resp = requests.put(
+                f"{MAIN_SERVER_URL}/api/charts/{digest}",
+                data=chart_store.read_bytes(digest),
+                headers={**headers, "Content-Type": "image/png"},
+                timeout=10
+            )
+            if resp.status_code != 200:
+                logger.warning(f"上传走势图失败: {resp.status_code} - {resp.text}")
+                return
+            logger.info(f"走势图已上传: {digest[:12]}")
+        uploaded_charts.add(digest)
+    except Exception as e:
+        logger.warning(f"上传走势图异常: {e}")
 
 def save_data(mid, data):
-    """保存数据到本地，并推送到主服务器"""
-    # 1. 保存到本地 SQLite
+    """保存数据到本地，并放进推送队列 (后台线程成批推送到主服务器)"""
+    # 0. 走势图移到图片仓库，JSON 里只留链接和哈希
+    try:
+        data, chart_hash = chart_store.externalize(data)
+    except Exception as e:
+        logger.warning(f"保存走势图失败: {e}")
+        data, chart_hash = dict(data), None
+        data.pop("chart_image", None)
+    
+    # 1. 保存到本地 SQLite (最新一份 + 追加一条指标历史 + 待推送消息，同一个事务)
+    # 抓取时间只取一次，本地 updated_at、历史和推送都用它，服务器据此去重
+    scraped_at = int(time.time())
+    scraped_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(scraped_at))
+    new_hash = content_hash(data)
+    # 先保证图片在服务器上 (哈希没变就不会重新上传)
+    upload_chart(chart_hash)
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.execute("""
-                INSERT OR REPLACE INTO song_stats (mid, data, updated_at)
-                VALUES (?, ?, datetime('now', 'localtime'))
-            """, (mid, json.dumps(data)))
-        logger.info(f"数据已保存到本地: {mid}")
+        with db_pool.connection() as conn:
+            row = conn.execute("SELECT data, content_hash FROM song_stats WHERE mid = ?", (mid,)).fetchone()
+            old_data = json.loads(row["data"]) if row else None
+            old_hash = (row["content_hash"] or content_hash(old_data)) if row else None
+            # 先和上一次抓取比较、算出下次抓取时间
+            record_scrape(conn, mid, data, scraped_at)
+            if old_hash == new_hash:
+                # 内容没变：只记一下确认时间；收听人数等易变字段变了才改 data (在听人数变了也记一条历史)
+                merged = merge_volatile(old_data, volatile_part(data))
+                if merged is None:
+                    conn.execute(
+                        "UPDATE song_stats SET verified_at = ?, content_hash = ? WHERE mid = ?", (scraped_str, new_hash, mid)
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE song_stats SET data = ?, verified_at = ?, content_hash = ? WHERE mid = ?",
+                        (json.dumps(merged), scraped_str, new_hash, mid)
+                    )
+                    if parse_metrics(merged) != parse_metrics(old_data):
+                        append_history(conn, mid, merged, scraped_at)
+            else:
+                conn.execute("""
+                    INSERT OR REPLACE INTO song_stats (mid, data, updated_at, content_hash, verified_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (mid, json.dumps(data), scraped_str, new_hash, scraped_str))
+                append_history(conn, mid, data, scraped_at)
+            # 2. 推送到主服务器 (Push Mode)：这样主服务器不需要去拉取，也能实时获得更新
+            # 没变只发心跳，部分字段变了只发差异；推送失败会留在队列里退避重试，不会丢
+            push = build_push(mid, data, new_hash, old_data, old_hash, scraped_at)
+            enqueue_push(conn, mid, push)
+        logger.info(f"数据已保存到本地: {mid} ({push['type']})")
     except Exception as e:
         logger.error(f"保存数据失败: {e}")
+        return
+    push_outbox.notify()
 
-    # 2. 推送到主服务器 (Push Mode)
-    # 这样主服务器不需要去拉取，也能实时获得更新
-    try:
-        push_url = f"{MAIN_SERVER_URL}/api/update_song_stats"
-        headers = {
+def push_batch(payloads):
+    """把一批数据 gzip 压缩后推到主服务器的批量接口 (服务器在一个事务里整批写入)"""
+    body = gzip.compress(json.dumps({"items": payloads}, ensure_ascii=False).encode("utf-8"))
+    resp = requests.post(
+        f"{MAIN_SERVER_URL}/api/update_song_stats/bulk",
+        data=body,
+        headers={
             "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
             "Authorization": "Bearer rainie-forever-2026"
-        }
-        payload = {
-            "mid": mid,
-            "data": data
-        }
-        resp = requests.post(push_url, json=payload, headers=headers, timeout=5)
-        if resp.status_code == 200:
-            logger.info(f"数据已推送到主服务器: {mid}")
-        else:
-            logger.warning(f"推送数据失败: {resp.status_code} - {resp.text}")
-    except Exception as e:
-        # 推送失败不影响本地保存
-        logger.warning(f"推送数据异常: {e}")
+        },
+        timeout=PUSH_TIMEOUT
+    )
+    if resp.status_code != 200:
+        raise RuntimeError(f"HTTP {resp.status_code} - {resp.text[:200]}")
+    result = resp.json()
+    if result.get("rejected"):
+        # 格式不对的条目重试也没用，记下来直接丢弃
+        logger.warning(f"主服务器拒收 {len(result['rejected'])} 条: {result['rejected']}")
+    if result.get("resync"):
+        # 服务器上的版本和差异/心跳对不上 (服务器丢过数据或还是旧版本)，补发整份数据
+        resend_full(result["resync"])
+
+def resend_full(mids):
+    """把本地最新的整份数据重新放进推送队列"""
+    with db_pool.connection() as conn:
+        for mid in mids:
+            row = conn.execute(
+                "SELECT data, content_hash, updated_at FROM song_stats WHERE mid = ?", (mid,)
+            ).fetchone()
+            if not row:
+                continue
+            data = json.loads(row["data"])
+            enqueue_push(conn, mid, build_push(
+                mid, data, row["content_hash"] or content_hash(data),
+                scraped_at=int(time.mktime(time.strptime(row["updated_at"], "%Y-%m-%d %H:%M:%S")))
+            ))
+    logger.info(f"服务器要求重发整份数据: {len(mids)} 首")
+    push_outbox.notify()
+
+push_outbox = Outbox(db_pool.connection, push_batch)
+Gauge(
+    "rainie_push_outbox_depth", "等待推送到主服务器的消息数", fn=lambda: push_outbox.depth()["pending"]
+)
+Gauge(
+    "rainie_push_outbox_oldest_age_seconds", "推送队列里最旧一条消息等了多久", fn=lambda: push_outbox.depth()["oldest_age"]
+)
+Gauge(
+    "rainie_push_outbox_dead", "被服务器多次拒收、移入死信表的消息数", fn=lambda: push_outbox.depth()["dead"]
+)
 
 @app.route('/api/get_data/<mid>', methods=['GET'])
 def get_data(mid):
     """供服务器调用的接口：获取指定歌曲数据"""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.execute("SELECT data, updated_at FROM song_stats WHERE mid = ?", (mid,))
+        with db_pool.connection() as conn:
+            # 服务器来拉说明有人在看这首歌，调度时提高它的优先级
+            record_view(conn, mid)
+            cursor = conn.execute("SELECT data, updated_at, content_hash, verified_at FROM song_stats WHERE mid = ?", (mid,))
             row = cursor.fetchone()
             if row:
                 return jsonify({
                     "code": 0,
                     "mid": mid,
                     "data": json.loads(row[0]),
-                    "updated_at": row[1]
+                    "updated_at": row[1],
+                    "content_hash": row[2],
+                    "verified_at": row[3] or row[1]
                 })
             else:
                 return jsonify({"code": 1, "message": "Not found"}), 404
     except Exception as e:
         return jsonify({"code": -1, "error": str(e)}), 500
 
+@app.route('/api/song_history', methods=['GET'])
+def song_history():
+    """本地指标历史 (参数同主服务器的 /api/song_history)"""
+    mid = request.args.get("mid")
+    if not mid:
+        return jsonify({"code": 1, "error": "Missing mid"}), 400
+    bucket = request.args.get("bucket", "raw")
+    if bucket not in BUCKETS:
+        return jsonify({"code": 1, "error": f"bucket must be one of {', '.join(BUCKETS)}"}), 400
+    try:
+        end = parse_time_arg(request.args.get("end"), int(time.time()))
+        start = parse_time_arg(request.args.get("start"), end - HISTORY_DEFAULT_DAYS * 86400)
+    except ValueError:
+        return jsonify({"code": 1, "error": "Invalid start/end"}), 400
+    with db_pool.connection() as conn:
+        points = query_history(conn, mid, start, end, bucket)
+    return jsonify({"code": 0, "mid": mid, "bucket": bucket, "start": start, "end": end, "points": points})
+
+@app.route('/api/scrape_runs/summary', methods=['GET'])
+def scrape_runs_summary():
+    """最近若干次抓取各阶段耗时的百分位 (毫秒) 和内存峰值
+
+    limit: 统计最近多少次 (默认 200)；since: 只统计此时间之后的 (unix 秒或 ISO 本地时间)；mid: 只看某首歌
+    """
+    try:
+        limit = min(int(request.args.get("limit", SUMMARY_DEFAULT_RUNS)), SUMMARY_MAX_RUNS)
+        since = parse_time_arg(request.args.get("since"), None)
+    except ValueError:
+        return jsonify({"code": 1, "error": "Invalid limit/since"}), 400
+    with db_pool.connection() as conn:
+        summary = summarize_scrape_runs(conn, limit=limit, since=since, mid=request.args.get("mid"))
+    return jsonify({"code": 0, "data": summary})
+
+@app.route('/charts/<digest>.png', methods=['GET'])
+def get_chart(digest):
+    """供服务器调用的接口：按哈希获取走势图 (主服务器拉取数据时补图用)"""
+    if not chart_store.exists(digest):
+        return jsonify({"code": 1, "message": "Not found"}), 404
+    return send_file(chart_store.path_for(digest), mimetype="image/png", max_age=31536000)
+
 @app.route('/api/search_singer', methods=['GET'])
 def api_search_singer():
     """供服务器调用的接口：搜索歌手"""
     try:
         # 获取 URL 参数，默认杨丞琳
-        from flask import request
         name = request.args.get("name", "杨丞琳")
         logger.info(f"Received search request for: {name}")
         
         # 复用 fetch_song_list 的逻辑，但这里我们需要返回完整的 QQ 音乐 API 结构
         # 为了简单起见，我们直接调用 client_search_cp 并返回它的原始 JSON
         
-        url = "https://c.y.qq.com/soso/fcgi-bin/client_search_cp"
-        params = {
-            "w": name,
-            "t": 0,
-            "n": 30,
-            "page": 1,
-            "cr": 1,
-            "catZhida": 1,
-            "format": "json"
-        }
-        query_string = urllib.parse.urlencode(params)
-        full_url = f"{url}?{query_string}"
-        
-        headers = {
-            "Referer": "https://y.qq.com/",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        
-        req = urllib.request.Request(full_url, headers=headers)
-        with urllib.request.urlopen(req) as response:
-            content = response.read().decode('utf-8')
-            # 直接返回原始数据
-            return jsonify(json.loads(content))
+        content, _ = get_response_cache().get_or_fetch(
+            "search", {"w": name, "n": 30},
+            lambda: fetch_search_raw(name, 30)
+        )
+        # 直接返回原始数据
+        return jsonify(json.loads(content))
             
     except Exception as e:
         logger.error(f"Search failed: {e}")
@@ -141,70 +344,28 @@ def api_search_singer():
 def api_get_lyrics():
     """供服务器调用的接口：获取歌词"""
     try:
-        from flask import request
         mid = request.args.get("mid")
         if not mid:
             return jsonify({"error": "Missing mid"}), 400
             
         logger.info(f"Received lyrics request for: {mid}")
         
-        # QQ 音乐歌词接口
-        url = "https://c.y.qq.com/lyric/fcgi-bin/fcg_query_lyric_new.fcg"
-        params = {
-            "songmid": mid,
-            "pcachetime": int(time.time() * 1000),
-            "format": "json",
-            "loginUin": 0,
-            "hostUin": 0,
-            "inCharset": "utf8",
-            "outCharset": "utf-8",
-            "notice": 0,
-            "platform": "yqq",
-            "needNewCode": 0
-        }
-        
-        headers = {
-            "Referer": "https://y.qq.com/",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        
-        query_string = urllib.parse.urlencode(params)
-        full_url = f"{url}?{query_string}"
-        
-        req = urllib.request.Request(full_url, headers=headers)
-        with urllib.request.urlopen(req) as response:
-            content = response.read().decode('utf-8')
-            # QQ 音乐有时返回 jsonp，虽然我们请求了 json，还是防一手
-            if content.startswith("MusicJsonCallback("):
-                content = content[18:-1]
-                
-            data = json.loads(content)
-            
-            # Base64 解码歌词
-            import base64
-            lyric = ""
-            trans = ""
-            if "lyric" in data:
-                lyric = base64.b64decode(data["lyric"]).decode('utf-8')
-            if "trans" in data:
-                trans = base64.b64decode(data["trans"]).decode('utf-8')
-                
-            return jsonify({
-                "lyric": lyric,
-                "trans": trans,
-                "source": "qq_music"
-            })
+        # 歌词基本不会变，命中缓存就不再请求 QQ 音乐
+        content, _ = get_response_cache().get_or_fetch(
+            "lyrics", {"songmid": mid},
+            lambda: fetch_lyrics_decoded(mid)
+        )
+        return jsonify(json.loads(content))
             
     except Exception as e:
         logger.error(f"Get lyrics failed: {e}")
         return jsonify({"code": -1, "error": str(e)}), 500
 
-def fetch_song_list(singer_name="杨丞琳", count=30):
-    """从 QQ 音乐获取实时热门歌曲列表"""
-    logger.info(f"正在获取 {singer_name} 的实时歌单...")
-    url = "https://c.y.qq.com/soso/fcgi-bin/client_search_cp"
+def fetch_search_raw(keyword, count):
+    """请求 QQ 音乐搜索接口，返回原始 JSON 字符串"""
+    url = f"{QQ_MUSIC_API_BASE}/soso/fcgi-bin/client_search_cp"
     params = {
-        "w": singer_name,
+        "w": keyword,
         "t": 0,
         "n": count,
         "page": 1,
@@ -220,89 +381,250 @@ def fetch_song_list(singer_name="杨丞琳", count=30):
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
     
+    req = urllib.request.Request(full_url, headers=headers)
+    with QQ_MUSIC_SECONDS.time(endpoint="search"):
+        with urllib.request.urlopen(req, timeout=QQ_MUSIC_TIMEOUT) as response:
+            content = response.read().decode('utf-8')
+    json.loads(content) # 校验，不合法的内容不进缓存
+    return content
+
+def fetch_lyrics_decoded(mid):
+    """请求 QQ 音乐歌词接口并解码，返回前端需要的 JSON 字符串"""
+    # QQ 音乐歌词接口
+    url = f"{QQ_MUSIC_API_BASE}/lyric/fcgi-bin/fcg_query_lyric_new.fcg"
+    params = {
+        "songmid": mid,
+        "pcachetime": int(time.time() * 1000),
+        "format": "json",
+        "loginUin": 0,
+        "hostUin": 0,
+        "inCharset": "utf8",
+        "outCharset": "utf-8",
+        "notice": 0,
+        "platform": "yqq",
+        "needNewCode": 0
+    }
+    
+    headers = {
+        "Referer": "https://y.qq.com/",
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+    }
+    
+    query_string = urllib.parse.urlencode(params)
+    full_url = f"{url}?{query_string}"
+    
+    req = urllib.request.Request(full_url, headers=headers)
+    with QQ_MUSIC_SECONDS.time(endpoint="lyrics"):
+        with urllib.request.urlopen(req, timeout=QQ_MUSIC_TIMEOUT) as response:
+            content = response.read().decode('utf-8')
+    # QQ 音乐有时返回 jsonp，虽然我们请求了 json，还是防一手
+    if content.startswith("MusicJsonCallback("):
+        content = content[18:-1]
+        
+    data = json.loads(content)
+    # 限流、反爬等错误也是正常的 JSON 但没有歌词，不能当成"没有歌词"缓存一年，抛出去不进缓存
+    retcode = data.get("retcode", data.get("code", 0))
+    if retcode != 0:
+        raise ValueError(f"QQ Music lyrics returned retcode {retcode}: {content[:100]}")
+    
+    # Base64 解码歌词
+    lyric = ""
+    trans = ""
+    if "lyric" in data:
+        lyric = base64.b64decode(data["lyric"]).decode('utf-8')
+    if "trans" in data:
+        trans = base64.b64decode(data["trans"]).decode('utf-8')
+    
+    # 接口成功但没有歌词的歌曲也照常缓存 (结果不会变)
+    return json.dumps({
+        "lyric": lyric,
+        "trans": trans,
+        "source": "qq_music"
+    }, ensure_ascii=False)
+
+def fetch_song_list(singer_name="杨丞琳", count=30):
+    """从 QQ 音乐获取实时热门歌曲列表 (短时间缓存，QQ 音乐不可用时用上一次的歌单)"""
+    logger.info(f"正在获取 {singer_name} 的实时歌单...")
     try:
-        req = urllib.request.Request(full_url, headers=headers)
-        with urllib.request.urlopen(req) as response:
-            data = json.loads(response.read().decode('utf-8'))
-            if "data" in data and "song" in data["data"] and "list" in data["data"]["song"]:
-                songs = data["data"]["song"]["list"]
-                song_mids = [song["songmid"] for song in songs]
-                logger.info(f"成功获取 {len(song_mids)} 首歌曲")
-                return song_mids
-            else:
-                logger.error("获取歌单结构解析失败")
-                return []
+        content, cache_status = get_response_cache().get_or_fetch(
+            "search", {"w": singer_name, "n": count},
+            lambda: fetch_search_raw(singer_name, count)
+        )
+        data = json.loads(content)
+        if "data" in data and "song" in data["data"] and "list" in data["data"]["song"]:
+            songs = data["data"]["song"]["list"]
+            song_mids = [song["songmid"] for song in songs]
+            logger.info(f"成功获取 {len(song_mids)} 首歌曲 (缓存: {cache_status})")
+            return song_mids
+        else:
+            logger.error("获取歌单结构解析失败")
+            return []
     except Exception as e:
         logger.error(f"获取歌单失败: {e}")
         return []
 
-def crawl_job():
-    """爬虫任务"""
-    logger.info("开始新一轮数据采集任务...")
-    song_list = fetch_song_list(count=30)
-    
-    if not song_list:
-        logger.warning("未能获取到歌曲列表，跳过本次任务")
-        return
+# 上一次同步热门歌单到调度表的时间
+LAST_LIST_SYNC = 0
 
-    for mid in song_list:
-        try:
-            logger.info(f"正在爬取: {mid}")
-            data = scrape_music_index(mid)
-            
-            if data and "error" not in data:
-                save_data(mid, data)
-            else:
-                logger.error(f"爬取失败: {mid} - {data.get('error')}")
-            
-            time.sleep(5) 
-            
-        except Exception as e:
-            logger.error(f"任务异常: {e}")
+def full_song_list():
+    """全量刷新的歌单，顺便同步到调度表"""
+    global LAST_LIST_SYNC
+    mids = fetch_song_list(count=SONG_LIST_SIZE)
+    if mids:
+        with db_pool.connection() as conn:
+            sync_listed(conn, mids)
+        LAST_LIST_SYNC = time.time()
+    return mids
 
-    logger.info("本轮任务结束")
+def due_song_list():
+    """自适应调度这一轮要抓的歌: 歌单太旧先同步，再取最可能有变化的到期歌曲"""
+    if time.time() - LAST_LIST_SYNC >= SONG_LIST_SYNC_INTERVAL:
+        full_song_list()
+    with db_pool.connection() as conn:
+        mids = take_due(conn, ADAPTIVE_BUDGET)
+    logger.info(f"自适应调度: 本轮到期 {len(mids)} 首")
+    return mids
 
-def run_scheduler():
-    """调度器线程"""
-    # 立即运行一次爬虫 (可选，启动时跑一次)
-    # crawl_job()
-    
-    # === 自动定时任务 (保底策略) ===
-    # 每天凌晨 3 点和下午 3 点自动运行，防止指令系统失效
-    schedule.every().day.at("03:00").do(crawl_job)
-    schedule.every().day.at("15:00").do(crawl_job)
+crawl_executor = CrawlExecutor(
+    scrape_fn=scrape_music_index,
+    save_fn=save_data,
+    concurrency=CRAWL_CONCURRENCY,
+    rate_per_min=CRAWL_RATE_PER_MIN
+)
+
+# 所有抓取请求 (定时任务、服务器指令) 都经过协调器，保证同一时间只有一轮在跑
+# CRAWL_SHARED_BROWSER: 每个并发线程整批占用同一个浏览器，Cookie 只注入一次
+crawl_coordinator = CrawlCoordinator(
+    list_fn=full_song_list,
+    executor=crawl_executor,
+    checkout=BROWSER_POOL.checkout if CRAWL_SHARED_BROWSER else None
+)
+
+def crawl_job(source="schedule"):
+    """爬虫任务 (交给协调器合并/排队，不会与正在进行的任务叠加)"""
+    return crawl_coordinator.request_refresh_all(source)
+
+def adaptive_crawl_job():
+    """自适应调度的一轮: 只抓到期的歌"""
+    return crawl_coordinator.request_refresh_all("adaptive", list_fn=due_song_list)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def api_cache_stats():
+    """供服务器调用的接口：QQ 音乐响应缓存统计"""
+    return jsonify({"code": 0, "data": get_response_cache().stats()})
+
+@app.route('/api/crawl/status', methods=['GET'])
+def api_crawl_status():
+    """供服务器调用的接口：查看抓取协调器状态"""
+    return jsonify({"code": 0, "data": crawl_coordinator.status()})
+
+@app.route('/api/outbox/stats', methods=['GET'])
+def api_outbox_stats():
+    """供服务器调用的接口：推送队列积压 (主服务器落后多少)、失败次数和最近的错误"""
+    return jsonify({"code": 0, "data": push_outbox.stats()})
+
+@app.route('/api/crawl/schedule', methods=['GET'])
+def api_crawl_schedule():
+    """供服务器调用的接口：每首歌的下次抓取时间、间隔、波动率和查看热度"""
+    with db_pool.connection() as conn:
+        songs = schedule_snapshot(conn)
+    return jsonify({"code": 0, "data": songs})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 抓取接口：抓取轮次耗时、单曲抓取耗时和成功率、QQ 音乐接口耗时"""
+    return Response(telemetry.render(), content_type=telemetry.CONTENT_TYPE)
+
+def parse_priority(value):
+    """指令里的优先级；不是有限数字的 (格式不对) 按 0 处理，不影响同一批里的其他歌"""
+    try:
+        priority = float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+    return priority if math.isfinite(priority) else 0.0
+
+def handle_command(cmd_data):
+    """执行服务器下发的指令"""
+    command = cmd_data.get("command")
+    logger.info(f"收到服务器指令: {command}")
     
-    # === 指令轮询任务 (心跳) ===
-    # 每 30 秒检查一次服务器是否有新指令
-    def poll_server():
+    params = cmd_data.get("params") or {}
+    if command == "refresh_all":
+        # 触发全量爬取 (协调器异步执行，正在跑时会合并或排队)
+        crawl_job(source=params.get("source", "server_command"))
+    elif command == "refresh_one":
+        # 仅刷新特定歌曲 (高优先级插队)
+        mid = params.get("mid")
+        if mid:
+            logger.info(f"执行单曲刷新: {mid}")
+            with db_pool.connection() as conn:
+                record_view(conn, mid)
+            crawl_coordinator.request_refresh_one(mid, source="server_command")
+    elif command == "refresh_songs":
+        # 服务器按访问热度挑出的又热又旧的歌 (按优先级插队)
+        songs = [
+            (song["mid"], parse_priority(song.get("priority")))
+            for song in params.get("songs") or [] if isinstance(song, dict) and song.get("mid")
+        ]
+        if songs:
+            with db_pool.connection() as conn:
+                for mid, _ in songs:
+                    record_view(conn, mid)
+            crawl_coordinator.request_refresh_songs(songs, source=params.get("source", "server_command"))
+    else:
+        logger.warning(f"未知指令: {command}")
+
+def poll_commands():
+    """指令长轮询线程：服务器有新指令会立即返回，没有则挂起 POLL_WAIT 秒"""
+    logger.info(f"指令长轮询已启动 (最长挂起 {POLL_WAIT}s)")
+    while True:
         try:
             # logger.info("正在检查服务器指令...") # 日志太多可以注释掉
-            resp = requests.get(f"{MAIN_SERVER_URL}/api/worker/poll", timeout=5)
-            if resp.status_code == 200:
-                data = resp.json()
-                if data.get("has_command"):
-                    cmd_data = data.get("data", {})
-                    command = cmd_data.get("command")
-                    logger.info(f"收到服务器指令: {command}")
-                    
-                    if command == "refresh_all":
-                        # 立即触发全量爬取
-                        # 使用线程异步执行，避免阻塞轮询循环
-                        threading.Thread(target=crawl_job).start()
-                    elif command == "refresh_one":
-                        # 仅刷新特定歌曲 (预留)
-                        mid = cmd_data.get("params", {}).get("mid")
-                        if mid:
-                            logger.info(f"执行单曲刷新: {mid}")
-                            # threading.Thread(target=scrape_one, args=(mid,)).start()
+            resp = requests.get(
+                f"{MAIN_SERVER_URL}/api/worker/poll",
+                params={"wait": POLL_WAIT},
+                timeout=POLL_WAIT + 10
+            )
+            if resp.status_code != 200:
+                logger.warning(f"拉取指令失败: {resp.status_code}")
+                time.sleep(POLL_RETRY_DELAY)
+                continue
+            data = resp.json()
+            if not data.get("has_command"):
+                continue
+            
+            cmd_data = data.get("data", {})
+            try:
+                handle_command(cmd_data)
+            except Exception as e:
+                # 处理失败不确认：租约到期后服务器会重新投递 (最多 command_queue.MAX_ATTEMPTS 次)
+                logger.error(f"处理指令失败，等待服务器重新投递: {cmd_data.get('command')} ({e})")
+                continue
+            # 指令已交给协调器 (协调器自己负责合并/排队)，确认后服务器不再重投
+            requests.post(
+                f"{MAIN_SERVER_URL}/api/worker/ack",
+                json={"id": cmd_data.get("id")},
+                timeout=5
+            )
         except Exception as e:
-            # 连接失败不要崩溃，只是记录警告
+            # 连接失败不要崩溃，只是记录警告，稍后重试
             logger.warning(f"连接主服务器失败: {e}")
+            time.sleep(POLL_RETRY_DELAY)
 
-    # 每 5 秒轮询一次，提高响应速度
-    schedule.every(5).seconds.do(poll_server)
+def run_scheduler():
+    """调度器线程"""
+    # === 自适应定时任务 ===
+    # 每隔 ADAPTIVE_CYCLE_MINUTES 抓一轮到期的歌: 变化大、常被查看的歌间隔短，
+    # 长期不变的歌指数退避，最长 crawl_schedule.SCHEDULE_MAX_INTERVAL (12 小时，不低于原来一天两次的保底)
+    # 启动时先跑一轮 (调度表在库里，只会抓已到期的)
+    adaptive_crawl_job()
+    schedule.every(ADAPTIVE_CYCLE_MINUTES).minutes.do(adaptive_crawl_job)
+    
+    # === 指令轮询 ===
+    # 单独线程长轮询，不占用定时任务循环
+    threading.Thread(target=poll_commands, name="command-poll", daemon=True).start()
     
-    logger.info("调度器已启动: 包含定时任务 + 指令轮询 (5s)")
+    logger.info("调度器已启动: 包含自适应定时任务 + 指令长轮询")
     
     while True:
         schedule.run_pending()
@@ -310,6 +632,8 @@ def run_scheduler():
 
 if __name__ == "__main__":
     init_db()
+    # 上次没推完的数据接着推
+    push_outbox.start()
     
     # 在单独线程中运行调度器和爬虫，主线程运行 Flask
     t = threading.Thread(target=run_scheduler)
@@ -0,0 +1,149 @@
+import time
+import logging
+import threading
+import urllib.parse
+from sqlite_pool import SQLitePool
+
+logger = logging.getLogger("response_cache")
+
+DAY = 86400
+# 各类上游接口的缓存有效期 (秒)
+# 歌词基本不会变；专辑曲目很少变；搜索结果 (热门歌曲排序) 变化较快
+DEFAULT_TTLS = {
+    "lyrics": 365 * DAY,
+    "album": 3 * DAY,
+    "search": 10 * 60,
+}
+DEFAULT_TTL = 10 * 60
+# 容量上限，超过后按最近访问时间 (LRU) 淘汰
+MAX_ENTRIES = 5000
+MAX_BYTES = 64 * 1024 * 1024
+# 每写入多少条检查一次容量
+EVICT_CHECK_EVERY = 50
+# 命中时最多每隔多少秒更新一次访问时间 (避免每次命中都写库)
+TOUCH_INTERVAL = 60
+
+class ResponseCache:
+    """基于 SQLite 的上游响应缓存
+
+    key 由接口名 + 规范化后的参数组成；过期数据在上游不可用时仍会返回 (stale)。
+    """
+
+    def __init__(self, db_path, ttls=None, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.db_path = str(db_path)
+        self.pool = SQLitePool(db_path, size=4)
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {}
+        self._init_schema()
+
+    def _init_schema(self):
+        with self.pool.connection() as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS http_cache (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    size INTEGER NOT NULL
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS idx_http_cache_accessed ON http_cache (accessed_at)")
+
+    @staticmethod
+    def make_key(endpoint, params):
+        """接口名 + 排序后的参数 (去掉空值、首尾空白)"""
+        items = sorted(
+            (str(k), str(v).strip()) for k, v in (params or {}).items() if v is not None and str(v).strip() != ""
+        )
+        return f"{endpoint}?{urllib.parse.urlencode(items)}"
+
+    def _count(self, endpoint, name):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {"hits": 0, "misses": 0, "stale": 0, "errors": 0})
+            stats[name] += 1
+
+    def get(self, endpoint, params):
+        """返回 (body, 是否新鲜)；没有缓存返回 (None, False)"""
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        with self.pool.connection() as con:
+            row = con.execute("SELECT body, created_at, accessed_at FROM http_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, False
+            if now - row[2] > TOUCH_INTERVAL:
+                con.execute("UPDATE http_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            fresh = now - row[1] < self.ttls.get(endpoint, DEFAULT_TTL)
+        return row[0], fresh
+
+    def put(self, endpoint, params, body):
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        with self.pool.connection() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO http_cache (key, endpoint, body, created_at, accessed_at, size) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, body, now, now, len(body))
+            )
+        with self._lock:
+            self._writes += 1
+            check = self._writes % EVICT_CHECK_EVERY == 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        """超过条数或总大小上限时，按最近访问时间淘汰最旧的条目"""
+        with self.pool.connection() as con:
+            count, total = con.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM http_cache").fetchone()
+            removed = 0
+            if count > self.max_entries:
+                removed += con.execute("""
+                    DELETE FROM http_cache WHERE key IN (
+                        SELECT key FROM http_cache ORDER BY accessed_at ASC LIMIT ?
+                    )
+                """, (count - self.max_entries,)).rowcount
+            while total > self.max_bytes:
+                rows = con.execute("SELECT key, size FROM http_cache ORDER BY accessed_at ASC LIMIT 100").fetchall()
+                if not rows:
+                    break
+                for key, size in rows:
+                    con.execute("DELETE FROM http_cache WHERE key = ?", (key,))
+                    total -= size
+                    removed += 1
+                    if total <= self.max_bytes:
+                        break
+        if removed:
+            logger.info(f"Response cache evicted {removed} entries")
+
+    def get_or_fetch(self, endpoint, params, fetch_fn):
+        """优先返回新鲜缓存；否则调用 fetch_fn() 取上游 (返回字符串) 并写入缓存
+
+        上游失败时如果有过期缓存则返回过期数据，否则抛出原异常。
+        返回 (body, 状态)，状态为 hit / miss / stale
+        """
+        body, fresh = self.get(endpoint, params)
+        if body is not None and fresh:
+            self._count(endpoint, "hits")
+            return body, "hit"
+        try:
+            new_body = fetch_fn()
+        except Exception as e:
+            self._count(endpoint, "errors")
+            if body is not None:
+                self._count(endpoint, "stale")
+                logger.warning(f"Upstream {endpoint} failed ({e}), serving stale cache")
+                return body, "stale"
+            raise
+        self._count(endpoint, "misses")
+        self.put(endpoint, params, new_body)
+        return new_body, "miss"
+
+    def stats(self):
+        with self.pool.connection() as con:
+            count, total = con.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM http_cache").fetchone()
+        with self._lock:
+            endpoints = {name: dict(stats) for name, stats in self._stats.items()}
+        return {"entries": count, "bytes": total, "max_entries": self.max_entries, "max_bytes": self.max_bytes, "endpoints": endpoints}
@@ -0,0 +1,97 @@
+import time
+
+# 每次 Selenium 抓取一行：各阶段耗时 (毫秒，没经历的阶段为 NULL) + 浏览器进程树内存峰值
+SCRAPE_PHASES = ("launch", "cookies", "page_load", "api_wait", "base_data_wait", "settle", "parse", "screenshot")
+
+SCRAPE_RUNS_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS scrape_runs (
+    id INTEGER PRIMARY KEY,
+    mid TEXT NOT NULL,
+    started_at REAL NOT NULL,     -- 开始时间 (unix 秒)
+    outcome TEXT NOT NULL,        -- ok / error / captcha
+    extract_mode TEXT,            -- api / dom
+    total_ms REAL,
+    {", ".join(f"{phase}_ms REAL" for phase in SCRAPE_PHASES)},
+    rss_peak_mb REAL              -- 页面处理完时 chromedriver + Chrome 进程树的 RSS (每首歌测一次)
+)
+"""
+
+# 只保留最近多少条记录 (树莓派 SD 卡空间有限)
+SCRAPE_RUNS_KEEP = 5000
+# 汇总接口默认 / 最多统计最近多少次抓取
+SUMMARY_DEFAULT_RUNS = 200
+SUMMARY_MAX_RUNS = SCRAPE_RUNS_KEEP
+SUMMARY_PERCENTILES = (50, 90, 99)
+
+def init_scrape_runs_table(con):
+    con.execute(SCRAPE_RUNS_SCHEMA)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_scrape_runs_started ON scrape_runs (started_at)")
+
+def record_scrape_run(con, run):
+    """写入一次抓取记录 (run 来自 scrape_selenium.ScrapeTiming.summary)，顺带清理过旧的记录"""
+    phases = run.get("phases") or {}
+    columns = ["mid", "started_at", "outcome", "extract_mode", "total_ms"] + [f"{p}_ms" for p in SCRAPE_PHASES] + ["rss_peak_mb"]
+    values = [run["mid"], run["started_at"], run["outcome"], run.get("extract_mode"), run.get("total_ms")]
+    values += [phases.get(p) for p in SCRAPE_PHASES] + [run.get("rss_peak_mb")]
+    cur = con.execute(
+        f"INSERT INTO scrape_runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values
+    )
+    # id 单调递增，按 id 删最便宜；每 100 条清理一次
+    if cur.lastrowid % 100 == 0:
+        con.execute("DELETE FROM scrape_runs WHERE id <= ?", (cur.lastrowid - SCRAPE_RUNS_KEEP,))
+
+def percentile(sorted_values, p):
+    """线性插值百分位，sorted_values 需已排序且非空"""
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def describe(values):
+    """一列数值的统计: 次数 / 平均 / 各百分位 / 最大；没有数据返回 None"""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    stats = {"count": len(values), "mean": round(sum(values) / len(values), 1)}
+    for p in SUMMARY_PERCENTILES:
+        stats[f"p{p}"] = round(percentile(values, p), 1)
+    stats["max"] = round(values[-1], 1)
+    return stats
+
+def summarize_scrape_runs(con, limit=SUMMARY_DEFAULT_RUNS, since=None, mid=None):
+    """最近 limit 次抓取的分阶段耗时百分位，以及每个阶段平均占总耗时的比例"""
+    where, params = [], []
+    if since is not None:
+        where.append("started_at >= ?")
+        params.append(since)
+    if mid:
+        where.append("mid = ?")
+        params.append(mid)
+    sql = "SELECT * FROM scrape_runs"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    rows = con.execute(sql + " ORDER BY id DESC LIMIT ?", params + [limit]).fetchall()
+
+    outcomes = {}
+    for row in rows:
+        outcomes[row["outcome"]] = outcomes.get(row["outcome"], 0) + 1
+    total_sum = sum(row["total_ms"] or 0 for row in rows)
+    phases = {}
+    for phase in SCRAPE_PHASES:
+        column = [row[f"{phase}_ms"] for row in rows]
+        stats = describe(column)
+        if stats is None:
+            continue
+        # 占比按所有抓取的总耗时算，能直接看出时间花在哪
+        stats["share"] = round(sum(v for v in column if v is not None) / total_sum, 3) if total_sum else None
+        phases[phase] = stats
+    return {
+        "runs": len(rows),
+        "from": rows[-1]["started_at"] if rows else None,
+        "to": rows[0]["started_at"] if rows else None,
+        "outcomes": outcomes,
+        "total_ms": describe(row["total_ms"] for row in rows),
+        "phases_ms": phases,
+        "rss_peak_mb": describe(row["rss_peak_mb"] for row in rows),
+        "generated_at": int(time.time()),
+    }
@@ -4,7 +4,15 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
+from selenium.common.exceptions import WebDriverException, InvalidSessionIdException
+from music_index_parser import parse_music_index_html
+from collections import deque
+from contextlib import contextmanager
+import atexit
+import json
+import os
+import queue
+import threading
 import time
 import re
 import logging
@@ -21,68 +29,149 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def scrape_music_index(song_mid):
-    """
-    使用 Selenium 渲染 H5 页面并抓取数据
-    """
-    driver = None
-    try:
-        logger.info(f"开始抓取任务: mid={song_mid}")
-        
-        # 构造目标 URL
-        # 关键修改：移除 openinqqmusic=1 参数，防止自动跳转到下载页
-        # 改为 openinqqmusic=0 试试，或者直接不带
-        url = f"https://y.qq.com/m/client/music_index/index.html?ADTAG=cbshare&channelId=10036163&mid={song_mid}&type={song_mid}"
-        
-        # print(f"正在启动浏览器抓取: {url}")
-        
-        # 配置无头浏览器模式 (Headless)
-        chrome_options = Options()
-        
-        # === 关键设置：开启无头模式 (不弹框) ===
-        # chrome_options.add_argument("--headless=new") 
-        # PC端调试时可以注释掉上面这行，看到浏览器界面
-        # 但服务器端必须开启，否则报错
-        # 为了调试，暂时开启，但注意服务器可能没有GUI
-        chrome_options.add_argument("--headless=new") 
-        
-        # === 优化加载策略 ===
-        # eager: DOMContentLoaded 触发即返回，不等图片和样式表
-        chrome_options.page_load_strategy = 'eager'
-        
-        # 其他必要的稳定性参数
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage") # 关键：防止内存不足导致的崩溃
-        chrome_options.add_argument("--disable-extensions")
-        chrome_options.add_argument("--disable-infobars")
-        # 降级：改回小分辨率，减少渲染压力
-        chrome_options.add_argument("--window-size=375,812") 
-        # 降级：强制单进程 (省内存，但可能不稳定)
-        # chrome_options.add_argument("--single-process") 
-        
-        # 禁用图片加载（加速）
-        prefs = {"profile.managed_default_content_settings.images": 2}
-        chrome_options.add_experimental_option("prefs", prefs)
-
-        # 隐藏自动化控制特征 (防止被识别为爬虫)
-        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        
-        # PC端 User-Agent (伪装成普通电脑浏览器)
-        chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-        
-        # === 关键修改：手动指定 Chromedriver 路径 (适配树莓派) ===
-        # 树莓派 apt 安装的 chromedriver 通常在 /usr/bin/chromedriver
-        service = Service("/usr/bin/chromedriver")
-        
+# === 浏览器池配置 ===
+# 树莓派内存有限，默认只常驻 1 个浏览器
+BROWSER_POOL_SIZE = 1
+# 单个浏览器加载多少个页面后回收重建 (Chrome 长时间运行会慢慢涨内存)
+BROWSER_MAX_PAGES = 50
+# 浏览器进程树内存 (RSS) 超过该值 (MB) 时回收重建
+BROWSER_MAX_RSS_MB = 600
+
+# === 数据提取模式 ===
+# "api": 通过 CDP 截获 H5 页面自己请求的 JSON 数据接口，拿到即返回 (无需等动画、解析整页 DOM)
+# "dom": 等 .base_data 渲染完成后解析整页 HTML (api 模式失败时也会回退到这里)
+# API_FIELD_KEYS 还没有对照真实抓到的接口数据核实过，核实之前默认用 dom
+# (api 模式下设置 FIXTURE_DUMP_DIR 会把截获的接口 JSON 存下来，可用来核实 key 并补充 tests 里的样本)
+# 只在浏览器启动时读取 (决定是否打开 performance 日志和 Network 域)，改了之后新启动的浏览器才生效
+EXTRACT_MODE = "dom"
+# dom 模式的 HTML 解析后端: "html.parser" / "lxml" / "regex" (对比见 benchmarks/bench_parser.py)
+PARSER_BACKEND = "html.parser"
+# 设置为目录时，dom 模式会把渲染后的页面存下来 (用于补充 benchmarks/fixtures 的样本)
+FIXTURE_DUMP_DIR = None
+# api 模式等待接口响应的最长时间 (秒)，超时回退 DOM 解析
+API_WAIT_TIMEOUT = 10
+# QQ 音乐 H5 站点地址 (压测时指向本地替身服务，见 benchmarks/fake_qqmusic.py)
+QQ_MUSIC_WEB_BASE = "https://y.qq.com"
+# 是否截取页面上的走势图 (滚动到 canvas + 等待渲染 + 截图，是单曲抓取里最耗时耗内存的一步)
+# 主服务器已能用指标历史画 SVG 走势图 (/api/charts/trend/<mid>.svg)，默认跳过
+CAPTURE_CHART = False
+# 每次抓取结束后的回调 ON_SCRAPE_RUN(run)，run 里有各阶段耗时和浏览器内存峰值 (见 ScrapeTiming.summary)
+# Worker 用它把记录写进 scrape_runs 表；None 表示不记录
+ON_SCRAPE_RUN = None
+# H5 页面拉数据用的接口 (u.y.qq.com 的统一网关)
+API_URL_MARKERS = ("/cgi-bin/musicu.fcg", "/cgi-bin/musics.fcg")
+
+# 接口 JSON 中各字段可能使用的 key (按优先级)，匹配时忽略大小写
+# 接口字段没有公开文档，如果 QQ 音乐改版导致取不到，会自动回退 DOM 解析。
+# 不放 "index" / "rank" / "history" 这类泛用 key：接口里别的字典 (榜单、分页等) 也会有，匹配上就会存下错误的数字且不回退
+API_FIELD_KEYS = {
+    "music_index": ("musicIndex", "realTimeIndex", "curIndex"),
+    "global_rank": ("globalRank", "totalRank", "curRank"),
+    "yesterday_index": ("yesterdayIndex", "lastIndex", "yIndex"),
+    "yesterday_rank": ("yesterdayRank", "lastRank", "yRank"),
+    "index_change": ("indexChange", "indexRate", "indexRatio"),
+    "rank_change": ("rankChange", "rankDiff"),
+    "listening_count": ("listenNum", "listeningNum", "onlineNum", "listenCnt"),
+    "update_time": ("updateTime", "updateTimeStr", "lastUpdate"),
+}
+API_ACHIEVEMENT_KEYS = ("historyList", "honorList", "achievements")
+# api 模式至少要拿到这些字段才算成功
+API_REQUIRED_FIELDS = ("music_index", "global_rank")
+
+# 页面标题/地址中出现这些字样说明被风控拦截到了验证页
+CAPTCHA_MARKERS = ("captcha", "验证码", "安全验证", "ssl.captcha")
+
+# 这里需要填入您真实的 Cookie 字符串
+# 格式：name=value; name2=value2
+# 请替换下面的 YOUR_COOKIE_STRING
+COOKIE_STR = "pgv_pvid=9888223789; fqm_pvqid=aa73bd2d-8891-4459-9991-d3fd1dd14a0c; ts_uid=6903786015; RK=qW/MksAPSL; ptcz=365fccecb0300eae1976f99dc784fa5df954e11503db1e1eb8e097bf91643341; music_ignore_pskey=202306271436Hn@vBj; psrf_access_token_expiresAt=1774327054; wxrefresh_token=; qqmusic_key=Q_H_L_63k3NbttD0oEr3n34KYVsXLRC2lHda3QHt3Lz6JinAtEosLMwcXlanBchImQmMKBcJ2ZlIVPykeEMtW2ZI9vK9idq; psrf_musickey_createtime=1769143054; uin=198646534; psrf_qqopenid=0170E97BDEEEA9B2D171400B3A80A8BE; euin=oKEF7wvs7KoP; qm_keyst=Q_H_L_63k3NbttD0oEr3n34KYVsXLRC2lHda3QHt3Lz6JinAtEosLMwcXlanBchImQmMKBcJ2ZlIVPykeEMtW2ZI9vK9idq; psrf_qqrefresh_token=4ED43700E5CBFD5D077A52CEF4B522E4; wxopenid=; tmeLoginType=2; wxunionid=; psrf_qqaccess_token=45CE3D2302D87320F2FC3DA053B7C046; psrf_qqunionid=8CA39F052C98785246391F8889CA98A0; ts_refer=ADTAGcbshare; fqm_sessionid=aae29a5f-11ee-42cc-a309-53a546ccabea; pgv_info=ssid=s8560956036; ts_last=y.qq.com/m/client/music_index/index.html"
+
+# 出现这些错误说明浏览器已经崩溃/失联，需要重建
+DEAD_DRIVER_MARKERS = (
+    "invalid session id",
+    "chrome not reachable",
+    "session deleted",
+    "disconnected",
+    "no such window",
+    "target window already closed",
+    "connection refused",
+)
+
+def build_chrome_options():
+    """构造 Chrome 启动参数"""
+    # 配置无头浏览器模式 (Headless)
+    chrome_options = Options()
+    
+    # === 关键设置：开启无头模式 (不弹框) ===
+    # chrome_options.add_argument("--headless=new") 
+    # PC端调试时可以注释掉上面这行，看到浏览器界面
+    # 但服务器端必须开启，否则报错
+    # 为了调试，暂时开启，但注意服务器可能没有GUI
+    chrome_options.add_argument("--headless=new") 
+    
+    # === 优化加载策略 ===
+    # eager: DOMContentLoaded 触发即返回，不等图片和样式表
+    chrome_options.page_load_strategy = 'eager'
+    
+    # 其他必要的稳定性参数
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage") # 关键：防止内存不足导致的崩溃
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-infobars")
+    # 降级：改回小分辨率，减少渲染压力
+    chrome_options.add_argument("--window-size=375,812") 
+    # 降级：强制单进程 (省内存，但可能不稳定)
+    # chrome_options.add_argument("--single-process") 
+    
+    # 禁用图片加载（加速）
+    prefs = {"profile.managed_default_content_settings.images": 2}
+    chrome_options.add_experimental_option("prefs", prefs)
+
+    # 隐藏自动化控制特征 (防止被识别为爬虫)
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    
+    # PC端 User-Agent (伪装成普通电脑浏览器)
+    chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+    
+    # 打开 performance 日志，api 模式靠它拿到 Network.* 事件
+    # (只有 api 模式会读取并清空这份日志，dom 模式打开的话会一直攒在浏览器里)
+    if EXTRACT_MODE == "api":
+        chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    return chrome_options
+
+def inject_cookies(driver):
+    """在 y.qq.com 域下注入登录 Cookie (每个浏览器只需要做一次)"""
+    # 访问任意一个 QQ 音乐域名下的页面来设置 Cookie
+    driver.get(QQ_MUSIC_WEB_BASE)
+    
+    for item in COOKIE_STR.split('; '):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            # 关键：同时为 .qq.com 和 .y.qq.com 设置 Cookie
+            driver.add_cookie({'name': name, 'value': value, 'domain': '.qq.com'})
+            driver.add_cookie({'name': name, 'value': value, 'domain': 'y.qq.com'})
+    
+    logger.info("Cookie 注入完成")
+
+def launch_driver():
+    """启动一个已完成反检测设置和 Cookie 注入的浏览器"""
+    chrome_options = build_chrome_options()
+    
+    # === 关键修改：手动指定 Chromedriver 路径 (适配树莓派) ===
+    # 树莓派 apt 安装的 chromedriver 通常在 /usr/bin/chromedriver
+    service = Service("/usr/bin/chromedriver")
+    
+    with scrape_phase("launch"):
         try:
             driver = webdriver.Chrome(service=service, options=chrome_options)
         except Exception as e:
             logger.warning(f"尝试使用默认路径启动失败: {e}，尝试不指定路径...")
             driver = webdriver.Chrome(options=chrome_options)
-        
+    
+    try:
         # 启用 CDP 命令，模拟触摸支持 (即使是 PC UA，有时也需要)
         driver.execute_cdp_cmd("Emulation.setTouchEmulationEnabled", {
             "enabled": True,
@@ -102,192 +191,599 @@ def scrape_music_index(song_mid):
             """
         })
         
-        # 核心：注入 Cookie
-        # 访问任意一个 QQ 音乐域名下的页面来设置 Cookie
-        driver.get("https://y.qq.com")
-        
-        # 这里需要填入您真实的 Cookie 字符串
-        # 格式：name=value; name2=value2
-        # 请替换下面的 YOUR_COOKIE_STRING
-        cookie_str = "pgv_pvid=9888223789; fqm_pvqid=aa73bd2d-8891-4459-9991-d3fd1dd14a0c; ts_uid=6903786015; RK=qW/MksAPSL; ptcz=365fccecb0300eae1976f99dc784fa5df954e11503db1e1eb8e097bf91643341; music_ignore_pskey=202306271436Hn@vBj; psrf_access_token_expiresAt=1774327054; wxrefresh_token=; qqmusic_key=Q_H_L_63k3NbttD0oEr3n34KYVsXLRC2lHda3QHt3Lz6JinAtEosLMwcXlanBchImQmMKBcJ2ZlIVPykeEMtW2ZI9vK9idq; psrf_musickey_createtime=1769143054; uin=198646534; psrf_qqopenid=0170E97BDEEEA9B2D171400B3A80A8BE; euin=oKEF7wvs7KoP; qm_keyst=Q_H_L_63k3NbttD0oEr3n34KYVsXLRC2lHda3QHt3Lz6JinAtEosLMwcXlanBchImQmMKBcJ2ZlIVPykeEMtW2ZI9vK9idq; psrf_qqrefresh_token=4ED43700E5CBFD5D077A52CEF4B522E4; wxopenid=; tmeLoginType=2; wxunionid=; psrf_qqaccess_token=45CE3D2302D87320F2FC3DA053B7C046; psrf_qqunionid=8CA39F052C98785246391F8889CA98A0; ts_refer=ADTAGcbshare; fqm_sessionid=aae29a5f-11ee-42cc-a309-53a546ccabea; pgv_info=ssid=s8560956036; ts_last=y.qq.com/m/client/music_index/index.html"
-        
-        for item in cookie_str.split('; '):
-            if '=' in item:
-                name, value = item.split('=', 1)
-                # 关键：同时为 .qq.com 和 .y.qq.com 设置 Cookie
-                driver.add_cookie({'name': name, 'value': value, 'domain': '.qq.com'})
-                driver.add_cookie({'name': name, 'value': value, 'domain': 'y.qq.com'})
-        
-        logger.info("Cookie 注入完成")
+        # api 模式需要 Network 域事件 (只记录事件，不拦截请求)
+        if EXTRACT_MODE == "api":
+            driver.execute_cdp_cmd("Network.enable", {})
         
-        # 刷新页面以生效 (或者直接跳转目标页)
-        # 既然注入了 PC Cookie，我们可以试着伪装成 PC 浏览器去访问 H5
-        # 但是！QQ音乐的 Cookie 是分域名的，y.qq.com 的 Cookie 可能不通用于 m.y.qq.com
-        # 我们先试试直接访问目标页
+        # 核心：注入 Cookie
+        with scrape_phase("cookies"):
+            inject_cookies(driver)
         
         # 恢复正常的超时
         driver.set_page_load_timeout(60) # 降级：放宽超时时间
-        
-        logger.info("浏览器已启动，正在加载页面...")
+    except Exception:
+        driver.quit()
+        raise
+    
+    return driver
+
+def process_tree_rss_mb(root_pid):
+    """统计 chromedriver 及其所有子进程 (Chrome 渲染进程等) 的 RSS，单位 MB
+
+    只支持 Linux (/proc)，其他平台返回 None
+    """
+    if not root_pid or not os.path.isdir("/proc"):
+        return None
+    
+    children = {}
+    rss_pages = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
         try:
-            driver.get(url)
-        except Exception as e:
-            logger.warning(f"页面加载超时或不完整 (eager mode): {e}")
-        
-        logger.info(f"页面加载阶段结束，当前标题: {driver.title}")
-        
-        # === 调试：打印页面源码的前 1000 个字符 ===
-        # 这样我们就能知道到底跳到了什么页面（是验证码？是404？还是App下载页？）
-        logger.info(f"页面源码预览: {driver.page_source[:1000]}")
-        
-        logger.info("等待关键元素渲染...")
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "base_data"))
-        )
-        logger.info("关键元素已出现")
-        
-        # 给一点额外的缓冲时间让数字跳动动画结束
-        time.sleep(2)
-        
-        # 获取渲染后的 HTML
-        html = driver.page_source
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # --- 解析数据 ---
-        result = {}
-        
-        # 1. 实时数据 (指数、排名)
-        # 结构: <div class="base_data_item" role="text" aria-label="实时音乐指数为303">...</div>
-        index_node = soup.find(attrs={"aria-label": re.compile(r"实时音乐指数")})
-        if index_node:
-            text = index_node.get("aria-label")
-            result['music_index'] = re.search(r"[\d,]+", text).group(0)
-            
-        rank_node = soup.find(attrs={"aria-label": re.compile(r"全站排名")})
-        if rank_node:
-            text = rank_node.get("aria-label")
-            result['global_rank'] = re.search(r"[\d]+", text).group(0)
-            
-        # 1.5 最近更新时间
-        update_time_node = soup.find(string=re.compile(r"最近更新"))
-        if update_time_node:
-            result['update_time'] = update_time_node.strip()
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # comm 字段可能带空格，取最后一个 ')' 之后的部分
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        pid = int(entry)
+        ppid = int(fields[1])
+        children.setdefault(ppid, []).append(pid)
+        rss_pages[pid] = int(fields[21])
+    
+    if root_pid not in rss_pages:
+        return None
+    
+    total = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += rss_pages.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+def is_driver_dead(exc):
+    """判断异常是否意味着浏览器会话已经不可用"""
+    if isinstance(exc, InvalidSessionIdException):
+        return True
+    if isinstance(exc, WebDriverException):
+        msg = str(exc).lower()
+        return any(marker in msg for marker in DEAD_DRIVER_MARKERS)
+    return False
+
+class PooledBrowser:
+    """浏览器池中的一个常驻浏览器 (懒启动，崩溃/超限后自动重建)"""
 
-        # 2. 详细对比数据 (昨日指数、较前一天等)
+    def __init__(self, slot_id):
+        self.slot_id = slot_id
+        self.driver = None
+        self.pages = 0
+        self.started_at = None
+
+    def ensure_started(self):
+        if self.driver is None:
+            logger.info(f"[浏览器池] 启动浏览器 #{self.slot_id}")
+            self.driver = launch_driver()
+            self.pages = 0
+            self.started_at = time.time()
+        return self.driver
+
+    def alive(self):
+        if self.driver is None:
+            return False
         try:
-             # 找到包含详细数据的容器
-             mini_data_container = soup.find(class_=re.compile("base_mini_data"))
-             
-             if mini_data_container:
-                 # 截图显示这是平铺的4个 item
-                 # Item 0: 昨日指数
-                 # Item 1: 指数涨跌
-                 # Item 2: 昨日排名
-                 # Item 3: 排名涨跌
-                 items = mini_data_container.find_all(class_=re.compile("base_mini_data__item"))
-                 
-                 for i, item in enumerate(items):
-                     label = item.get("aria-label", "")
-                     # 提取数值部分 (去掉中文前缀)
-                     # 比如 "昨日指数296,407" -> "296,407"
-                     # "较前一天下降1.23%" -> "下降1.23%"
-                     
-                     if "昨日指数" in label:
-                         result['yesterday_index'] = re.sub(r"昨日指数", "", label)
-                     elif "昨日排名" in label:
-                         result['yesterday_rank'] = re.sub(r"昨日排名", "", label)
-                     elif "较前一天" in label:
-                         change_val = re.sub(r"较前一天", "", label)
-                         # 根据索引判断归属
-                         if i == 1: # 紧跟在指数后面
-                             result['index_change'] = change_val
-                         elif i >= 3: # 紧跟在排名后面
-                             result['rank_change'] = change_val
+            # 轻量探测：会话失效时会直接抛异常
+            self.driver.current_window_handle
+            return True
+        except Exception:
+            return False
+
+    def rss_mb(self):
+        if self.driver is None:
+            return None
+        try:
+            return process_tree_rss_mb(self.driver.service.process.pid)
+        except Exception:
+            return None
+
+    def reset_tabs(self):
+        """只保留一个标签页，后续歌曲复用它"""
+        handles = self.driver.window_handles
+        for handle in handles[1:]:
+            self.driver.switch_to.window(handle)
+            self.driver.close()
+        self.driver.switch_to.window(handles[0])
 
+    def recycle_if_needed(self, rss=None):
+        """超过页面数或内存上限时关闭浏览器，下次使用时重建
+
+        rss: 调用方刚测过的内存 (MB)；不传时只看页面数 (这里不自己扫 /proc，每首歌只在抓完时测一次)
+        """
+        if self.driver is None:
+            return
+        reason = None
+        if self.pages >= BROWSER_MAX_PAGES:
+            reason = f"已加载 {self.pages} 个页面"
+        elif rss is not None and rss > BROWSER_MAX_RSS_MB:
+            reason = f"内存 {rss:.0f}MB 超过上限 {BROWSER_MAX_RSS_MB}MB"
+        if reason:
+            logger.info(f"[浏览器池] 回收浏览器 #{self.slot_id}: {reason}")
+            self.quit()
+
+    def quit(self):
+        if self.driver is None:
+            return
+        try:
+            self.driver.quit()
+            logger.info(f"[浏览器池] 浏览器 #{self.slot_id} 已关闭")
         except Exception as e:
-            print(f"解析详细数据失败: {e}")
+            logger.error(f"关闭浏览器失败: {e}")
+        finally:
+            self.driver = None
+            self.pages = 0
+            self.started_at = None
 
-        # 3. 正在听人数
-        listening_node = soup.find(string=re.compile(r"人正在听"))
-        if listening_node:
-            result['listening_count'] = re.search(r"[\d,]+", listening_node).group(0)
+class BrowserPool:
+    """常驻无头浏览器池
 
-        # 4. 歌曲成就 (解析列表)
-        achievements = []
+    浏览器启动并注入 Cookie 后一直保留，供后续歌曲复用，
+    避免每首歌都重新启动 Chrome。
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE):
+        self.size = size
+        self._slots = queue.Queue()
+        self._all = [PooledBrowser(i) for i in range(size)]
+        for browser in self._all:
+            self._slots.put(browser)
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """借出一个浏览器，用完自动归还
+
+        用法:
+            with BROWSER_POOL.checkout() as browser:
+                scrape_music_index(mid, browser=browser)
+        """
         try:
-            # 查找所有 history_item 类的元素
-            ach_items = soup.find_all(class_=re.compile("history_item"))
-            for item in ach_items:
-                # 跳过没有内容的项
-                if not item.get_text(strip=True):
-                    continue
-                    
-                # 尝试从 aria-label 获取完整文本 (截图显示 aria-label 包含了所有信息)
-                # 例如: aria-label="热歌榜 当前排名10 历史在榜1048期 最高排名4"
-                # 但日期可能在子元素里
-                
-                date_node = item.find(class_=re.compile("history_item_time"))
-                content_node = item.find(class_=re.compile("history_item_cont")) or \
-                               item.find(class_=re.compile("history_item_colum")) # 截图里有 history_item_colum
-                
-                date_text = date_node.get_text(strip=True) if date_node else ""
-                content_text = content_node.get_text(strip=True) if content_node else ""
-                
-                # 如果找不到具体节点，尝试用 aria-label
-                if not content_text:
-                    content_text = item.get("aria-label", "")
-                
-                if content_text:
-                    # 组合成前端需要的格式: "YYYY/MM/DD 内容"
-                    if date_text and not content_text.startswith(date_text):
-                        achievements.append(f"{date_text} {content_text}")
-                    else:
-                        achievements.append(content_text)
-                        
+            browser = self._slots.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("浏览器池已满，等待超时")
+        try:
+            if browser.driver is not None and not browser.alive():
+                logger.warning(f"[浏览器池] 浏览器 #{browser.slot_id} 已失联，重建")
+                browser.quit()
+            yield browser
+        finally:
+            if self._closed:
+                browser.quit()
+            else:
+                # 内存已在每首歌抓完时测过并判断过，这里只看页面数
+                browser.recycle_if_needed()
+            self._slots.put(browser)
+
+    def status(self):
+        return [
+            {
+                "slot": b.slot_id,
+                "running": b.driver is not None,
+                "pages": b.pages,
+                "uptime": int(time.time() - b.started_at) if b.started_at else 0
+            } for b in self._all
+        ]
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+        for browser in self._all:
+            browser.quit()
+
+BROWSER_POOL = BrowserPool()
+atexit.register(BROWSER_POOL.shutdown)
+
+# 当前线程正在进行的抓取计时 (每个抓取线程同一时间只抓一首歌)
+_current_timing = threading.local()
+
+class ScrapeTiming:
+    """一次抓取的分阶段耗时和浏览器内存峰值
+
+    阶段: launch (启动浏览器) / cookies (注入 Cookie) / page_load (加载目标页) /
+          api_wait (api 模式等接口) / base_data_wait (dom 模式等 .base_data) / settle (固定等待动画) /
+          parse (解析 HTML) / screenshot (截走势图)。没经历的阶段不出现，浏览器崩溃重试时累加
+    内存只在页面处理完时测一次 (重试时取较大的一次)，不在每个阶段都扫 /proc
+    """
+
+    def __init__(self, mid):
+        self.mid = mid
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.phases = {}
+        self.rss_peak_mb = None
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds * 1000
+
+    def record_rss(self, rss):
+        if rss is not None and (self.rss_peak_mb is None or rss > self.rss_peak_mb):
+            self.rss_peak_mb = rss
+
+    def summary(self, result):
+        if result and "error" not in result:
+            outcome = "ok"
+        else:
+            outcome = "captcha" if result and result.get("captcha") else "error"
+        return {
+            "mid": self.mid,
+            "started_at": self.started_at,
+            "outcome": outcome,
+            "extract_mode": EXTRACT_MODE,
+            "total_ms": round((time.perf_counter() - self._started) * 1000, 1),
+            "phases": {phase: round(ms, 1) for phase, ms in self.phases.items()},
+            "rss_peak_mb": None if self.rss_peak_mb is None else round(self.rss_peak_mb, 1),
+        }
+
+@contextmanager
+def scrape_phase(phase):
+    """给当前线程的抓取记一段阶段耗时 (不在抓取中时什么都不做)"""
+    timing = getattr(_current_timing, "value", None)
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(phase, time.perf_counter() - started)
+
+def scrape_music_index(song_mid, browser=None):
+    """
+    使用 Selenium 渲染 H5 页面并抓取数据
+
+    browser: 已借出的 PooledBrowser (批量任务整批复用同一个)，
+             不传则临时从 BROWSER_POOL 借一个
+    """
+    if browser is None:
+        with BROWSER_POOL.checkout() as browser:
+            return scrape_music_index(song_mid, browser=browser)
+    
+    timing = ScrapeTiming(song_mid)
+    _current_timing.value = timing
+    result = None
+    try:
+        result = _scrape_with_browser(song_mid, browser)
+        return result
+    finally:
+        _current_timing.value = None
+        if ON_SCRAPE_RUN is not None:
+            try:
+                ON_SCRAPE_RUN(timing.summary(result))
+            except Exception as e:
+                logger.warning(f"记录抓取耗时失败: {e}")
+
+def _scrape_with_browser(song_mid, browser):
+    # 浏览器中途崩溃时自动重建并重试一次
+    for attempt in range(2):
+        try:
+            driver = browser.ensure_started()
+            browser.reset_tabs()
+            result = _scrape_page(driver, song_mid)
+            browser.pages += 1
+            # 统计 /proc 下的进程树内存有开销，每首歌只在页面处理完 (内存最高) 时测一次，
+            # 抓取记录和回收判断共用这一次
+            rss = browser.rss_mb()
+            timing = getattr(_current_timing, "value", None)
+            if timing is not None:
+                timing.record_rss(rss)
+            browser.recycle_if_needed(rss)
+            return result
         except Exception as e:
-            print(f"解析成就失败: {e}")
-        
-        result['achievements'] = achievements[:10] # 取前10条
+            if is_driver_dead(e):
+                logger.warning(f"[浏览器池] 浏览器 #{browser.slot_id} 崩溃: {e}")
+                browser.quit()
+                if attempt == 0:
+                    logger.info("重建浏览器后重试...")
+                    continue
+            logger.error(f"Selenium 抓取失败: {e}")
+            logger.error(traceback.format_exc())
+            return {"error": str(e)}
 
-        # 5. [核心] 截图图表
-        # 找到图表区域 (通常包含 canvas)
+def _scrape_page(driver, song_mid):
+    """在已就绪的浏览器里加载 H5 页面并解析数据"""
+    logger.info(f"开始抓取任务: mid={song_mid}")
+    
+    # 构造目标 URL
+    # 关键修改：移除 openinqqmusic=1 参数，防止自动跳转到下载页
+    # 改为 openinqqmusic=0 试试，或者直接不带
+    url = f"{QQ_MUSIC_WEB_BASE}/m/client/music_index/index.html?ADTAG=cbshare&channelId=10036163&mid={song_mid}&type={song_mid}"
+    
+    # 刷新页面以生效 (或者直接跳转目标页)
+    # 既然注入了 PC Cookie，我们可以试着伪装成 PC 浏览器去访问 H5
+    # 但是！QQ音乐的 Cookie 是分域名的，y.qq.com 的 Cookie 可能不通用于 m.y.qq.com
+    # 我们先试试直接访问目标页
+    
+    if EXTRACT_MODE == "api":
+        drain_network_log(driver)
+    
+    logger.info("正在加载页面...")
+    with scrape_phase("page_load"):
         try:
-            # 1. 显式等待 Canvas 出现
-            # canvas 是图表的核心，必须等它画出来
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "canvas"))
-            )
-            canvas = driver.find_element(By.TAG_NAME, "canvas")
-            
-            # 2. 滚动到 Canvas 可见区域 (防止懒加载不渲染)
-            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", canvas)
-            time.sleep(1) # 等待滚动和渲染
+            driver.get(url)
+        except Exception as e:
+            if is_driver_dead(e):
+                raise
+            logger.warning(f"页面加载超时或不完整 (eager mode): {e}")
+    
+    title = driver.title
+    logger.info(f"页面加载阶段结束，当前标题: {title}")
+    
+    # 被拦截到验证码页面时直接返回，交给调用方退避
+    landing = f"{title} {driver.current_url}".lower()
+    if any(marker in landing for marker in CAPTCHA_MARKERS):
+        logger.warning(f"命中验证码页面: {driver.current_url}")
+        return {"error": "captcha", "captcha": True}
+    
+    result = None
+    if EXTRACT_MODE == "api":
+        try:
+            with scrape_phase("api_wait"):
+                result = extract_from_network(driver, timeout=API_WAIT_TIMEOUT, song_mid=song_mid)
+        except Exception as e:
+            if is_driver_dead(e):
+                raise
+            logger.warning(f"接口截获失败: {e}")
+        if result:
+            logger.info("已从数据接口获取结果 (跳过 DOM 解析)")
+        else:
+            logger.info("接口截获未拿到完整数据，回退 DOM 解析")
+    
+    if not result:
+        result = parse_rendered_dom(driver, song_mid)
+
+    # 5. 截图图表 (可选，见 CAPTURE_CHART)
+    if CAPTURE_CHART:
+        with scrape_phase("screenshot"):
+            capture_chart(driver, result)
+
+    return result
+
+def drain_network_log(driver):
+    """丢弃浏览器里积压的 performance 日志 (上一首歌留下的事件)"""
+    try:
+        driver.get_log("performance")
+    except Exception as e:
+        if is_driver_dead(e):
+            raise
+
+def extract_from_network(driver, timeout=API_WAIT_TIMEOUT, song_mid=None):
+    """从 performance 日志里找出 H5 页面请求的 JSON 数据接口，解析成结果字典
+
+    拿齐 API_REQUIRED_FIELDS 且已匹配的请求全部返回后立即结束；
+    超时或数据不全返回 None (由调用方回退 DOM 解析)
+    """
+    deadline = time.time() + timeout
+    pending = set()
+    payloads = []
+    
+    while time.time() < deadline:
+        for entry in driver.get_log("performance"):
+            try:
+                message = json.loads(entry["message"])["message"]
+            except (KeyError, ValueError):
+                continue
+            method = message.get("method")
+            params = message.get("params", {})
             
-            # 3. 找到包含标题和图表的容器
-            # 结构: section.mod_box > div.box_cont > ... > canvas
-            # 我们尝试截取 div.box_cont 或者 section.mod_box
-            chart_container = canvas.find_element(By.XPATH, "./ancestor::section[contains(@class, 'mod_box')]")
+            if method == "Network.responseReceived":
+                response_url = params.get("response", {}).get("url", "")
+                if any(marker in response_url for marker in API_URL_MARKERS):
+                    pending.add(params.get("requestId"))
+            elif method == "Network.loadingFinished" and params.get("requestId") in pending:
+                request_id = params["requestId"]
+                pending.discard(request_id)
+                try:
+                    body = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+                except Exception as e:
+                    if is_driver_dead(e):
+                        raise
+                    continue
+                payload = parse_json_body(body.get("body", ""))
+                if payload is not None:
+                    payloads.append(payload)
+            elif method == "Network.loadingFailed":
+                pending.discard(params.get("requestId"))
+        
+        if payloads and not pending:
+            result = parse_music_index_api(payloads)
+            if all(result.get(field) for field in API_REQUIRED_FIELDS):
+                save_fixture(json.dumps(payloads, ensure_ascii=False, indent=2), song_mid, "api.json")
+                return result
+        time.sleep(0.1)
+    
+    # 数据不全也存下来，方便对照接口实际用的 key
+    if payloads:
+        save_fixture(json.dumps(payloads, ensure_ascii=False, indent=2), song_mid, "api.json")
+    return None
+
+def parse_json_body(text):
+    """解析接口返回体，兼容 callback(...) 形式的 JSONP"""
+    text = (text or "").strip()
+    if text and text[0] not in "{[":
+        start = text.find("(") + 1
+        end = text.rfind(")")
+        if start <= 0 or end <= start:
+            return None
+        text = text[start:end]
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+def _iter_dicts(node, in_list=False):
+    """广度优先遍历 JSON 中的所有 dict，附带它是否位于列表内部"""
+    nodes = deque([(node, in_list)])
+    while nodes:
+        current, inside = nodes.popleft()
+        if isinstance(current, dict):
+            yield current, inside
+            for value in current.values():
+                nodes.append((value, inside))
+        elif isinstance(current, list):
+            for value in current:
+                nodes.append((value, True))
+
+def _format_number(value):
+    """接口里的数字转成和页面一致的展示格式 (296407 -> "296,407")"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return f"{int(value):,}"
+    value = str(value).strip()
+    return value or None
+
+def _format_change(value):
+    """涨跌值转成页面格式 ("上升1.23%" / "下降1.23%")，字符串原样返回"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if value == 0:
+            return "持平"
+        return f"{'上升' if value > 0 else '下降'}{abs(value):g}%"
+    value = str(value).strip()
+    return value or None
+
+def parse_music_index_api(payloads):
+    """把截获的接口 JSON 组装成和 DOM 解析相同结构的结果字典"""
+    result = {}
+    lowered = {
+        field: [key.lower() for key in keys] for field, keys in API_FIELD_KEYS.items()
+    }
+    achievement_keys = [key.lower() for key in API_ACHIEVEMENT_KEYS]
+    achievements = []
+    
+    for payload in payloads:
+        for node, in_list in _iter_dicts(payload):
+            node_keys = {str(k).lower(): v for k, v in node.items()}
             
-            # 4. 截图
-            screenshot_b64 = chart_container.screenshot_as_base64
-            result['chart_image'] = f"data:image/png;base64,{screenshot_b64}"
+            # 标量字段只从非列表节点里取，避免误取榜单条目里的 rank
+            if not in_list:
+                for field, keys in lowered.items():
+                    if field in result:
+                        continue
+                    for key in keys:
+                        value = node_keys.get(key)
+                        if value is None or isinstance(value, (dict, list)):
+                            continue
+                        if field in ("index_change", "rank_change"):
+                            value = _format_change(value)
+                        elif field == "update_time":
+                            value = f"最近更新 {value}" if value else None
+                        elif field == "global_rank":
+                            value = str(value).strip() or None
+                        else:
+                            value = _format_number(value)
+                        if value:
+                            result[field] = value
+                            break
             
-        except Exception as e:
-            print(f"图表截图失败: {e}")
+            if achievements:
+                continue
+            for key in achievement_keys:
+                items = node_keys.get(key)
+                if not isinstance(items, list):
+                    continue
+                for item in items:
+                    text = _achievement_text(item)
+                    if text:
+                        achievements.append(text)
+                if achievements:
+                    break
+    
+    result['achievements'] = achievements[:10] # 取前10条
+    return result
 
-        return result
+def _achievement_text(item):
+    """单条成就组装成前端需要的 "YYYY/MM/DD 内容" 格式"""
+    if isinstance(item, str):
+        return item.strip()
+    if not isinstance(item, dict):
+        return ""
+    date_text = str(item.get("date") or item.get("time") or item.get("dateStr") or "").strip()
+    content_text = str(
+        item.get("content") or item.get("desc") or item.get("title") or item.get("text") or ""
+    ).strip()
+    if not content_text:
+        return ""
+    if date_text and not content_text.startswith(date_text):
+        return f"{date_text} {content_text}"
+    return content_text
 
+def parse_rendered_dom(driver, song_mid=None):
+    """等待 H5 页面渲染完成后解析整页 DOM (原始抓取方式)"""
+    # === 调试：打印页面源码的前 1000 个字符 ===
+    # 这样我们就能知道到底跳到了什么页面（是验证码？是404？还是App下载页？）
+    logger.info(f"页面源码预览: {driver.page_source[:1000]}")
+    
+    logger.info("等待关键元素渲染...")
+    with scrape_phase("base_data_wait"):
+        WebDriverWait(driver, 20).until(
+            EC.presence_of_element_located((By.CLASS_NAME, "base_data"))
+        )
+    logger.info("关键元素已出现")
+    
+    # 给一点额外的缓冲时间让数字跳动动画结束
+    with scrape_phase("settle"):
+        time.sleep(2)
+    
+    # 获取渲染后的 HTML，解析逻辑见 music_index_parser (不依赖浏览器，可离线测试)
+    with scrape_phase("parse"):
+        html = driver.page_source
+        save_fixture(html, song_mid)
+        return parse_music_index_html(html, PARSER_BACKEND)
+
+def save_fixture(text, song_mid=None, ext="html"):
+    """设置了 FIXTURE_DUMP_DIR 时把渲染后的页面 (或 api 模式截获的接口 JSON，ext="api.json") 存下来
+    (<mid>-<时间>-<pid>.<ext>)，用作解析器的离线样本
+
+    整理成页面样本见 benchmarks/capture_fixtures.py
+    """
+    if not FIXTURE_DUMP_DIR:
+        return
+    try:
+        os.makedirs(FIXTURE_DUMP_DIR, exist_ok=True)
+        path = os.path.join(
+            FIXTURE_DUMP_DIR, f"{song_mid or 'unknown'}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.{ext}"
+        )
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    except OSError as e:
+        logger.warning(f"保存页面样本失败: {e}")
+
+def capture_chart(driver, result):
+    """截取走势图所在区域，写入 result['chart_image']"""
+    # 找到图表区域 (通常包含 canvas)
+    try:
+        # 1. 显式等待 Canvas 出现
+        # canvas 是图表的核心，必须等它画出来
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.TAG_NAME, "canvas"))
+        )
+        canvas = driver.find_element(By.TAG_NAME, "canvas")
+        
+        # 2. 滚动到 Canvas 可见区域 (防止懒加载不渲染)
+        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", canvas)
+        time.sleep(1) # 等待滚动和渲染
+        
+        # 3. 找到包含标题和图表的容器
+        # 结构: section.mod_box > div.box_cont > ... > canvas
+        # 我们尝试截取 div.box_cont 或者 section.mod_box
+        chart_container = canvas.find_element(By.XPATH, "./ancestor::section[contains(@class, 'mod_box')]")
+        
+        # 4. 截图
+        screenshot_b64 = chart_container.screenshot_as_base64
+        result['chart_image'] = f"data:image/png;base64,{screenshot_b64}"
+        
     except Exception as e:
-        logger.error(f"Selenium 抓取失败: {e}")
-        logger.error(traceback.format_exc())
-        return {"error": str(e)}
-    finally:
-        if driver:
-            try:
-                driver.quit()
-                logger.info("浏览器已关闭")
-            except Exception as e:
-                logger.error(f"关闭浏览器失败: {e}")
+        logger.warning(f"图表截图失败: {e}")
 
 if __name__ == "__main__":
     # 测试: 匿名的好友
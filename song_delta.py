@@ -0,0 +1,61 @@
+import json
+import hashlib
+
+# Worker 推送给服务器的消息类型 (推送队列里的 payload，见 outbox.py)
+#   full:      {"type": "full", "mid", "data", "hash", "scraped_at"}          服务器没有或版本对不上时的整份数据
+#   delta:     {"type": "delta", "mid", "base_hash", "hash", "set", "unset", "scraped_at"}  只有部分字段变了
+#   heartbeat: {"type": "heartbeat", "mid", "hash", "volatile", "scraped_at"}  重新抓取但内容没变，只更新"最后确认"时间和易变字段
+# 没有 type 的旧格式按 full 处理。服务器上的 hash 对不上 (base_hash / hash 不同) 时会要求 Worker 重发 full
+PUSH_FULL = "full"
+PUSH_DELTA = "delta"
+PUSH_HEARTBEAT = "heartbeat"
+
+# 几乎每次抓取都会变、但不代表指数/排名/成就有变化的字段：不参与内容哈希，内容没变时随心跳带上最新值
+VOLATILE_FIELDS = ("listening_count", "update_time")
+
+def canonical_json(data):
+    """键排序、无多余空白的 JSON，同样的内容总是得到同样的字符串"""
+    return json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+def content_hash(data):
+    """内容哈希 (不含 VOLATILE_FIELDS)，用来判断这次抓取有没有实质变化"""
+    stable = {key: value for key, value in data.items() if key not in VOLATILE_FIELDS}
+    return hashlib.sha256(canonical_json(stable).encode("utf-8")).hexdigest()
+
+def volatile_part(data):
+    return {key: data[key] for key in VOLATILE_FIELDS if key in data}
+
+def merge_volatile(old, volatile):
+    """把心跳带来的易变字段合并进旧数据；没有任何变化时返回 None (不用写库)"""
+    volatile = {key: value for key, value in (volatile or {}).items() if key in VOLATILE_FIELDS}
+    if all(old.get(key) == value for key, value in volatile.items()):
+        return None
+    return dict(old, **volatile)
+
+def diff(old, new):
+    """字段级差异: (新增或变化的字段, 被删除的字段)"""
+    changed = {key: value for key, value in new.items() if key not in old or old[key] != value}
+    removed = [key for key in old if key not in new]
+    return changed, removed
+
+def apply_delta(old, changed, removed):
+    data = dict(old)
+    data.update(changed)
+    for key in removed:
+        data.pop(key, None)
+    return data
+
+def build_push(mid, data, new_hash, old_data=None, old_hash=None, scraped_at=None):
+    """根据上一次推送的内容决定发 full / delta / heartbeat"""
+    if old_data is None:
+        return {"type": PUSH_FULL, "mid": mid, "data": data, "hash": new_hash, "scraped_at": scraped_at}
+    if old_hash == new_hash:
+        return {
+            "type": PUSH_HEARTBEAT, "mid": mid, "hash": new_hash,
+            "volatile": volatile_part(data), "scraped_at": scraped_at,
+        }
+    changed, removed = diff(old_data, data)
+    return {
+        "type": PUSH_DELTA, "mid": mid, "base_hash": old_hash, "hash": new_hash,
+        "set": changed, "unset": removed, "scraped_at": scraped_at,
+    }
@@ -0,0 +1,76 @@
+import json
+import queue
+import threading
+
+# 单个订阅者最多积压多少条消息，超过后丢弃最旧的 (前端收到后会自己补拉)
+SUBSCRIBER_QUEUE_SIZE = 100
+
+class Subscription:
+    """一个浏览器连接的订阅: 关心的 mid 集合 + 待发送消息队列"""
+
+    def __init__(self, mids):
+        self.mids = set(mids)
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def put(self, message):
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+class SongEventBroker:
+    """歌曲数据更新的发布/订阅中心 (进程内)
+
+    update_song_stats 写库成功后 publish，SSE 连接按 mid 订阅。
+    没有订阅者的 mid 发布时只是一次字典查找，空闲连接只占一个阻塞在队列上的线程。
+    """
+
+    def __init__(self, max_subscribers=200):
+        self.max_subscribers = max_subscribers
+        self._by_mid = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, mids):
+        """订阅一组 mid，超过连接上限返回 None"""
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            sub = Subscription(mids)
+            for mid in sub.mids:
+                self._by_mid.setdefault(mid, set()).add(sub)
+            self._count += 1
+            return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for mid in sub.mids:
+                subs = self._by_mid.get(mid)
+                if subs is None:
+                    continue
+                subs.discard(sub)
+                if not subs:
+                    del self._by_mid[mid]
+            self._count -= 1
+
+    def publish(self, mid, payload):
+        """把某首歌的更新推给所有订阅了它的连接"""
+        with self._lock:
+            subs = list(self._by_mid.get(mid, ()))
+            self.published += 1
+        if not subs:
+            return 0
+        message = json.dumps(payload, ensure_ascii=False)
+        for sub in subs:
+            sub.put(message)
+        return len(subs)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": self._count, "mids": len(self._by_mid), "published": self.published}
@@ -0,0 +1,158 @@
+import re
+import time
+import datetime
+
+# 歌曲指标历史表：每次抓取追加一行，数值按类型存 (展示用的字符串仍在 song_stats 的 JSON 里)
+# 主键 (mid, ts) 同时就是按歌曲 + 时间范围查询的索引；同一次抓取重复写入会被忽略
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS song_metrics_history (
+    mid TEXT NOT NULL,
+    ts INTEGER NOT NULL,          -- 抓取时间 (unix 秒)
+    music_index INTEGER,          -- 实时音乐指数
+    global_rank INTEGER,          -- 全站排名
+    yesterday_index INTEGER,
+    yesterday_rank INTEGER,
+    index_change REAL,            -- 指数较前一天涨跌 (%)，下降为负
+    rank_change REAL,             -- 排名较前一天涨跌，下降为负
+    listening_count INTEGER,      -- 正在听人数
+    PRIMARY KEY (mid, ts)
+) WITHOUT ROWID
+"""
+
+INT_FIELDS = ("music_index", "global_rank", "yesterday_index", "yesterday_rank", "listening_count")
+CHANGE_FIELDS = ("index_change", "rank_change")
+METRIC_FIELDS = INT_FIELDS + CHANGE_FIELDS
+
+# 降采样粒度 (秒)；raw 表示不聚合
+BUCKETS = {"raw": None, "hour": 3600, "day": 86400}
+# 单次查询最多返回的点数
+HISTORY_MAX_POINTS = 2000
+# 默认查询最近多少天
+HISTORY_DEFAULT_DAYS = 7
+
+NUMBER_RE = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+def parse_int(value):
+    """"296,407" / "第12名" / 296407 -> 296407；解析不出返回 None"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = NUMBER_RE.search(str(value))
+    if not match:
+        return None
+    return int(float(match.group(0).replace(",", "")))
+
+def parse_change(value):
+    """"上升1.23%" -> 1.23，"下降1.23%" -> -1.23，"持平" -> 0.0；解析不出返回 None"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    if "持平" in text:
+        return 0.0
+    match = NUMBER_RE.search(text)
+    if not match:
+        return None
+    number = float(match.group(0).replace(",", ""))
+    if "下降" in text or "-" in text[:match.start()]:
+        return -number
+    return number
+
+def parse_metrics(data):
+    """从抓取结果 (展示格式的字典) 解析出带类型的指标"""
+    metrics = {field: parse_int(data.get(field)) for field in INT_FIELDS}
+    metrics.update({field: parse_change(data.get(field)) for field in CHANGE_FIELDS})
+    return metrics
+
+def local_ts(text):
+    """本地时间字符串 "YYYY-MM-DD HH:MM:SS" -> unix 秒"""
+    return int(datetime.datetime.strptime(text, "%Y-%m-%d %H:%M:%S").timestamp())
+
+def init_history_table(con):
+    con.execute(HISTORY_SCHEMA)
+
+def append_history(con, mid, data, ts=None):
+    """追加一条抓取记录，返回是否写入 (没有任何可解析指标或重复时不写)"""
+    metrics = parse_metrics(data)
+    if all(value is None for value in metrics.values()):
+        return False
+    ts = int(time.time()) if ts is None else int(ts)
+    cur = con.execute(
+        f"INSERT OR IGNORE INTO song_metrics_history (mid, ts, {', '.join(METRIC_FIELDS)}) "
+        f"VALUES (?, ?, {', '.join('?' * len(METRIC_FIELDS))})",
+        (mid, ts, *(metrics[field] for field in METRIC_FIELDS))
+    )
+    return cur.rowcount > 0
+
+def parse_time_arg(value, default):
+    """查询参数里的时间：unix 秒，或 ISO 格式的本地时间 ("2026-01-01" / "2026-01-01T12:00")"""
+    if value in (None, ""):
+        return default
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    return int(datetime.datetime.fromisoformat(value).timestamp())
+
+def query_history(con, mid, start, end, bucket="raw", limit=HISTORY_MAX_POINTS):
+    """按时间范围查询历史，bucket 为 hour/day 时在 SQL 里按本地时间分桶聚合
+
+    聚合后每个桶: 指数/在听人数取平均，排名取最好 (最小)，涨跌取桶内最后一次，另附指数最高/最低和样本数
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    size = BUCKETS[bucket]
+    if size is None:
+        rows = con.execute(
+            f"SELECT ts, {', '.join(METRIC_FIELDS)} FROM song_metrics_history "
+            "WHERE mid = ? AND ts >= ? AND ts <= ? ORDER BY ts LIMIT ?",
+            (mid, start, end, limit)
+        ).fetchall()
+        return [dict(zip(("ts",) + METRIC_FIELDS, row)) for row in rows]
+
+    # 按本地时区对齐 (日线从本地零点开始)
+    offset = int(datetime.datetime.now().astimezone().utcoffset().total_seconds())
+    rows = con.execute("""
+        SELECT ((ts + :offset) / :size) * :size - :offset AS bucket,
+               COUNT(*),
+               ROUND(AVG(music_index)), MIN(music_index), MAX(music_index),
+               MIN(global_rank),
+               ROUND(AVG(listening_count)), MAX(listening_count),
+               MAX(ts)
+        FROM song_metrics_history
+        WHERE mid = :mid AND ts >= :start AND ts <= :end
+        GROUP BY bucket ORDER BY bucket LIMIT :limit
+    """, {"offset": offset, "size": size, "mid": mid, "start": start, "end": end, "limit": limit}).fetchall()
+    if not rows:
+        return []
+
+    # 每个桶最后一次抓取的涨跌值 (走 (mid, ts) 主键，一次取完)
+    last_ts = [row[8] for row in rows]
+    changes = {
+        row[0]: (row[1], row[2])
+        for row in con.execute(
+            f"SELECT ts, index_change, rank_change FROM song_metrics_history "
+            f"WHERE mid = ? AND ts IN ({', '.join('?' * len(last_ts))})",
+            (mid, *last_ts)
+        )
+    }
+    points = []
+    for row in rows:
+        index_change, rank_change = changes.get(row[8], (None, None))
+        points.append({
+            "ts": row[0],
+            "samples": row[1],
+            "music_index": _int_or_none(row[2]),
+            "music_index_min": row[3],
+            "music_index_max": row[4],
+            "global_rank": row[5],
+            "listening_count": _int_or_none(row[6]),
+            "listening_count_max": row[7],
+            "index_change": index_change,
+            "rank_change": rank_change,
+        })
+    return points
+
+def _int_or_none(value):
+    return None if value is None else int(value)
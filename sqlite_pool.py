@@ -0,0 +1,87 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# 等锁的最长时间 (毫秒)：写入时读请求不会立刻报 database is locked
+BUSY_TIMEOUT_MS = 5000
+# 每个连接缓存的预编译语句数量 (连接复用后语句也一起复用)
+CACHED_STATEMENTS = 256
+# 池中保留的空闲连接数；超过时用完即关
+POOL_SIZE = 8
+
+class SQLitePool:
+    """SQLite 连接池
+
+    - 连接复用 (Flask 每个请求一个新线程，线程本地连接起不到作用，所以用池)
+    - WAL 模式：读写互不阻塞；synchronous=NORMAL：WAL 下仍然安全，写入少一次 fsync
+    - busy_timeout：写锁被占用时等待而不是直接失败
+
+    用法:
+        with pool.connection() as con:
+            con.execute(...)
+        # 正常退出自动 commit，异常自动 rollback
+    """
+
+    def __init__(self, path, size=POOL_SIZE, row_factory=sqlite3.Row):
+        self.path = str(path)
+        self.size = size
+        self.row_factory = row_factory
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def _open(self):
+        con = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS
+        )
+        con.row_factory = self.row_factory
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        con.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self.opened += 1
+        return con
+
+    @contextmanager
+    def connection(self):
+        try:
+            con = self._idle.get_nowait()
+        except queue.Empty:
+            con = self._open()
+        try:
+            yield con
+            if con.in_transaction:
+                con.commit()
+        except Exception:
+            if con.in_transaction:
+                con.rollback()
+            raise
+        finally:
+            try:
+                self._idle.put_nowait(con)
+            except queue.Full:
+                con.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        return {"path": self.path, "idle": self._idle.qsize(), "size": self.size, "opened": self.opened}
+
+def ensure_columns(con, table, columns):
+    """给旧表补上缺少的列 (columns: {列名: 类型定义})，返回补上的列名"""
+    existing = {row[1] for row in con.execute(f"PRAGMA table_info({table})")}
+    added = []
+    for name, definition in columns.items():
+        if name not in existing:
+            con.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            added.append(name)
+    return added
@@ -63,13 +63,84 @@ let pollingInterval = null;
 let retryMap = new Map();
 const MAX_RETRIES = 12; // 12次 * 5秒 = 60秒，超过则放弃
 
+// 实时推送 (SSE) 连接
+let songStream = null;
+let liveTimeout = null;
+const LIVE_WAIT_MS = MAX_RETRIES * 5000; // 与轮询放弃时间一致
+
+function isPendingText(text) {
+    return text.includes("等待队列中") || text.includes("数据获取失败") || text.includes("Data queuing") || text.includes("请求超时");
+}
+
+function startLiveUpdates(songs) {
+    if (songStream) songStream.close();
+    if (liveTimeout) clearTimeout(liveTimeout);
+    if (pollingInterval) clearInterval(pollingInterval);
+    
+    if (!window.EventSource) {
+        startPolling(songs);
+        return;
+    }
+    
+    const mids = songs.map(song => song.songmid || song.mid);
+    pollVersion = null;
+    songStream = new EventSource(`/api/song_stream?mids=${encodeURIComponent(mids.join(','))}`);
+    
+    // 连接建立后补拉一次，避免错过订阅之前刚到的数据
+    songStream.onopen = () => {
+        const pending = mids.filter(mid => {
+            const container = document.getElementById(`index-data-${mid}`);
+            return container && isPendingText(container.innerText);
+        });
+        if (pending.length > 0) fetchSongIndexBatch(pending);
+    };
+    
+    songStream.addEventListener('song', (e) => {
+        const item = JSON.parse(e.data);
+        const containers = {
+            dataContainer: document.getElementById(`index-data-${item.mid}`),
+            chartContainer: document.getElementById(`index-chart-${item.mid}`)
+        };
+        if (containers.dataContainer && item.data) {
+            renderSongIndex(item.mid, item.data, containers, item.updated_at);
+        }
+    });
+    
+    // 服务器拒绝 (连接数已满) 或彻底断开时退回轮询；普通断线浏览器会自动重连
+    songStream.onerror = () => {
+        if (songStream.readyState === EventSource.CLOSED) {
+            songStream = null;
+            startPolling(songs);
+        }
+    };
+    
+    // 超时后仍在等待的歌曲显示失败 (连接保持，之后到达的新数据照样会推送过来)
+    liveTimeout = setTimeout(() => {
+        mids.forEach(mid => {
+            const container = document.getElementById(`index-data-${mid}`);
+            if (container && isPendingText(container.innerText)) {
+                container.innerHTML = '<span style="opacity:0.3; font-size:0.8rem;">获取超时 (树莓派未响应)</span>';
+            }
+        });
+    }, LIVE_WAIT_MS);
+}
+
+// 增量版本号：批量接口只返回此后有变化的歌曲
+let pollVersion = null;
+// 列表页只用到这些字段 (见 renderSongIndex)，请求时带上 fields，服务器不用返回整份数据
+const LIST_FIELDS = [
+    'music_index', 'update_time', 'global_rank', 'yesterday_index', 'index_change',
+    'yesterday_rank', 'rank_change', 'chart_image', 'achievements'
+];
+
 function startPolling(songs) {
     if (pollingInterval) clearInterval(pollingInterval);
     retryMap.clear();
+    pollVersion = null;
     
-    // 每 5 秒轮询一次状态
-    pollingInterval = setInterval(() => {
-        let hasPending = false;
+    // 每 5 秒轮询一次状态 (每次只发一个批量请求，与歌曲数量无关)
+    pollingInterval = setInterval(async () => {
+        const pendingMids = [];
         
         songs.forEach(song => {
             const mid = song.songmid || song.mid;
@@ -79,20 +150,14 @@ function startPolling(songs) {
             // 我们通过检查是否包含 loading-spinner 或特定文本来判断
             if (container) {
                 const text = container.innerText;
-                const isPending = text.includes("等待队列中") || text.includes("数据获取失败") || text.includes("Data queuing") || text.includes("请求超时");
+                const isPending = isPendingText(text);
                 
                 if (isPending) {
                     // 检查重试次数
                     let retries = retryMap.get(mid) || 0;
                     if (retries < MAX_RETRIES) {
-                        hasPending = true;
                         retryMap.set(mid, retries + 1);
-                        
-                        // 重新触发单个获取
-                        fetchSongIndex(mid, {
-                            dataContainer: container,
-                            chartContainer: document.getElementById(`index-chart-${mid}`)
-                        });
+                        pendingMids.push(mid);
                     } else {
                         // 超过重试次数，显示永久失败
                         if (!text.includes("已停止重试")) {
@@ -104,14 +169,49 @@ function startPolling(songs) {
         });
         
         // 如果所有都加载完了，停止轮询
-        if (!hasPending) {
+        if (pendingMids.length === 0) {
             clearInterval(pollingInterval);
             console.log("All data loaded, polling stopped.");
+            return;
         }
         
+        await fetchSongIndexBatch(pendingMids);
+        
     }, 5000); // 5秒轮询一次
 }
 
+// 批量获取多首歌的指数，只渲染有变化的歌曲
+async function fetchSongIndexBatch(mids) {
+    const result = await requestSongIndexBatch(mids, pollVersion);
+    if (result) pollVersion = result.version;
+}
+
+// 请求批量接口并渲染返回的歌曲 (since 为 null 时返回全部)，返回接口结果，失败返回 null
+// 用 GET：浏览器会带 If-None-Match 重新验证，内容没变时服务器返回 304，直接用浏览器缓存里的结果
+async function requestSongIndexBatch(mids, since) {
+    const params = new URLSearchParams({ mids: mids.join(','), fields: LIST_FIELDS.join(',') });
+    if (since) params.set('since', since);
+    try {
+        const response = await fetch(`/api/song_index/batch?${params}`);
+        const result = await response.json();
+        if (result.code !== 0) return null;
+        
+        Object.entries(result.data || {}).forEach(([mid, item]) => {
+            const containers = {
+                dataContainer: document.getElementById(`index-data-${mid}`),
+                chartContainer: document.getElementById(`index-chart-${mid}`)
+            };
+            if (containers.dataContainer && item.data) {
+                renderSongIndex(mid, item.data, containers, item.updated_at);
+            }
+        });
+        return result;
+    } catch (e) {
+        console.error(e);
+        return null;
+    }
+}
+
 async function searchSinger(name) {
     const songListEl = document.getElementById('song-list');
     
@@ -205,8 +305,8 @@ if (singerData || songs.length > 0) {
     // 提取并渲染专辑列表
     processAndRenderAlbums(songs);
     
-    // 启动轮询，等待树莓派数据
-    startPolling(songs);
+    // 订阅实时推送，等待树莓派数据 (不支持时退回轮询)
+    startLiveUpdates(songs);
 
 } else {
             songListEl.innerHTML = '<div class="loading">未找到相关数据</div>';
@@ -510,72 +610,56 @@ function renderSongs(songs, statsMap) {
         songListEl.appendChild(div);
     });
 
-    // === 并发控制 ===
-    // 服务器性能较弱 (2核2G)，必须限制并发为 1，否则 5 个浏览器实例会撑爆内存
-    const CONCURRENT_LIMIT = 1; 
-    processQueue(songs, CONCURRENT_LIMIT);
+    // 首屏用批量接口一次取一批 (只要列表用到的字段)，不再逐首请求
+    loadSongIndexes(songs);
 }
 
-// 带并发限制的队列处理
-async function processQueue(songs, limit) {
-    const songListEl = document.getElementById('song-list');
-    
-    // 初始化进度
+// 首屏加载：每批最多 SONG_BATCH_SIZE 首 (与服务器 SONG_BATCH_LIMIT 一致)，按批更新进度条
+// 服务器上还没有数据的歌保持"等待队列中"，由实时推送或轮询补上
+const SONG_BATCH_SIZE = 100;
+const PENDING_HTML = `
+    <div style="display:flex; align-items:center; gap:8px;">
+        <div class="loading-spinner"></div>
+        <span style="opacity:0.5; font-size:0.85rem;">等待队列中...</span>
+    </div>
+`;
+
+async function loadSongIndexes(songs) {
     const progressText = document.getElementById('progress-text');
     const progressBar = document.getElementById('progress-bar');
     const progressPercent = document.getElementById('progress-percent');
     
+    const mids = songs.map(song => song.songmid || song.mid);
+    const totalCount = mids.length;
     let completedCount = 0;
-    const totalCount = songs.length;
-    let activeCount = 0;
-    let index = 0;
-
-    const next = () => {
-        if (index >= totalCount) return;
-        
-        const song = songs[index];
-        const currentIndex = index;
-        index++;
-        activeCount++;
-
-        const songmid = song.songmid || song.mid;
-        
-        // 更新 UI 状态
-        const statusEl = document.getElementById(`index-data-${songmid}`)?.querySelector('span');
+    
+    mids.forEach(mid => {
+        const statusEl = document.getElementById(`index-data-${mid}`)?.querySelector('span');
         if (statusEl) statusEl.textContent = '正在分析...';
-        
-        // 执行请求
-        fetchSongIndex(songmid, {
-            dataContainer: document.getElementById(`index-data-${songmid}`),
-            chartContainer: document.getElementById(`index-chart-${songmid}`)
-        }).finally(() => {
-            activeCount--;
-            completedCount++;
-            
-            // 更新进度条
-            const percent = Math.round((completedCount / totalCount) * 100);
-            if (progressBar) progressBar.style.width = `${percent}%`;
-            if (progressPercent) progressPercent.textContent = `${percent}%`;
-            if (progressText) progressText.textContent = `正在分析: ${completedCount}/${totalCount}`;
-            
-            // 继续处理下一个
-            if (index < totalCount) {
-                next();
-            } else if (activeCount === 0) {
-                // 全部完成
-                if (progressText) progressText.textContent = '所有歌曲分析完成';
-                setTimeout(() => {
-                    const container = document.getElementById('progress-container');
-                    if (container) container.style.display = 'none';
-                }, 3000);
-            }
+    });
+    
+    for (let i = 0; i < totalCount; i += SONG_BATCH_SIZE) {
+        const chunk = mids.slice(i, i + SONG_BATCH_SIZE);
+        const result = await requestSongIndexBatch(chunk, null);
+        chunk.forEach(mid => {
+            const container = document.getElementById(`index-data-${mid}`);
+            if (!container || (result && result.data && result.data[mid])) return;
+            // 没拿到数据：恢复成待处理状态，轮询会继续重试
+            container.innerHTML = result ? PENDING_HTML : '<span style="opacity:0.3">请求超时</span>';
         });
-    };
-
-    // 启动初始批次
-    for (let i = 0; i < Math.min(limit, totalCount); i++) {
-        next();
+        
+        completedCount += chunk.length;
+        const percent = Math.round((completedCount / totalCount) * 100);
+        if (progressBar) progressBar.style.width = `${percent}%`;
+        if (progressPercent) progressPercent.textContent = `${percent}%`;
+        if (progressText) progressText.textContent = `正在分析: ${completedCount}/${totalCount}`;
     }
+    
+    if (progressText) progressText.textContent = '所有歌曲分析完成';
+    setTimeout(() => {
+        const container = document.getElementById('progress-container');
+        if (container) container.style.display = 'none';
+    }, 3000);
 }
 
 // 简单的 Loading CSS
@@ -592,103 +676,83 @@ style.innerHTML = `
 `;
 document.head.appendChild(style);
 
-async function fetchSongIndex(mid, containers) {
-    if (!containers.dataContainer) return;
+// 把单首歌的指数数据渲染到对应的格子里
+function renderSongIndex(mid, d, containers, updatedAt) {
+    // 绑定数据到行元素 (song-item)
+    // 往上找父级 .song-item
+    const songItem = containers.dataContainer.closest('.song-item');
+    if (songItem) {
+        // 将成就数据转为 JSON 字符串存入 dataset
+        songItem.dataset.achievements = JSON.stringify(d.achievements || []);
+    }
     
-    try {
-        const response = await fetch(`/api/song_index?mid=${mid}`);
-        const result = await response.json();
-        
-        // 成功获取数据后，将数据绑定到 DOM 元素上，供弹窗使用
-        if (result.code === 0 && result.data) {
-            const d = result.data;
-            
-            // 绑定数据到行元素 (song-item)
-            // 往上找父级 .song-item
-            const songItem = containers.dataContainer.closest('.song-item');
-            if (songItem) {
-                // 将成就数据转为 JSON 字符串存入 dataset
-                songItem.dataset.achievements = JSON.stringify(d.achievements || []);
-            }
-            
-            // --- 渲染中间列：核心数据 ---
-            // 颜色判断辅助函数
-            const getChangeColor = (text) => {
-                if (!text) return '#fff';
-                if (text.includes('下降') || text.includes('-')) return '#20bf64'; // 绿色代表下降
-                if (text.includes('上升') || text.includes('+')) return '#ff5f5f'; // 红色代表上升
-                return '#aaa'; // 无变化
-            };
+    // --- 渲染中间列：核心数据 ---
+    // 颜色判断辅助函数
+    const getChangeColor = (text) => {
+        if (!text) return '#fff';
+        if (text.includes('下降') || text.includes('-')) return '#20bf64'; // 绿色代表下降
+        if (text.includes('上升') || text.includes('+')) return '#ff5f5f'; // 红色代表上升
+        return '#aaa'; // 无变化
+    };
 
-            containers.dataContainer.innerHTML = `
-                <div style="display:flex; justify-content:space-between; margin-bottom:10px;">
-                    <div>
-                        <div style="color:#20bf64; font-size:1.4rem; font-weight:bold; line-height:1;">${d.music_index || '-'}</div>
-                        <div style="font-size:0.75rem; opacity:0.6; margin-top:2px;">
-                            实时音乐指数 
-                            <span style="opacity:0.5; margin-left:5px; font-size:0.65rem;">${d.update_time || ''}</span>
-                        </div>
-                    </div>
-                    <div style="text-align:right;">
-                        <div style="color:#ffb6c1; font-size:1.4rem; font-weight:bold; line-height:1;">#${d.global_rank || '-'}</div>
-                        <div style="font-size:0.75rem; opacity:0.6; margin-top:2px;">全站排名</div>
-                    </div>
+    containers.dataContainer.innerHTML = `
+        <div style="display:flex; justify-content:space-between; margin-bottom:10px;">
+            <div>
+                <div style="color:#20bf64; font-size:1.4rem; font-weight:bold; line-height:1;">${d.music_index || '-'}</div>
+                <div style="font-size:0.75rem; opacity:0.6; margin-top:2px;">
+                    实时音乐指数 
+                    <span style="opacity:0.5; margin-left:5px; font-size:0.65rem;">${d.update_time || ''}</span>
                 </div>
-                
-                <div style="display:grid; grid-template-columns:1fr 1fr; gap:10px; background:rgba(255,255,255,0.03); padding:8px; border-radius:6px;">
-                    <div style="text-align:center;">
-                        <div style="font-size:0.9rem;">${d.yesterday_index || '-'}</div>
-                        <div style="font-size:0.7rem; color:${getChangeColor(d.index_change)}">
-                            ${d.index_change || '-'}
-                        </div>
-                        <div style="font-size:0.65rem; opacity:0.4;">昨日指数</div>
-                    </div>
-                    <div style="text-align:center; border-left:1px solid rgba(255,255,255,0.1);">
-                        <div style="font-size:0.9rem;">${d.yesterday_rank || '-'}</div>
-                        <div style="font-size:0.7rem; color:${getChangeColor(d.rank_change)}">
-                            ${d.rank_change || '-'}
-                        </div>
-                        <div style="font-size:0.65rem; opacity:0.4;">昨日排名</div>
-                    </div>
+            </div>
+            <div style="text-align:right;">
+                <div style="color:#ffb6c1; font-size:1.4rem; font-weight:bold; line-height:1;">#${d.global_rank || '-'}</div>
+                <div style="font-size:0.75rem; opacity:0.6; margin-top:2px;">全站排名</div>
+            </div>
+        </div>
+        
+        <div style="display:grid; grid-template-columns:1fr 1fr; gap:10px; background:rgba(255,255,255,0.03); padding:8px; border-radius:6px;">
+            <div style="text-align:center;">
+                <div style="font-size:0.9rem;">${d.yesterday_index || '-'}</div>
+                <div style="font-size:0.7rem; color:${getChangeColor(d.index_change)}">
+                    ${d.index_change || '-'}
                 </div>
-            `;
-            
-            // --- 渲染右侧列：走势图与成就 ---
-            let chartHtml = '';
-            if (d.chart_image) {
-                chartHtml = `
-                    <div style="flex:1; display:flex; justify-content:center; align-items:center; width:100%;">
-                        <img src="${d.chart_image}" 
-                             style="max-height:120px; width:auto; max-width:100%; border-radius:6px; opacity:0.95; box-shadow:0 4px 12px rgba(0,0,0,0.3); cursor: zoom-in;" 
-                             alt="走势图"
-                             onclick="showLightbox(this.src); event.stopPropagation();">
-                    </div>
-                `;
-            } else {
-                chartHtml = `<div style="flex:1; display:flex; align-items:center; justify-content:center; opacity:0.3; font-size:0.8rem;">暂无走势图</div>`;
-            }
-            
-            // 链接按钮
-            const linkBtn = `
-                <a href="https://y.qq.com/m/client/music_index/index.html?ADTAG=cbshare&channelId=10036163&mid=${mid}&type=${mid}" 
-                   target="_blank" 
-                   style="position:absolute; top:0; right:0; padding:4px 8px; background:rgba(255,255,255,0.1); border-radius:0 0 0 8px; color:#4facfe; font-size:0.7rem; text-decoration:none;">
-                   🔗 源站
-                </a>
-            `;
-            
-            // 容器设为相对定位以便放链接
-            containers.chartContainer.style.position = 'relative';
-            containers.chartContainer.innerHTML = chartHtml + linkBtn;
-            
-        } else {
-            containers.dataContainer.innerHTML = '<span style="opacity:0.3">数据获取失败</span>';
-            containers.chartContainer.innerHTML = '';
-        }
-    } catch (e) {
-        console.error(e);
-        containers.dataContainer.innerHTML = '<span style="opacity:0.3">请求超时</span>';
-    }
+                <div style="font-size:0.65rem; opacity:0.4;">昨日指数</div>
+            </div>
+            <div style="text-align:center; border-left:1px solid rgba(255,255,255,0.1);">
+                <div style="font-size:0.9rem;">${d.yesterday_rank || '-'}</div>
+                <div style="font-size:0.7rem; color:${getChangeColor(d.rank_change)}">
+                    ${d.rank_change || '-'}
+                </div>
+                <div style="font-size:0.65rem; opacity:0.4;">昨日排名</div>
+            </div>
+        </div>
+    `;
+    
+    // --- 渲染右侧列：走势图与成就 ---
+    // 有截图用截图，没有 (Worker 跳过了截图) 就用服务器按历史数据画的 SVG
+    // SVG 地址带上 updated_at，新数据到达时浏览器才会重新请求
+    const chartSrc = d.chart_image || `/api/charts/trend/${mid}.svg?range=30d&v=${encodeURIComponent(updatedAt || '')}`;
+    const chartHtml = `
+        <div style="flex:1; display:flex; justify-content:center; align-items:center; width:100%;">
+            <img src="${chartSrc}"
+                 style="max-height:120px; width:auto; max-width:100%; border-radius:6px; opacity:0.95; box-shadow:0 4px 12px rgba(0,0,0,0.3); cursor: zoom-in;"
+                 alt="走势图"
+                 onclick="showLightbox(this.src); event.stopPropagation();">
+        </div>
+    `;
+    
+    // 链接按钮
+    const linkBtn = `
+        <a href="https://y.qq.com/m/client/music_index/index.html?ADTAG=cbshare&channelId=10036163&mid=${mid}&type=${mid}" 
+           target="_blank" 
+           style="position:absolute; top:0; right:0; padding:4px 8px; background:rgba(255,255,255,0.1); border-radius:0 0 0 8px; color:#4facfe; font-size:0.7rem; text-decoration:none;">
+           🔗 源站
+        </a>
+    `;
+    
+    // 容器设为相对定位以便放链接
+    containers.chartContainer.style.position = 'relative';
+    containers.chartContainer.innerHTML = chartHtml + linkBtn;
 }
 
 async function fetchLyrics(mid, songName, singerName) {
@@ -0,0 +1,82 @@
+import time
+from xml.sax.saxutils import escape
+
+# 画布尺寸 (和前端走势图区域 max-height:120px 对齐)
+WIDTH = 360
+HEIGHT = 120
+PADDING = 8
+INDEX_COLOR = "#4facfe"
+RANK_COLOR = "#f6a04d"
+TEXT_COLOR = "rgba(255,255,255,0.6)"
+
+def _scale(values, lo_px, hi_px):
+    """把数值线性映射到 [lo_px, hi_px]；所有值相同时画在中间"""
+    lo, hi = min(values), max(values)
+    if hi == lo:
+        mid = (lo_px + hi_px) / 2
+        return [mid] * len(values)
+    return [lo_px + (v - lo) * (hi_px - lo_px) / (hi - lo) for v in values]
+
+def _polyline(xs, ys, color, dash=None):
+    points = " ".join(f"{x:.1f},{y:.1f}" for x, y in zip(xs, ys))
+    extra = f' stroke-dasharray="{dash}"' if dash else ""
+    return f'<polyline fill="none" stroke="{color}" stroke-width="1.6" stroke-linejoin="round"{extra} points="{points}"/>'
+
+def _series(points, field, t0, t1, left, right, top, bottom, invert=False):
+    """取出某个字段的非空点，返回 (xs, ys, values)"""
+    pairs = [(p["ts"], p[field]) for p in points if p.get(field) is not None]
+    if not pairs:
+        return [], [], []
+    span = max(t1 - t0, 1)
+    xs = [left + (ts - t0) * (right - left) / span for ts, _ in pairs]
+    values = [v for _, v in pairs]
+    # SVG 的 y 轴向下：指数越大越靠上；排名越小 (越好) 越靠上
+    ys = _scale(values, top, bottom) if invert else _scale(values, bottom, top)
+    return xs, ys, values
+
+def render_trend_svg(points, title="", width=WIDTH, height=HEIGHT):
+    """根据指标历史 (song_metrics.query_history 的结果) 画指数 + 排名双线走势图，返回 SVG 字符串"""
+    head = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="sans-serif" font-size="10">'
+    )
+    if title:
+        head += f"<title>{escape(title)}</title>"
+    if not points:
+        return (
+            f'{head}<text x="{width / 2}" y="{height / 2}" fill="{TEXT_COLOR}" text-anchor="middle">暂无走势数据</text></svg>'
+        )
+
+    t0, t1 = points[0]["ts"], points[-1]["ts"]
+    left, right = PADDING, width - PADDING
+    top, bottom = PADDING + 12, height - PADDING - 12
+    parts = [head]
+
+    xs, ys, values = _series(points, "music_index", t0, t1, left, right, top, bottom)
+    if xs:
+        if len(xs) == 1:
+            parts.append(f'<circle cx="{xs[0]:.1f}" cy="{ys[0]:.1f}" r="2.5" fill="{INDEX_COLOR}"/>')
+        else:
+            parts.append(_polyline(xs, ys, INDEX_COLOR))
+        parts.append(
+            f'<text x="{left}" y="{PADDING + 6}" fill="{INDEX_COLOR}">指数 {values[-1]:,} '
+            f'(低 {min(values):,} / 高 {max(values):,})</text>'
+        )
+
+    xs, ys, values = _series(points, "global_rank", t0, t1, left, right, top, bottom, invert=True)
+    if xs:
+        if len(xs) == 1:
+            parts.append(f'<circle cx="{xs[0]:.1f}" cy="{ys[0]:.1f}" r="2.5" fill="{RANK_COLOR}"/>')
+        else:
+            parts.append(_polyline(xs, ys, RANK_COLOR, dash="3 2"))
+        parts.append(
+            f'<text x="{right}" y="{PADDING + 6}" fill="{RANK_COLOR}" text-anchor="end">排名 {values[-1]} '
+            f'(最佳 {min(values)})</text>'
+        )
+
+    start_text = time.strftime("%m/%d", time.localtime(t0))
+    end_text = time.strftime("%m/%d %H:%M", time.localtime(t1))
+    parts.append(f'<text x="{left}" y="{height - 3}" fill="{TEXT_COLOR}">{start_text}</text>')
+    parts.append(f'<text x="{right}" y="{height - 3}" fill="{TEXT_COLOR}" text-anchor="end">{end_text}</text>')
+    parts.append("</svg>")
+    return "".join(parts)
@@ -0,0 +1,60 @@
+"""api 模式的接口 JSON 解析 (parse_music_index_api)
+
+样本是手写的 musicu.fcg 网关响应 (结构同 benchmarks/fake_qqmusic.py)，还没有对照真实抓到的接口数据核实过；
+真实样本可以在 api 模式下设置 scrape_selenium.FIXTURE_DUMP_DIR 收集
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scrape_selenium import parse_music_index_api
+
+def gateway(data, **others):
+    """musicu.fcg 的统一网关响应：每个子请求一个 req_N"""
+    return dict({"code": 0, "req_0": {"code": 0, "data": data}}, **others)
+
+SONG = {
+    "musicIndex": 296407,
+    "globalRank": 12,
+    "yesterdayIndex": 281000,
+    "yesterdayRank": 15,
+    "indexChange": 5.48,
+    "rankChange": 3,
+    "listenNum": 1234,
+    "updateTime": "2026-10-18 12:00",
+    "historyList": [{"date": "2026/10/01", "content": "热歌榜 当前排名3"}],
+}
+
+def test_parse_gateway_payload():
+    result = parse_music_index_api([gateway(SONG)])
+    assert result == {
+        "music_index": "296,407",
+        "global_rank": "12",
+        "yesterday_index": "281,000",
+        "yesterday_rank": "15",
+        "index_change": "上升5.48%",
+        "rank_change": "上升3%",
+        "listening_count": "1,234",
+        "update_time": "最近更新 2026-10-18 12:00",
+        "achievements": ["2026/10/01 热歌榜 当前排名3"],
+    }
+
+def test_generic_keys_in_unrelated_dicts_are_ignored():
+    # 分页、推荐位这类字典里常见 index / rank / history，不能当成音乐指数和排名
+    unrelated = gateway({"index": 3, "rank": 1, "history": ["x"], "records": [{"content": "y"}]})
+    result = parse_music_index_api([unrelated])
+    assert "music_index" not in result
+    assert "global_rank" not in result
+    assert result["achievements"] == []
+
+def test_fields_found_after_unrelated_payload():
+    result = parse_music_index_api([gateway({"page": {"index": 3, "rank": 1}}), gateway(SONG)])
+    assert result["music_index"] == "296,407"
+    assert result["global_rank"] == "12"
+
+def test_list_entries_do_not_provide_scalar_fields():
+    # 榜单条目里的 globalRank 属于别的歌
+    payload = gateway({"songList": [{"musicIndex": 1, "globalRank": 99}]})
+    result = parse_music_index_api([payload])
+    assert "music_index" not in result
+    assert "global_rank" not in result
@@ -0,0 +1,35 @@
+"""逐个样本检查音乐指数解析结果 (benchmarks/fixtures/music_index/，每个后端都要和 .json 一致)"""
+import os
+import sys
+import json
+import glob
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from music_index_parser import parse_music_index_html, BACKENDS
+
+FIXTURE_DIR = os.path.join(REPO_DIR, "benchmarks", "fixtures", "music_index")
+FIXTURES = sorted(os.path.splitext(os.path.basename(p))[0]
+                  for p in glob.glob(os.path.join(FIXTURE_DIR, "*.html")))
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, f"{name}.html"), encoding="utf-8") as f:
+        html = f.read()
+    with open(os.path.join(FIXTURE_DIR, f"{name}.json"), encoding="utf-8") as f:
+        expected = json.load(f)
+    return html, expected
+
+def test_every_fixture_has_expected_result():
+    assert FIXTURES
+    missing = [name for name in FIXTURES if not os.path.exists(os.path.join(FIXTURE_DIR, f"{name}.json"))]
+    assert not missing
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("name", FIXTURES)
+def test_parse_fixture(name, backend):
+    if backend == "lxml":
+        pytest.importorskip("lxml")
+    html, expected = load_fixture(name)
+    assert parse_music_index_html(html, backend) == expected
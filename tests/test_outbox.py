@@ -0,0 +1,56 @@
+"""推送队列: 坏消息逐条重试、到上限后移入死信表，网络错误不计次数"""
+import os
+import sys
+import sqlite3
+import contextlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import outbox
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_BACKOFF_BASE", 0)
+    con = sqlite3.connect(":memory:", isolation_level=None)
+    outbox.init_outbox_table(con)
+    yield con
+    con.close()
+
+def make_outbox(con, send_fn):
+    @contextlib.contextmanager
+    def connection():
+        yield con
+    return outbox.Outbox(connection, send_fn, batch_size=50, linger=0)
+
+def drain(box, limit=50):
+    for _ in range(limit):
+        if not box.flush_once():
+            return
+
+def test_rejected_message_moves_to_dead_letter(db):
+    for i in range(5):
+        outbox.enqueue(db, f"m{i}", {"mid": f"m{i}", "bad": i == 1})
+    sent = []
+
+    def send(payloads):
+        if any(p["bad"] for p in payloads):
+            raise RuntimeError("HTTP 500")
+        sent.extend(p["mid"] for p in payloads)
+
+    drain(make_outbox(db, send))
+    assert sent == ["m0", "m2", "m3", "m4"]
+    assert db.execute("SELECT COUNT(*) FROM push_outbox").fetchone()[0] == 0
+    assert db.execute("SELECT mid, attempts FROM push_outbox_dead").fetchall() == [("m1", outbox.OUTBOX_MAX_ATTEMPTS)]
+
+def test_network_errors_do_not_count_attempts(db):
+    outbox.enqueue(db, "m0", {"mid": "m0"})
+
+    def send(payloads):
+        raise ConnectionError("connection refused")
+
+    box = make_outbox(db, send)
+    for _ in range(outbox.OUTBOX_MAX_ATTEMPTS * 2):
+        box.flush_once()
+    assert db.execute("SELECT attempts FROM push_outbox").fetchall() == [(0,)]
+    assert box.depth()["dead"] == 0
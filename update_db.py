@@ -1,6 +1,7 @@
 import sqlite3
 import json
 from pathlib import Path
+from data_versions import bump_version
 
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "db" / "room64.db"
@@ -49,6 +50,8 @@ def update_tours():
         "INSERT INTO tours (tour_name, city, tour_date, venue, status) VALUES (?, ?, ?, ?, ?)",
         new_tours
     )
+    # 版本号加一，主服务器据此更新 ETag (最多 TOURS_VERSION_CHECK 秒后生效)
+    bump_version(conn, "tours")
     
     conn.commit()
     print("Database updated successfully.")